@@ -51,6 +51,7 @@ get_bootloader = lambda: None
 
 import sys
 import importlib
+import threading
 
 from . import util, arch
 from .flags import flags
@@ -62,25 +63,92 @@ program_log = logging.getLogger("program")
 # XXX: respect the level? Need to translate between C and Python log levels.
 log_bd_message = lambda level, msg: program_log.info(msg)
 
-# initialize the libblockdev library
+# The libblockdev library is initialized lazily. Loading a plugin makes it
+# check for the utilities it needs, which takes a while, so each plugin is
+# only loaded when one of its functions is first looked up (see
+# _LazyBlockDevPlugin) or when its availability is checked.
 from gi.repository import GLib
 from gi.repository import BlockDev as blockdev
-if arch.isS390():
-    _REQUIRED_PLUGIN_NAMES = set(("lvm", "btrfs", "swap", "crypto", "loop", "mdraid", "mpath", "dm", "s390"))
-else:
-    _REQUESTED_PLUGIN_NAMES = set(("lvm", "btrfs", "swap", "crypto", "loop", "mdraid", "mpath", "dm"))
-
-_requested_plugins = blockdev.plugin_specs_from_names(_REQUESTED_PLUGIN_NAMES)
-try:
-    succ_, avail_plugs = blockdev.try_reinit(require_plugins=_requested_plugins, reload=False, log_func=log_bd_message)
-except GLib.GError as err:
-    raise RuntimeError("Failed to intialize the libblockdev library: %s" % err)
-else:
-    avail_plugs = set(avail_plugs)
-
-missing_plugs =  _REQUESTED_PLUGIN_NAMES - avail_plugs
-for p in missing_plugs:
-    log.info("Failed to load plugin %s", p)
+
+# plugin name -> name of the plugin's functions in the blockdev module
+_PLUGIN_NAMESPACES = {"lvm": "lvm", "btrfs": "btrfs", "swap": "swap",
+                      "crypto": "crypto", "loop": "loop", "mdraid": "md",
+                      "mpath": "mpath", "dm": "dm", "s390": "s390"}
+
+_plugins_lock = threading.Lock()
+_tried_plugins = set()
+avail_plugs = set()
+
+def _requested_plugin_names():
+    names = set(("lvm", "btrfs", "swap", "crypto", "loop", "mdraid", "mpath", "dm"))
+    if arch.isS390():
+        names.add("s390")
+
+    return names
+
+def load_blockdev_plugins(names=None):
+    """ Load libblockdev plugins that have not been tried yet.
+
+        :keyword names: names of the plugins to load, or None for all of the
+                        plugins blivet uses
+        :type names: iterable of str
+        :returns: the names of the plugins that are loaded
+        :rtype: set of str
+    """
+    with _plugins_lock:
+        if names is None:
+            names = _requested_plugin_names()
+
+        names = set(names) - _tried_plugins
+        if names:
+            _tried_plugins.update(names)
+            specs = blockdev.plugin_specs_from_names(names)
+            try:
+                succ_, plugins = blockdev.try_reinit(require_plugins=specs,
+                                                     reload=False,
+                                                     log_func=log_bd_message)
+            except GLib.GError as err:
+                raise RuntimeError("Failed to intialize the libblockdev library: %s" % err)
+
+            avail_plugs.update(plugins)
+            for p in names - avail_plugs:
+                log.info("Failed to load plugin %s", p)
+
+        return set(avail_plugs)
+
+class _LazyBlockDevPlugin(object):
+    """
+    A stand-in for the functions of a libblockdev plugin, eg: blockdev.lvm,
+    that loads the plugin when any of them is looked up and then puts the
+    real functions back in place.
+
+    """
+
+    def __init__(self, plugin, namespace, real):
+        """
+        :param str plugin: the name of the plugin
+        :param str namespace: the name of the plugin's functions in blockdev
+        :param real: the plugin's functions
+
+        """
+
+        self._plugin = plugin
+        self._namespace = namespace
+        self._real = real
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+
+        load_blockdev_plugins([self._plugin])
+        setattr(blockdev, self._namespace, self._real)
+        return getattr(self._real, attr)
+
+for (_plugin, _namespace) in _PLUGIN_NAMESPACES.items():
+    _real = getattr(blockdev, _namespace, None)
+    if _real is not None and not isinstance(_real, _LazyBlockDevPlugin):
+        setattr(blockdev, _namespace,
+                _LazyBlockDevPlugin(_plugin, _namespace, _real))
 
 def enable_installer_mode():
     """ Configure the module for use by anaconda (OS installer). """
@@ -21,23 +21,92 @@
 #
 
 import copy
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
 
+import six
+from six.moves import queue
+
+from .callbacks import ExecutionTraceData
 from .deviceaction import ActionCreateDevice, ActionDestroyDevice
 from .deviceaction import action_type_from_string, action_object_from_string
 from .devicelibs import lvm
-from .devices import PartitionDevice
+from .devices import DMDevice, PartitionDevice
 from .errors import DiskLabelCommitError, StorageError
 from .flags import flags
+from .i18n import _
+from . import tracing
 from . import tsort
 
 import logging
 log = logging.getLogger("blivet")
 
+def _serializeCallbacks(callbacks):
+    """ Return callbacks wrapped so that only one of them runs at a time.
+
+        :param callbacks: callbacks to be invoked when actions are executed
+        :type callbacks: :class:`~.callbacks.DoItCallbacks` or NoneType
+    """
+    if callbacks is None:
+        return None
+
+    lock = threading.Lock()
+    def serialize(callback):
+        def wrapper(*args, **kwargs):
+            with lock:
+                return callback(*args, **kwargs)
+
+        return wrapper
+
+    # pylint: disable=protected-access
+    return callbacks._replace(**dict((field, serialize(callback))
+                                     for (field, callback)
+                                     in zip(callbacks._fields, callbacks)
+                                     if callback is not None))
+
+def _dependencies(device, extended):
+    """ Return a superset of the devices the given device depends on.
+
+        :param device: the device
+        :type device: :class:`~.devices.StorageDevice`
+        :param extended: extended partitions keyed by id of their disk
+        :type extended: dict
+        :returns: devices that device may depend on (see Device.dependsOn)
+        :rtype: list of :class:`~.devices.StorageDevice`
+    """
+    deps = {}
+    stack = [device]
+    while stack:
+        dev = stack.pop()
+        if isinstance(dev, PartitionDevice):
+            deps.update(extended.get(id(dev.disk), {}))
+
+        for attr in ("origin", "source"):
+            other = getattr(dev, attr, None)
+            if other is not None:
+                deps[other.id] = other
+
+        for parent in getattr(dev, "parents", []):
+            if parent.id not in deps:
+                deps[parent.id] = parent
+                stack.append(parent)
+
+    deps.pop(device.id, None)
+    return list(deps.values())
+
 class ActionList(object):
     def __init__(self):
         self._actions = []
         self._completed_actions = []
 
+        # ordering requirements found by sort, as (parent, child) actions
+        self._edges = []
+
+        # maximum number of threads used to execute actions, see process;
+        # None means flags.action_threads
+        self.processThreads = None
+
     def __iter__(self):
         return iter(self._actions)
 
@@ -99,56 +168,174 @@ class ActionList(object):
 
     def prune(self):
         """ Remove redundant/obsolete actions from the action list. """
-        for action in reversed(self._actions[:]):
-            if action not in self._actions:
+        # Only actions on the same device and add member actions for a device
+        # being destroyed can obsolete one another (see the obsoletes methods
+        # in deviceaction), so only compare those.
+        by_device = {}
+        by_container = {}
+        for (idx, action) in enumerate(self._actions):
+            by_device.setdefault(action.device.id, []).append(idx)
+            if action.isAdd:
+                by_container.setdefault(action.container.id, []).append(idx)
+
+        pruned = set()
+        for (idx, action) in reversed(list(enumerate(self._actions))):
+            if idx in pruned:
                 log.debug("action %d already pruned", action.id)
                 continue
 
-            for obsolete in self._actions[:]:
-                if action.obsoletes(obsolete):
-                    log.info("removing obsolete action %d (%d)",
-                             obsolete.id, action.id)
-                    self._actions.remove(obsolete)
+            candidates = set(by_device.get(action.device.id, []))
+            candidates.update(by_container.get(action.device.id, []))
+            for obsolete_idx in sorted(candidates - pruned):
+                obsolete = self._actions[obsolete_idx]
+                if obsolete_idx in pruned or not action.obsoletes(obsolete):
+                    continue
+
+                log.info("removing obsolete action %d (%d)",
+                         obsolete.id, action.id)
+                pruned.add(obsolete_idx)
+
+                if obsolete.obsoletes(action) and idx not in pruned:
+                    log.info("removing mutually-obsolete action %d (%d)",
+                             action.id, obsolete.id)
+                    pruned.add(idx)
+
+            # drop pruned actions from the index so it only shrinks
+            for bucket in (by_device.get(action.device.id),
+                           by_container.get(action.device.id)):
+                if bucket:
+                    bucket[:] = [i for i in bucket if i not in pruned]
+
+        self._actions = [a for (i, a) in enumerate(self._actions)
+                         if i not in pruned]
+
+    def _candidatePairs(self):
+        """ Return the index pairs of actions that may be ordered by requires.
+
+            Each action can only be required by or require a few others: the
+            ones on the same device, on devices it depends on or that depend
+            on it, and the ones adding or removing members of its container.
+            Ordering by action type alone is handled via ranks in sort and
+            ordering of partition create and destroy actions on the same disk
+            is handled via _partitionEdges, so neither of those needs to be
+            checked here.
+        """
+        by_device = {}
+        by_container = {}
+        members = []
+        extended = {}
+        for (idx, action) in enumerate(self._actions):
+            by_device.setdefault(action.device.id, []).append(idx)
+
+            containers = set()
+            for container in (action.container,
+                              getattr(action.device, "container", None)):
+                if container is not None and id(container) not in containers:
+                    containers.add(id(container))
+                    by_container.setdefault(id(container), []).append(idx)
+
+            if action.isAdd or action.isRemove:
+                members.append(idx)
+
+            if isinstance(action.device, PartitionDevice) and \
+               action.device.isExtended:
+                extended.setdefault(id(action.device.disk), {})[action.device.id] = action.device
+
+        pairs = set()
+        def add(i, j):
+            if i != j:
+                pairs.add((min(i, j), max(i, j)))
+
+        for indices in by_device.values():
+            for i in indices:
+                for j in indices:
+                    add(i, j)
+
+        for idx in members:
+            for j in by_container.get(id(self._actions[idx].container), []):
+                add(idx, j)
+
+        ancestors = {}
+        for (idx, action) in enumerate(self._actions):
+            device = action.device
+            if device.id not in ancestors:
+                ancestors[device.id] = _dependencies(device, extended)
+
+            for dep in ancestors[device.id]:
+                for j in by_device.get(dep.id, []):
+                    add(idx, j)
+
+        return pairs
+
+    def _partitionEdges(self):
+        """ Return edges ordering partition create/destroy actions per disk.
+
+            Partitions are created in ascending and destroyed in descending
+            numerical order. A chain of edges has the same effect as an edge
+            between every pair of actions on the disk.
+        """
+        chains = {}
+        for (idx, action) in enumerate(self._actions):
+            if action.isDevice and (action.isCreate or action.isDestroy) and \
+               isinstance(action.device, PartitionDevice):
+                key = (action.isCreate, id(action.device.disk))
+                chains.setdefault(key, []).append(idx)
+
+        edges = []
+        for ((create, _disk), indices) in chains.items():
+            if len(indices) < 2:
+                continue
+
+            groups = {}
+            for idx in indices:
+                number = self._actions[idx].device.partedPartition.number
+                groups.setdefault(number, []).append(idx)
 
-                    if obsolete.obsoletes(action) and action in self._actions:
-                        log.info("removing mutually-obsolete action %d (%d)",
-                                 action.id, obsolete.id)
-                        self._actions.remove(action)
+            numbers = sorted(groups.keys(), reverse=not create)
+            for (first, second) in zip(numbers, numbers[1:]):
+                edges.extend((parent, child) for parent in groups[first]
+                                             for child in groups[second])
+
+        return edges
 
     def sort(self):
         """ Sort actions based on dependencies. """
         if not self._actions:
             return
 
-        edges = []
+        # actions of a higher type come before actions of a lower type unless
+        # one of them is a container action (see DeviceAction.requires)
+        ranks = {}
+        for (idx, action) in enumerate(self._actions):
+            if not action.isContainer:
+                ranks[idx] = action.type
+
+        def implied(child, parent):
+            return (ranks.get(child) is not None and
+                    ranks.get(parent) is not None and
+                    ranks[child] < ranks[parent])
 
         # collect all ordering requirements for the actions
-        for action in self._actions:
-            action_idx = self._actions.index(action)
-            children = []
-            for _action in self._actions:
-                if _action == action:
+        edges = set(self._partitionEdges())
+        for (i, j) in self._candidatePairs():
+            for (child, parent) in ((i, j), (j, i)):
+                if implied(child, parent):
                     continue
 
-                # create edges based on both action type and dependencies.
-                if _action.requires(action):
-                    children.append(_action)
-
-            for child in children:
-                child_idx = self._actions.index(child)
-                edges.append((action_idx, child_idx))
+                if self._actions[child].requires(self._actions[parent]):
+                    edges.add((parent, child))
 
         # create a graph reflecting the ordering information we have
-        graph = tsort.create_graph(list(range(len(self._actions))), edges)
+        graph = tsort.create_graph(list(range(len(self._actions))),
+                                   sorted(edges), ranks)
 
         # perform a topological sort based on the graph's contents
         order = tsort.tsort(graph)
 
         # now replace self._actions with a sorted version of the same list
-        actions = []
-        for idx in order:
-            actions.append(self._actions[idx])
-        self._actions = actions
+        self._edges = [(self._actions[parent], self._actions[child])
+                       for (parent, child) in edges]
+        self._actions = [self._actions[idx] for idx in order]
 
     def _preProcess(self, devices=None):
         """ Prepare the action queue for execution. """
@@ -217,12 +404,14 @@ class ActionList(object):
 
         log.info("sorting actions...")
         self.sort()
-        for action in self._actions:
-            log.debug("action: %s", action)
+        with lvm.lvm_cc_batch():
+            for action in self._actions:
+                log.debug("action: %s", action)
 
-            # Remove lvm filters for devices we are operating on
-            for device in (d for d in devices if d.dependsOn(action.device)):
-                lvm.lvm_cc_removeFilterRejectRegexp(device.name)
+                # Remove lvm filters for devices we are operating on
+                for device in (d for d in devices
+                               if d.dependsOn(action.device)):
+                    lvm.lvm_cc_removeFilterRejectRegexp(device.name)
 
     def _postProcess(self, devices=None):
         """ Clean up relics from action queue execution. """
@@ -265,6 +454,328 @@ class ActionList(object):
         devices = [a.name for a in active if any(d in disks for d in a.disks)]
         return devices
 
+    @staticmethod
+    def _batchDisk(action):
+        """ Return the disk whose partition table commits action can share.
+
+            :param action: an action that is about to be executed
+            :type action: :class:`~.deviceaction.DeviceAction`
+            :returns: the disk, or None if action needs its own commit
+            :rtype: :class:`~.devices.StorageDevice` or NoneType
+
+            Creating and removing partitions only changes the partition table
+            until it is committed, so consecutive actions of that kind on one
+            disk can be written out together. Partitions on device-mapper
+            disks need the table committed before their maps can be managed.
+        """
+        if not flags.batch_partition_commits:
+            return None
+
+        if not (action.isDevice and (action.isCreate or action.isDestroy) and
+                isinstance(action.device, PartitionDevice)):
+            return None
+
+        disk = action.device.disk
+        if isinstance(disk, DMDevice):
+            return None
+
+        return disk
+
+    @staticmethod
+    def _disklabels(disk):
+        """ Return the original and current disklabels of disk. """
+        labels = []
+        for fmt in (disk.originalFormat, disk.format):
+            if fmt.type == "disklabel" and \
+               not any(fmt is label for label in labels):
+                labels.append(fmt)
+
+        return labels
+
+    def _flushCommits(self, disk):
+        """ Commit the partition table changes held back for disk. """
+        labels = self._disklabels(disk)
+        pending = [fmt for fmt in labels if fmt.commitPending]
+        if not pending:
+            for fmt in labels:
+                fmt.flushCommits()
+            return
+
+        # when both copies of the partition table have been changed the
+        # current one has all of the changes, so only it is written out
+        pending[-1].flushCommits()
+        for fmt in labels:
+            fmt.flushCommits(write=False)
+
+    @staticmethod
+    def _revertPartitionChange(action):
+        """ Undo the partition table change made by a failed action.
+
+            :param action: a partition create or destroy action that failed
+            :type action: :class:`~.deviceaction.DeviceAction`
+
+            While commits are held back the changes made by a failed action
+            would otherwise be written out with those of the actions that
+            completed.
+        """
+        device = action.device
+        geometry = device.partedPartition.geometry
+        if action.isCreate:
+            fmt = device.disk.format
+            part = fmt.partedDisk.getPartitionBySector(geometry.start)
+            if part is not None and part.geometry.start == geometry.start and \
+               part.type == device.partedPartition.type:
+                log.info("removing partition at sector %d from %s after failed "
+                         "action", geometry.start, device.disk.name)
+                fmt.removePartition(part)
+        else:
+            fmt = device.disk.originalFormat
+            if fmt.partedDisk.getPartitionByPath(device.path) is None:
+                log.info("restoring partition %s after failed action",
+                         device.name)
+                fmt.addPartition(geometry.start, geometry.end,
+                                 device.partedPartition.type)
+                device.partedPartition = fmt.partedDisk.getPartitionByPath(device.path)
+
+    def _teardownDiskUsers(self, disk, devices):
+        """ Deactivate existing devices that keep disk from being committed. """
+        # it's likely that a previous action
+        # triggered setup of an lvm or md device.
+        # include deps no longer in the tree due to pending removal
+        devs = devices + [a.device for a in self._actions]
+        for dep in set(devs):
+            if dep.exists and dep.dependsOn(disk):
+                dep.teardown(recursive=True)
+
+    def _jobs(self):
+        """ Return the sorted actions grouped into units of execution.
+
+            :returns: lists of actions, in order
+            :rtype: list of list of :class:`~.deviceaction.DeviceAction`
+
+            A run of partition actions sharing a partition table commit (see
+            :meth:`_batchDisk`) forms one job; other actions are on their own.
+        """
+        jobs = []
+        batch_disk = None
+        for action in self._actions:
+            disk = self._batchDisk(action)
+            if disk is not None and disk is batch_disk:
+                jobs[-1].append(action)
+            else:
+                jobs.append([action])
+
+            batch_disk = disk
+
+        return jobs
+
+    def _runJob(self, job, callbacks, devices, done):
+        """ Execute the actions of a job.
+
+            :param job: the actions to execute
+            :type job: list of :class:`~.deviceaction.DeviceAction`
+            :param callbacks: callbacks to pass to the actions
+            :param devices: a list of all devices current in the devicetree
+            :param done: the list to append actions to as they are completed
+            :type done: list
+
+            This can run in a worker thread (see :meth:`_processConcurrently`)
+            so the bookkeeping for completed actions is left to the caller.
+        """
+        disk = self._batchDisk(job[0])
+        if disk is None:
+            action = job[0]
+            log.info("executing action: %s", action)
+            with tracing.action_span(action):
+                try:
+                    action.execute(callbacks)
+                except DiskLabelCommitError:
+                    self._teardownDiskUsers(action.device.disk, devices)
+                    action.execute(callbacks)
+
+            done.append(action)
+            return
+
+        for fmt in self._disklabels(disk):
+            fmt.deferCommits()
+
+        executed = []
+        try:
+            for action in job:
+                log.info("executing action: %s", action)
+                with tracing.action_span(action):
+                    try:
+                        action.execute(callbacks)
+                    except Exception:
+                        self._revertPartitionChange(action)
+                        raise
+
+                executed.append(action)
+        finally:
+            # write out what the completed actions did, even if one failed
+            log.info("committing partition table changes on %s", disk.name)
+            try:
+                self._flushCommits(disk)
+            except DiskLabelCommitError:
+                self._teardownDiskUsers(disk, devices)
+                self._flushCommits(disk)
+
+            for action in executed:
+                if action.isCreate:
+                    action.device.finishCreate()
+
+            done.extend(executed)
+
+    def _completeActions(self, actions, devices):
+        """ Move actions to the list of completed actions. """
+        if not actions:
+            return
+
+        self._updatePartitionNames(devices)
+        completed = set(id(a) for a in actions)
+        self._actions = [a for a in self._actions if id(a) not in completed]
+        self._completed_actions.extend(actions)
+
+    @staticmethod
+    def _updatePartitionNames(devices):
+        """ Update the names of existing partitions after a commit. """
+        for device in devices:
+            # make sure we catch any renumbering parted does
+            if device.exists and isinstance(device, PartitionDevice):
+                device.updateName()
+                device.format.device = device.path
+
+    def _jobResources(self, job):
+        """ Return ids of the disks and containers the actions of job use. """
+        resources = set()
+        for action in job:
+            for device in action.device.ancestors:
+                if not device.parents:
+                    resources.add(device.id)
+
+            for container in (action.container,
+                              getattr(action.device, "container", None)):
+                if container is not None:
+                    resources.add(container.id)
+
+        return resources
+
+    def _jobDependencies(self, jobs):
+        """ Return the indices of the jobs each job has to wait for.
+
+            :param jobs: the jobs, in order
+            :type jobs: list of list of :class:`~.deviceaction.DeviceAction`
+            :returns: a set of indices of earlier jobs for each job
+            :rtype: list of set of int
+
+            A job waits for the last earlier job that shares a disk or
+            container with it and for the jobs containing actions that its
+            actions require according to the graph built by :meth:`sort`.
+        """
+        job_index = {}
+        for (idx, job) in enumerate(jobs):
+            for action in job:
+                job_index[action.id] = idx
+
+        dependencies = [set() for _job in jobs]
+        last_user = {}
+        for (idx, job) in enumerate(jobs):
+            for resource in self._jobResources(job):
+                if resource in last_user:
+                    dependencies[idx].add(last_user[resource])
+
+                last_user[resource] = idx
+
+        for (parent, child) in self._edges:
+            first = job_index.get(parent.id)
+            second = job_index.get(child.id)
+            if first is not None and second is not None and first != second:
+                dependencies[second].add(first)
+
+        return dependencies
+
+    def _processConcurrently(self, jobs, callbacks, devices):
+        """ Run jobs that have no conflicts with each other concurrently.
+
+            :param jobs: the jobs, in order
+            :type jobs: list of list of :class:`~.deviceaction.DeviceAction`
+            :returns: the jobs that were not started
+            :rtype: list of list of :class:`~.deviceaction.DeviceAction`
+
+            Up to :attr:`processThreads` jobs run at a time. A job is started
+            once the jobs it depends on are complete. Callbacks are invoked
+            one at a time.
+
+            Errors are handled the way they are when the actions are executed
+            in order: if a job fails no further jobs are started and, once the
+            jobs already running are done, the exception raised by the failed
+            job is raised again. The failed action is not executed again and
+            the actions that were not completed stay in the list.
+        """
+        dependencies = self._jobDependencies(jobs)
+        callbacks = _serializeCallbacks(callbacks)
+        results = queue.Queue()
+
+        def run(idx):
+            done = []
+            try:
+                self._runJob(jobs[idx], callbacks, devices, done)
+            except Exception: # pylint: disable=broad-except
+                results.put((idx, done, sys.exc_info()))
+            else:
+                results.put((idx, done, None))
+
+        threads = min(self._threads, len(jobs))
+        pending = list(range(len(jobs)))
+        finished = set()
+        running = 0
+        error = None
+        pool = ThreadPool(threads)
+        try:
+            while pending or running:
+                if error is None:
+                    for idx in pending[:]:
+                        if running == threads:
+                            # only hand the pool jobs it can start right away
+                            # so that none are started after a failure
+                            break
+
+                        if dependencies[idx] <= finished:
+                            pending.remove(idx)
+                            pool.apply_async(run, (idx,))
+                            running += 1
+
+                if not running:
+                    break
+
+                (idx, done, exc_info) = results.get()
+                running -= 1
+                self._completeActions(done, devices)
+                if exc_info is None:
+                    finished.add(idx)
+                elif error is None:
+                    error = exc_info
+                else:
+                    log.error("executing %s failed: %s",
+                              ", ".join(str(a) for a in jobs[idx]),
+                              exc_info[1])
+        finally:
+            pool.close()
+            pool.join()
+
+        if error is not None:
+            six.reraise(*error)
+
+        return [jobs[idx] for idx in pending]
+
+    @property
+    def _threads(self):
+        """ The maximum number of threads used to execute actions. """
+        if self.processThreads is None:
+            return flags.action_threads
+
+        return self.processThreads
+
     def process(self, callbacks=None, devices=None, dryRun=None):
         """
         Execute all registered actions.
@@ -273,32 +784,50 @@ class ActionList(object):
         :param devices: a list of all devices current in the devicetree
         :type callbacks: :class:`~.callbacks.DoItCallbacks`
 
+        Consecutive partition create and destroy actions on the same disk
+        share a single commit of the partition table unless
+        :attr:`~.flags.Flags.batch_partition_commits` is disabled.
+
+        If :attr:`processThreads`, or :attr:`~.flags.Flags.action_threads`
+        if it is not set, is greater than one, actions that do not depend on
+        each other and that share no disks or containers are executed
+        concurrently. If an action fails, the exception it raised is raised
+        once the actions already running are done, as when the actions are
+        executed in order.
+
+        If the execution_trace callback is given, it is passed a
+        :class:`~.tracing.ExecutionTrace` once the actions are executed.
         """
         devices = devices or []
-        self._preProcess(devices=devices)
+        if dryRun or not (callbacks and callbacks.execution_trace):
+            self._process(callbacks, devices, dryRun)
+            return
 
-        for action in self._actions[:]:
-            log.info("executing action: %s", action)
-            if not dryRun:
-                try:
-                    action.execute(callbacks)
-                except DiskLabelCommitError:
-                    # it's likely that a previous action
-                    # triggered setup of an lvm or md device.
-                    # include deps no longer in the tree due to pending removal
-                    devs = devices + [a.device for a in self._actions]
-                    for dep in set(devs):
-                        if dep.exists and dep.dependsOn(action.device.disk):
-                            dep.teardown(recursive=True)
+        trace = tracing.ExecutionTrace()
+        try:
+            with tracing.tracing(trace):
+                self._process(callbacks, devices, dryRun)
+        finally:
+            msg = _("Executed %(count)d actions in %(time).1f seconds") % \
+                  {"count": len(trace.actions), "time": trace.duration}
+            callbacks.execution_trace(ExecutionTraceData(msg, trace))
 
-                    action.execute(callbacks)
+    def _process(self, callbacks, devices, dryRun):
+        self._preProcess(devices=devices)
 
-                for device in devices:
-                    # make sure we catch any renumbering parted does
-                    if device.exists and isinstance(device, PartitionDevice):
-                        device.updateName()
-                        device.format.device = device.path
+        if dryRun:
+            for action in self._actions:
+                log.info("executing action: %s", action)
+        else:
+            jobs = self._jobs()
+            if self._threads > 1 and len(jobs) > 1:
+                jobs = self._processConcurrently(jobs, callbacks, devices)
 
-                self._completed_actions.append(self._actions.pop(0))
+            for job in jobs:
+                done = []
+                try:
+                    self._runJob(job, callbacks, devices, done)
+                finally:
+                    self._completeActions(done, devices)
 
         self._postProcess(devices=devices)
@@ -46,6 +46,7 @@ from .formats import get_default_filesystem_type
 from .flags import flags
 from .platform import platform as _platform
 from .formats import getFormat
+from .formats.fs import ensureDeviceSizeInfo
 from .osinstall import FSSet, findExistingInstallations
 from . import arch
 from . import iscsi
@@ -730,6 +731,10 @@ class Blivet(object):
         if clearPartType is None:
             clearPartType = self.config.clearPartType
 
+        # probe the filesystems that may be shrunk all at once
+        devices = list(disks) + [p for p in self.partitions if p.disk in disks]
+        ensureDeviceSizeInfo(devices)
+
         free = {}
         for disk in disks:
             should_clear = self.shouldClear(disk, clearPartType=clearPartType,
@@ -1138,6 +1143,8 @@ class Blivet(object):
         if device.protected:
             raise ValueError("cannot modify protected device")
 
+        ensureDeviceSizeInfo([device])
+
         classes = []
         if device.resizable:
             classes.append(ActionResizeDevice)
@@ -36,14 +36,16 @@ _CallbacksRegister = namedtuple("_CallbacksRegister",
                                  "resize_format_pre",
                                  "resize_format_post",
                                  "wait_for_entropy",
-                                 "report_progress"])
+                                 "report_progress",
+                                 "execution_trace"])
 
 def create_new_callbacks_register(create_format_pre=None,
                                   create_format_post=None,
                                   resize_format_pre=None,
                                   resize_format_post=None,
                                   wait_for_entropy=None,
-                                  report_progress=None):
+                                  report_progress=None,
+                                  execution_trace=None):
     """
     A function for creating a new opaque object holding the references to
     callbacks. The point of this function is to hide the implementation of such
@@ -59,12 +61,17 @@ def create_new_callbacks_register(create_format_pre=None,
                              available entropy should be forced (True) or not (False)
     :type wait_for_entropy: :class:`.WaitForEntropyData` -> bool
     :type report_progress: :class:`.ReportProgressData` -> NoneType
+    :param execution_trace: callback receiving a trace of where the time went
+                            once the actions have been executed; tracing is
+                            only done if this callback is given
+    :type execution_trace: :class:`.ExecutionTraceData` -> NoneType
 
     """
 
     return _CallbacksRegister(create_format_pre, create_format_post,
                               resize_format_pre, resize_format_post,
-                              wait_for_entropy, report_progress)
+                              wait_for_entropy, report_progress,
+                              execution_trace)
 
 CreateFormatPreData = namedtuple("CreateFormatPreData",
                                  ["msg"])
@@ -78,3 +85,5 @@ WaitForEntropyData = namedtuple("WaitForEntropyData",
                                 ["msg", "min_entropy"])
 ReportProgressData = namedtuple("ReportProgressData",
                                  ["msg"])
+ExecutionTraceData = namedtuple("ExecutionTraceData",
+                                ["msg", "trace"])
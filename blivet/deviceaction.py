@@ -28,6 +28,7 @@ from .util import get_current_entropy
 from .devices import StorageDevice
 from .devices import PartitionDevice
 from .formats import getFormat, luks
+from .formats.fs import ensureDeviceSizeInfo
 from parted import partitionFlag, PARTITION_LBA
 from .i18n import _, N_
 from .callbacks import CreateFormatPreData, CreateFormatPostData
@@ -96,7 +97,7 @@ def resize_type_from_string(type_string):
         if v.lower() == type_string.lower():
             return k
 
-class DeviceAction(util.ObjectID):
+class DeviceAction(util.ObjectID, util.JournaledObject):
     """ An action that will be carried out in the future on a Device.
 
         These classes represent actions to be performed on devices or
@@ -421,6 +422,7 @@ class ActionResizeDevice(DeviceAction):
     typeDescStr = N_("resize device")
 
     def __init__(self, device, newsize):
+        ensureDeviceSizeInfo([device])
         if not device.resizable:
             raise ValueError("device is not resizable")
 
@@ -554,6 +556,7 @@ class ActionCreateFormat(DeviceAction):
                 self.device.setFlag(self.format.partedFlag)
 
             if self.format.partedSystem is not None:
+                util.record_change(self.device.disk.format)
                 self.device.partedPartition.system = self.format.partedSystem
 
             self.device.disk.format.commitToDisk()
@@ -744,6 +747,7 @@ class ActionResizeFormat(DeviceAction):
         if device.formatImmutable:
             raise ValueError("this device's formatting cannot be modified")
 
+        ensureDeviceSizeInfo([device])
         if not device.format.resizable:
             raise ValueError("format is not resizable")
 
@@ -333,9 +333,7 @@ class DeviceFactory(object):
         self.min_luks_entropy = min_luks_entropy
 
         # used for error recovery
-        self.__devices = []
-        self.__actions = []
-        self.__names = []
+        self.__snapshot = None
         self.__roots = []
 
     @property
@@ -799,6 +797,11 @@ class DeviceFactory(object):
                 e = DeviceFactoryError(str(e))
 
             raise(e)
+        finally:
+            if self.parent_factory is None:
+                # stop recording changes whatever happened, unless the
+                # snapshot has been used to revert the tree already
+                self._drop_devicetree()
 
     def _configure(self):
         self._set_container()
@@ -846,18 +849,22 @@ class DeviceFactory(object):
     # methods for error recovery
     #
     def _save_devicetree(self):
-        _blivet_copy = self.storage.copy()
-        self.__devices = _blivet_copy.devicetree._devices
-        self.__actions = _blivet_copy.devicetree._actions
-        self.__names = _blivet_copy.devicetree.names
-        self.__roots = _blivet_copy.roots
+        self.__snapshot = self.storage.devicetree.takeSnapshot()
+        self.__roots = self.storage.roots[:]
 
     def _revert_devicetree(self):
-        self.storage.devicetree._devices = self.__devices
-        self.storage.devicetree._actions = self.__actions
-        self.storage.devicetree.names = self.__names
+        snapshot = self.__snapshot
+        self.__snapshot = None
+        self.storage.devicetree.restoreSnapshot(snapshot)
         self.storage.roots = self.__roots
 
+    def _drop_devicetree(self):
+        if self.__snapshot is None:
+            return
+
+        self.storage.devicetree.dropSnapshot(self.__snapshot)
+        self.__snapshot = None
+
 class PartitionFactory(DeviceFactory):
     """ Factory class for creating a partition. """
     #
@@ -21,13 +21,17 @@
 #
 
 from collections import namedtuple
+from contextlib import contextmanager
+import threading
 from gi.repository import BlockDev as blockdev
 
 import logging
 log = logging.getLogger("blivet")
 
 from . import raid
+from .. import util
 from ..size import Size
+from ..errors import LVMError
 from ..i18n import N_
 from ..flags import flags
 from ..tasks import availability
@@ -48,26 +52,35 @@ ThPoolProfile = namedtuple("ThPoolProfile", ["name", "desc"])
 KNOWN_THPOOL_PROFILES = (ThPoolProfile("thin-generic", N_("Generic")),
                          ThPoolProfile("thin-performance", N_("Performance")))
 
-EXTERNAL_DEPENDENCIES = [availability.BLOCKDEV_LVM_PLUGIN]
+# lvs() runs the lvm binary itself
+EXTERNAL_DEPENDENCIES = [availability.BLOCKDEV_LVM_PLUGIN, availability.LVM_APP]
 
 # Start config_args handling code
 #
 # Theoretically we can handle all that can be handled with the LVM --config
 # argument.  For every time we call an lvm_cc (lvm compose config) funciton
 # we regenerate the config_args with all global info.
-config_args_data = { "filterRejects": [],    # regular expressions to reject.
-                     "filterAccepts": [] }   # regexp to accept
+config_args_data = { "filterRejects": set(),    # regular expressions to reject.
+                     "filterAccepts": set() }   # regexp to accept
 
-def _set_global_config():
+# protects config_args_data and the config last passed to libblockdev, since
+# actions on different devices can be executed concurrently
+_config_lock = threading.Lock()
+_config_string = None
+
+# per-thread state of lvm_cc_batch
+_config_batch = threading.local()
+
+def _get_global_config():
     """lvm command accepts lvm.conf type arguments preceded by --config. """
 
+    # all of the rejected devices are matched by a single regular expression
+    # rather than one per device, which keeps both the config string and the
+    # work lvm does for each device it scans small
     filter_string = ""
-    rejects = config_args_data["filterRejects"]
-    for reject in rejects:
-        filter_string += ("\"r|/%s$|\"," % reject)
-
-    if filter_string:
-        filter_string = "filter=[%s]" % filter_string.strip(",")
+    rejects = sorted(config_args_data["filterRejects"])
+    if rejects:
+        filter_string = "filter=[\"r|/(%s)$|\"]" % "|".join(rejects)
 
     # XXX consider making /tmp/blivet.lvm.XXXXX, writing an lvm.conf there, and
     #     setting LVM_SYSTEM_DIR
@@ -82,24 +95,60 @@ def _set_global_config():
     if not flags.lvm_metadata_backup:
         config_string += "backup {backup=0 archive=0} "
 
-    blockdev.lvm.set_global_config(config_string)
+    return config_string
 
-def needs_config_refresh(fn):
-    if not availability.BLOCKDEV_LVM_PLUGIN.available:
-        return lambda *args, **kwargs: None
+def _set_global_config():
+    global _config_string # pylint: disable=global-statement
+    with _config_lock:
+        config_string = _get_global_config()
+        if config_string != _config_string:
+            blockdev.lvm.set_global_config(config_string)
+            _config_string = config_string
 
+def needs_config_refresh(fn):
     def fn_with_refresh(*args, **kwargs):
-        ret = fn(*args, **kwargs)
-        _set_global_config()
+        # checked on use rather than at import time, which would load the
+        # lvm plugin whenever this module is imported
+        if not availability.BLOCKDEV_LVM_PLUGIN.available:
+            return None
+
+        with _config_lock:
+            ret = fn(*args, **kwargs)
+
+        if getattr(_config_batch, "depth", 0):
+            _config_batch.pending = True
+        else:
+            _set_global_config()
+
         return ret
 
     return fn_with_refresh
 
+@contextmanager
+def lvm_cc_batch():
+    """ Put off passing changes to the --config string to libblockdev.
+
+        Changes made by this thread while the context is active are passed on
+        once, when it exits. Contexts can be nested, in which case that is
+        done when the outermost one exits.
+
+        No lvm commands should be run by this thread while the context is
+        active, since they would not see the changes.
+    """
+    _config_batch.depth = getattr(_config_batch, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _config_batch.depth -= 1
+        if not _config_batch.depth and getattr(_config_batch, "pending", False):
+            _config_batch.pending = False
+            _set_global_config()
+
 @needs_config_refresh
 def lvm_cc_addFilterRejectRegexp(regexp):
     """ Add a regular expression to the --config string."""
     log.debug("lvm filter: adding %s to the reject list", regexp)
-    config_args_data["filterRejects"].append(regexp)
+    config_args_data["filterRejects"].add(regexp)
 
 @needs_config_refresh
 def lvm_cc_removeFilterRejectRegexp(regexp):
@@ -107,11 +156,73 @@ def lvm_cc_removeFilterRejectRegexp(regexp):
     log.debug("lvm filter: removing %s from the reject list", regexp)
     try:
         config_args_data["filterRejects"].remove(regexp)
-    except ValueError:
+    except KeyError:
         log.debug("%s wasn't in the reject list", regexp)
         return
 
 @needs_config_refresh
 def lvm_cc_resetFilter():
-    config_args_data["filterRejects"] = []
-    config_args_data["filterAccepts"] = []
+    config_args_data["filterRejects"] = set()
+    config_args_data["filterAccepts"] = set()
+
+# Reporting code
+#
+# blockdev.lvm.lvs() does not report the origin or the thin pool of an LV and
+# asking for those with blockdev.lvm.lvorigin()/thlvpoolname() runs (and
+# rescans) lvm once per LV, so all the information the populator needs is
+# gathered with a single lvs call instead.
+LVInfo = namedtuple("LVInfo", ["vg_name", "lv_name", "uuid", "size", "attr",
+                               "segtype", "origin", "pool_lv"])
+
+_LVS_FIELDS = (("vg_name", "LVM2_VG_NAME"),
+               ("lv_name", "LVM2_LV_NAME"),
+               ("uuid", "LVM2_LV_UUID"),
+               ("size", "LVM2_LV_SIZE"),
+               ("attr", "LVM2_LV_ATTR"),
+               ("segtype", "LVM2_SEGTYPE"),
+               ("origin", "LVM2_ORIGIN"),
+               ("pool_lv", "LVM2_POOL_LV"))
+
+def _parse_lvs_line(line):
+    """ Parse one line of name-prefixed, unquoted lvs output.
+
+        :param str line: a line of lvs output
+        :returns: the LV described by the line or None if it is incomplete
+        :rtype: :class:`LVInfo` or NoneType
+    """
+    values = {}
+    for item in line.split():
+        (key, _sep, value) = item.partition("=")
+        values[key] = value
+
+    if any(key not in values for (_field, key) in _LVS_FIELDS):
+        return None
+
+    info = dict((field, values[key]) for (field, key) in _LVS_FIELDS)
+    info["size"] = int(info["size"] or 0)
+    return LVInfo(**info)
+
+def lvs():
+    """ Return information about all LVs, including the hidden ones.
+
+        :returns: list of LVs with their origins and thin pools
+        :rtype: list of :class:`LVInfo`
+        :raises: :class:`~.errors.LVMError` if the lvs call fails
+    """
+    argv = ["lvm", "lvs", "--noheadings", "--nosuffix", "--nameprefixes",
+            "--unquoted", "--units=b", "-a",
+            "-o", ",".join(key[5:].lower() for (_field, key) in _LVS_FIELDS),
+            "--config=%s" % _get_global_config()]
+    (rc, out) = util.run_program_and_capture_output(argv)
+    if rc:
+        raise LVMError("lvs failed with exit code %d" % rc)
+
+    lv_list = []
+    for line in out.splitlines():
+        lv = _parse_lvs_line(line)
+        if lv is not None:
+            lv_list.append(lv)
+        elif line.strip():
+            log.warning("failed to parse lvs output line: %s", line)
+
+    return lv_list
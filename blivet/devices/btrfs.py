@@ -28,6 +28,7 @@ from ..devicelibs import btrfs
 from ..devicelibs import raid
 
 from .. import errors
+from .. import util
 from ..flags import flags
 from ..storage_log import log_method_call
 from .. import udev
@@ -311,6 +312,7 @@ class BTRFSVolumeDevice(BTRFSDevice, ContainerDevice, RaidDevice):
         if vol.name in [v.name for v in self.subvolumes]:
             raise errors.BTRFSValueError("subvolume %s already exists" % vol.name)
 
+        util.record_change(self)
         self.subvolumes.append(vol)
 
     def _removeSubVolume(self, name):
@@ -318,6 +320,7 @@ class BTRFSVolumeDevice(BTRFSDevice, ContainerDevice, RaidDevice):
             raise errors.BTRFSValueError("cannot remove non-existent subvolume %s" % name)
 
         names = [v.name for v in self.subvolumes]
+        util.record_change(self)
         self.subvolumes.pop(names.index(name))
 
     def listSubVolumes(self, snapshotsOnly=False):
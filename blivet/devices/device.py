@@ -21,6 +21,7 @@
 #
 
 import pprint
+import weakref
 
 from .. import util
 from ..storage_log import log_method_call
@@ -30,7 +31,7 @@ log = logging.getLogger("blivet")
 
 from .lib import ParentList
 
-class Device(util.ObjectID):
+class Device(util.ObjectID, util.JournaledObject):
     """ A generic device.
 
         Device instances know which devices they depend upon (parents
@@ -76,6 +77,7 @@ class Device(util.ObjectID):
         """
         util.ObjectID.__init__(self)
         self.kids = 0
+        self._initAncestorCache()
 
         # Copy only the validity check from _setName so we don't try to check a
         # bunch of inappropriate state properties during __init__ in subclasses
@@ -94,9 +96,11 @@ class Device(util.ObjectID):
             We can't do copy.deepcopy on parted objects, which is okay.
             For these parted objects, we just do a shallow copy.
         """
-        return util.variable_copy(self, memo,
-           omit=('node',),
+        new = util.variable_copy(self, memo,
+           omit=('node', '_ancestorCache', '_ancestorCacheUsers'),
            shallow=('_partedPartition',))
+        new._initAncestorCache()
+        return new
 
     def __repr__(self):
         s = ("%(type)s instance (%(id)s) --\n"
@@ -134,12 +138,26 @@ class Device(util.ObjectID):
         """
         parent.removeChild()
 
+    def _parentsChanged(self):
+        """ Called after this device's parent list has changed.
+
+            See :attr:`~.ParentList.changefunc`.
+        """
+        self._invalidateAncestorCache()
+        util.notify_attribute_changed(self, "parents")
+
+    def _journalRestore(self, state):
+        """ Restore the state saved by a :class:`~.util.ChangeJournal`. """
+        util.journal_restore(self, state)
+        self._invalidateAncestorCache()
+
     def _initParentList(self):
         """ Initialize this instance's parent list. """
         if not hasattr(self, "_parents"):
             # pylint: disable=attribute-defined-outside-init
             self._parents = ParentList(appendfunc=self._addParent,
-                                       removefunc=self._removeParent)
+                                       removefunc=self._removeParent,
+                                       changefunc=self._parentsChanged)
 
         # iterate over a copy of the parent list because we are altering it in
         # the for-cycle
@@ -174,7 +192,7 @@ class Device(util.ObjectID):
         log_method_call(self, name=self.name, kids=self.kids)
         self.kids += 1
 
-    def setup(self, orig=False):
+    def setup(self, orig=False, recursive=True):
         """ Open, or set up, a device. """
         raise NotImplementedError("setup method not defined for Device")
 
@@ -222,15 +240,74 @@ class Device(util.ObjectID):
             :rtype: bool
         """
         # XXX does a device depend on itself?
-        if dep in self.parents:
+        (ancestors, overrides) = self._getAncestorCache()
+        if dep in ancestors:
             return True
 
-        for parent in self.parents:
-            if parent.dependsOn(dep):
+        # some devices depend on devices other than their ancestors
+        for ancestor in overrides:
+            if ancestor.dependsOn(dep):
                 return True
 
         return False
 
+    def _initAncestorCache(self):
+        """ Set up an empty cache of this device's ancestors. """
+        # the cache is not part of the device's state, so changes to it are
+        # not recorded in change journals
+        object.__setattr__(self, "_ancestorCache", None)
+
+        # devices whose cached ancestors were built from this device's
+        object.__setattr__(self, "_ancestorCacheUsers", weakref.WeakSet())
+
+    def _invalidateAncestorCache(self):
+        """ Drop the cached ancestors of this device and of its descendants.
+
+            This is called when this device's parent list changes.
+        """
+        todo = [self]
+        while todo:
+            device = todo.pop()
+            if "_ancestorCacheUsers" not in device.__dict__:
+                # the parent list is set before Device.__init__ has run
+                continue
+
+            object.__setattr__(device, "_ancestorCache", None)
+            todo.extend(device._ancestorCacheUsers)
+            device._ancestorCacheUsers.clear()
+
+    def _getAncestorCache(self):
+        """ Return this device's ancestors, excluding itself.
+
+            :returns: a set of all ancestors and a list of the ancestors that
+                      override :meth:`dependsOn`
+            :rtype: tuple of (frozenset, tuple)
+
+            The result is cached until the parent list of this device or of
+            one of its ancestors changes (see
+            :meth:`_invalidateAncestorCache`).
+        """
+        cache = self._ancestorCache
+        if cache is not None:
+            return cache
+
+        ancestors = set()
+        overrides = []
+        for parent in self.parents:
+            if parent not in ancestors:
+                ancestors.add(parent)
+                if type(parent).dependsOn is not Device.dependsOn:
+                    overrides.append(parent)
+
+            (parent_ancestors, parent_overrides) = parent._getAncestorCache()
+            ancestors.update(parent_ancestors)
+            overrides.extend(a for a in parent_overrides if a not in overrides)
+            parent._ancestorCacheUsers.add(self)
+
+        cache = (frozenset(ancestors), tuple(overrides))
+        object.__setattr__(self, "_ancestorCache", cache)
+        return cache
+
     def dracutSetupArgs(self):
         return set()
 
@@ -247,8 +324,12 @@ class Device(util.ObjectID):
             raise ValueError("%s is not a valid name for this device" % value)
         self._name = value
 
+    def _nameSetter(self, value):
+        self._setName(value)
+        util.notify_attribute_changed(self, "name")
+
     name = property(lambda s: s._getName(),
-                    lambda s, v: s._setName(v),
+                    lambda s, v: s._nameSetter(v),
                     doc="This device's name")
 
     @property
@@ -269,10 +350,8 @@ class Device(util.ObjectID):
     @property
     def ancestors(self):
         """ A list of all of this device's ancestors, including itself. """
-        l = set([self])
-        for p in [d for d in self.parents if d not in l]:
-            l.update(set(p.ancestors))
-        return list(l)
+        (ancestors, _overrides) = self._getAncestorCache()
+        return list(ancestors) + [self]
 
     @property
     def packages(self):
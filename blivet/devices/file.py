@@ -89,11 +89,11 @@ class FileDevice(StorageDevice):
 
         return size
 
-    def _preSetup(self, orig=False):
+    def _preSetup(self, orig=False, recursive=True):
         if self.format and self.format.exists and not self.format.status:
             self.format.device = self.path
 
-        return StorageDevice._preSetup(self, orig=orig)
+        return StorageDevice._preSetup(self, orig=orig, recursive=recursive)
 
     def _preTeardown(self, recursive=None):
         if self.format and self.format.exists and not self.format.status:
@@ -22,6 +22,7 @@ import os
 
 from .. import errors
 from .. import udev
+from .. import util
 from ..size import Size
 
 LINUX_SECTOR_SIZE = Size(512)
@@ -38,7 +39,6 @@ def get_device_majors():
         except ValueError:
             continue
     return majors
-device_majors = get_device_majors()
 
 def devicePathToName(devicePath):
     """ Return a name based on the given path to a device node.
@@ -79,10 +79,9 @@ def deviceNameToDiskByPath(deviceName=None):
         return ""
 
     ret = None
-    for dev in udev.get_devices():
-        if udev.device_get_name(dev) == deviceName:
-            ret = udev.device_get_by_path(dev)
-            break
+    dev = udev.get_snapshot().by_name.get(deviceName)
+    if dev is not None:
+        ret = udev.device_get_by_path(dev)
 
     if ret:
         return ret
@@ -106,8 +105,12 @@ class ParentList(object):
             len(ml)
             x in ml
             x = ml[i]   # not ml[i] = x
+
+        Changes are recorded in any open :class:`~.util.ChangeJournal`.
     """
-    def __init__(self, items=None, appendfunc=None, removefunc=None):
+
+    def __init__(self, items=None, appendfunc=None, removefunc=None,
+                 changefunc=None):
         """
             :keyword items: initial contents
             :type items: any iterable
@@ -115,6 +118,8 @@ class ParentList(object):
             :type appendfunc: callable
             :keyword removefunc: a function to call before removing an item
             :type removefunc: callable
+            :keyword changefunc: a function to call after any change
+            :type changefunc: callable
 
             appendfunc and removefunc should take the item to be added or
             removed and perform any checks or other processing. The appropriate
@@ -124,6 +129,9 @@ class ParentList(object):
             to the function. While this is not optimal for general-purpose use,
             it is ideal for the intended use as part of :class:`~.Device`. The
             functions themselves should not modify the :class:`~.ParentList`.
+
+            changefunc takes no arguments. It is called after the list has
+            been changed in any way, including via :meth:`replace`.
         """
         self.items = list()
         if items:
@@ -135,6 +143,9 @@ class ParentList(object):
         self.removefunc = removefunc or (lambda i: True)
         """ a function to call before removing an item """
 
+        self.changefunc = changefunc or (lambda: None)
+        """ a function to call after the list has changed """
+
     def __iter__(self):
         return iter(self.items)
 
@@ -153,7 +164,9 @@ class ParentList(object):
             raise ValueError("item is already in the list")
 
         self.appendfunc(y)
+        util.record_change(self)
         self.items.append(y)
+        self.changefunc()
 
     def remove(self, y):
         """ Remove an item from the list after running a callback. """
@@ -161,10 +174,13 @@ class ParentList(object):
             raise ValueError("item is not in the list")
 
         self.removefunc(y)
+        util.record_change(self)
         self.items.remove(y)
+        self.changefunc()
 
     def replace(self, x, y):
-        """ Replace the first instance of x with y, bypassing callbacks.
+        """ Replace the first instance of x with y, bypassing the append and
+            remove callbacks.
 
             .. note::
 
@@ -176,4 +192,11 @@ class ParentList(object):
             raise ValueError("item to be replaced is not in the list")
 
         idx = self.items.index(x)
+        util.record_change(self)
         self.items[idx] = y
+        self.changefunc()
+
+    def _journalRestore(self, state):
+        """ Restore the state saved by a :class:`~.util.ChangeJournal`. """
+        util.journal_restore(self, state)
+        self.changefunc()
@@ -91,10 +91,10 @@ class LoopDevice(StorageDevice):
     def size(self):
         return self.slave.size
 
-    def _preSetup(self, orig=False):
+    def _preSetup(self, orig=False, recursive=True):
         if not os.path.exists(self.slave.path):
             raise errors.DeviceError("specified file (%s) does not exist" % self.slave.path)
-        return StorageDevice._preSetup(self, orig=orig)
+        return StorageDevice._preSetup(self, orig=orig, recursive=recursive)
 
     def _setup(self, orig=False):
         """ Open, or set up, a device. """
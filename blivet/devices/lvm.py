@@ -194,10 +194,10 @@ class LVMVolumeGroupDevice(ContainerDevice):
 
         return True
 
-    def _preSetup(self, orig=False):
+    def _preSetup(self, orig=False, recursive=True):
         if self.exists and not self.complete:
             raise errors.DeviceError("cannot activate VG with missing PV(s)", self.name)
-        return StorageDevice._preSetup(self, orig=orig)
+        return StorageDevice._preSetup(self, orig=orig, recursive=recursive)
 
     def _teardown(self, recursive=None):
         """ Close, or tear down, a device. """
@@ -267,11 +267,13 @@ class LVMVolumeGroupDevice(ContainerDevice):
             raise errors.DeviceError("new lv is too large to fit in free space", self.name)
 
         log.debug("Adding %s/%s to %s", lv.name, lv.size, self.name)
+        util.record_change(self)
         self._lvs.append(lv)
 
         # snapshot accounting
         origin = getattr(lv, "origin", None)
         if origin:
+            util.record_change(origin)
             origin.snapshots.append(lv)
 
     def _removeLogVol(self, lv):
@@ -279,11 +281,13 @@ class LVMVolumeGroupDevice(ContainerDevice):
         if lv not in self.lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        util.record_change(self)
         self._lvs.remove(lv)
 
         # snapshot accounting
         origin = getattr(lv, "origin", None)
         if origin:
+            util.record_change(origin)
             origin.snapshots.remove(lv)
 
     def _addParent(self, member):
@@ -448,7 +452,7 @@ class LVMLogicalVolumeDevice(DMDevice):
     _resizable = True
     _packages = ["lvm2"]
     _containerClass = LVMVolumeGroupDevice
-    _external_dependencies = [availability.BLOCKDEV_LVM_PLUGIN]
+    _external_dependencies = [availability.BLOCKDEV_LVM_PLUGIN, availability.LVM_APP]
 
     def __init__(self, name, parents=None, size=None, uuid=None,
                  copies=1, logSize=None, segType=None,
@@ -943,7 +947,7 @@ class LVMSnapShotDevice(LVMSnapShotBase, LVMLogicalVolumeDevice):
                                         sysfsPath=sysfsPath, grow=grow,
                                         maxsize=maxsize, percent=percent)
 
-    def setup(self, orig=False):
+    def setup(self, orig=False, recursive=True):
         pass
 
     def teardown(self, recursive=False):
@@ -1055,6 +1059,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         # TODO: add some checking to prevent overcommit for preexisting
         self.vg._addLogVol(lv)
         log.debug("Adding %s/%s to %s", lv.name, lv.size, self.name)
+        util.record_change(self)
         self._lvs.append(lv)
 
     def _removeLogVol(self, lv):
@@ -1062,6 +1067,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         if lv not in self._lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        util.record_change(self)
         self._lvs.remove(lv)
         self.vg._removeLogVol(lv)
 
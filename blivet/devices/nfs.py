@@ -50,7 +50,7 @@ class NFSDevice(StorageDevice, NetworkStorageDevice):
         """ Device node representing this device. """
         return self.name
 
-    def setup(self, orig=False):
+    def setup(self, orig=False, recursive=True):
         """ Open, or set up, a device. """
         log_method_call(self, self.name, orig=orig, status=self.status,
                         controllable=self.controllable)
@@ -49,7 +49,7 @@ class NoDevice(StorageDevice):
         # the name may have a '.%d' suffix to make it unique
         return self.name.split(".")[0]
 
-    def setup(self, orig=False):
+    def setup(self, orig=False, recursive=True):
         """ Open, or set up, a device. """
         log_method_call(self, self.name, orig=orig, status=self.status,
                         controllable=self.controllable)
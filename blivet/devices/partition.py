@@ -265,6 +265,7 @@ class PartitionDevice(StorageDevice):
 
             # resize the partition's geometry in memory
             (constraint, geometry) = self._computeResize(self.partedPartition)
+            util.record_change(self.disk.format)
             disk.setPartitionGeometry(partition=self.partedPartition,
                                       constraint=constraint,
                                       start=geometry.start, end=geometry.end)
@@ -451,6 +452,8 @@ class PartitionDevice(StorageDevice):
         if not self.partedPartition or not self.flagAvailable(flag):
             return
 
+        # the parted partition belongs to the disklabel's parted disk
+        util.record_change(self.disk.format)
         self.partedPartition.setFlag(flag)
 
     def unsetFlag(self, flag):
@@ -458,6 +461,7 @@ class PartitionDevice(StorageDevice):
         if not self.partedPartition or not self.flagAvailable(flag):
             return
 
+        util.record_change(self.disk.format)
         self.partedPartition.unsetFlag(flag)
 
     @property
@@ -558,8 +562,9 @@ class PartitionDevice(StorageDevice):
         finally:
             # If a udev device is created with the watch option, then
             # a change uevent is synthesized and we need to wait for
-            # things to settle.
-            udev.settle()
+            # things to settle. A deferred commit will settle anyway.
+            if not self.disk.format.commitsDeferred:
+                udev.settle()
 
     def _create(self):
         """ Create the device. """
@@ -576,6 +581,24 @@ class PartitionDevice(StorageDevice):
             self.disk.format.removePartition(part)
             raise
 
+    def create(self):
+        """ Create the device.
+
+            If the disklabel is deferring commits the kernel will not know
+            about the new partition yet, so the rest of the work is left for
+            :meth:`finishCreate`.
+        """
+        log_method_call(self, self.name, status=self.status)
+        self._preCreate()
+        self._create()
+        if not self.disk.format.commitsDeferred:
+            self._postCreate()
+
+    def finishCreate(self):
+        """ Finish creation after a deferred commit of the disklabel. """
+        log_method_call(self, self.name, status=self.status)
+        self._postCreate()
+
     def _postCreate(self):
         if self.isExtended:
             partition = self.disk.format.extendedPartition
@@ -641,6 +664,7 @@ class PartitionDevice(StorageDevice):
         partition = partedDisk.getPartitionByPath(self.path)
         (constraint, geometry) = self._computeResize(partition)
 
+        util.record_change(self.disk.format)
         partedDisk.setPartitionGeometry(partition=partition,
                                         constraint=constraint,
                                         start=geometry.start,
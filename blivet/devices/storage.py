@@ -28,6 +28,7 @@ from .. import errors
 from .. import util
 from ..flags import flags
 from ..storage_log import log_method_call
+from .. import tracing
 from .. import udev
 from ..formats import getFormat
 from ..size import Size
@@ -255,6 +256,28 @@ class StorageDevice(Device):
         """ Device node representing this device. """
         return "%s/%s" % (self._devDir, self.name)
 
+    def _getUuid(self):
+        return self._uuid
+
+    def _setUuid(self, value):
+        self._uuid = value # pylint: disable=attribute-defined-outside-init
+        util.notify_attribute_changed(self, "uuid")
+
+    uuid = property(lambda s: s._getUuid(),
+                    lambda s, v: s._setUuid(v),
+                    doc="universally unique identifier (device -- not fs)")
+
+    def _getSysfsPath(self):
+        return self._sysfsPath
+
+    def _setSysfsPath(self, value):
+        self._sysfsPath = value # pylint: disable=attribute-defined-outside-init
+        util.notify_attribute_changed(self, "sysfsPath")
+
+    sysfsPath = property(lambda s: s._getSysfsPath(),
+                         lambda s, v: s._setSysfsPath(v),
+                         doc="sysfs device path")
+
     def updateSysfsPath(self):
         """ Update this device's sysfs path. """
         # We're using os.path.exists as a stand-in for status. We can't use
@@ -349,7 +372,7 @@ class StorageDevice(Device):
     #
     # setup
     #
-    def _preSetup(self, orig=False):
+    def _preSetup(self, orig=False, recursive=True):
         """ Preparation and pre-condition checking for device setup.
 
             Return True if setup should proceed or False if not.
@@ -360,22 +383,30 @@ class StorageDevice(Device):
         if self.status or not self.controllable:
             return False
 
-        self.setupParents(orig=orig)
+        if recursive:
+            self.setupParents(orig=orig)
         return True
 
     def _setup(self, orig=False):
         """ Perform device-specific setup operations. """
         pass
 
-    def setup(self, orig=False):
-        """ Open, or set up, a device. """
+    def setup(self, orig=False, recursive=True):
+        """ Open, or set up, a device.
+
+            :keyword orig: set up original format instead of current format
+            :type orig: bool
+            :keyword recursive: set up the parent devices first
+            :type recursive: bool
+        """
         log_method_call(self, self.name, orig=orig, status=self.status,
                         controllable=self.controllable)
-        if not self._preSetup(orig=orig):
+        if not self._preSetup(orig=orig, recursive=recursive):
             return
 
-        self._setup(orig=orig)
-        self._postSetup()
+        with tracing.span(tracing.SETUP, self.name, {"orig": orig}):
+            self._setup(orig=orig)
+            self._postSetup()
 
     def _postSetup(self):
         """ Perform post-setup operations. """
@@ -604,6 +635,7 @@ class StorageDevice(Device):
         self._format = fmt
         self._format.device = self.path
         self._updateNetDevMountOption()
+        util.notify_attribute_changed(self, "format")
 
     def _updateNetDevMountOption(self):
         """ Fix mount options to include or exclude _netdev as appropriate. """
@@ -22,15 +22,19 @@
 
 import os
 import re
+from collections import deque
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 from gi.repository import BlockDev as blockdev
 
 from .actionlist import ActionList
-from .errors import DeviceError, DeviceTreeError, StorageError
+from .errors import DeviceError, DeviceFormatError, DeviceTreeError, StorageError
 from .deviceaction import ActionDestroyDevice, ActionDestroyFormat
-from .devices import BTRFSDevice, DASDDevice, NoDevice, PartitionDevice
+from .devices import BTRFSDevice, DASDDevice, Device, NoDevice, PartitionDevice
 from .devices import LVMLogicalVolumeDevice, LVMVolumeGroupDevice
 from . import formats, arch
+from .formats.disklabel import DiskLabel
 from .devicelibs import lvm
 from .devicelibs import edd
 from . import udev
@@ -44,6 +48,232 @@ log = logging.getLogger("blivet")
 
 _LVM_DEVICE_CLASSES = (LVMLogicalVolumeDevice, LVMVolumeGroupDevice)
 
+def _formatUuid(device):
+    return getattr(getattr(device, "format", None), "uuid", None)
+
+def _formatLabel(device):
+    return getattr(getattr(device, "format", None), "label", None)
+
+class _DeviceIndex(object):
+    """ Hash indexes over the attributes used to look up devices.
+
+        Each index maps an attribute value to the devices that had that value
+        when they were last indexed. The watcher is registered with every
+        indexed device and format (see :func:`~.util.add_attribute_watcher`)
+        and has to pass the changes they report via
+        :func:`~.util.notify_attribute_changed` on to :meth:`update`. Every
+        setter of an indexed attribute reports changes, and attributes derived
+        from those of the parents are updated along with them (see
+        :meth:`DeviceTree.attributeChanged`), which keeps the index current.
+
+        Devices are ordered the way :meth:`DeviceTree._filterDevices` orders
+        them: visible devices in the order they were added to the tree,
+        followed by hidden devices in the order they were hidden.
+
+        The index also maps each device to the indexed devices it is a parent
+        of. Changes to parent lists are reported the same way as changes to
+        the other indexed attributes.
+    """
+    _keyfuncs = {"name": lambda d: [d.name],
+                 "path": lambda d: [d.path],
+                 "uuid": lambda d: [getattr(d, "uuid", None), _formatUuid(d)],
+                 "sysfsPath": lambda d: [getattr(d, "sysfsPath", None)],
+                 "label": lambda d: [_formatLabel(d)],
+                 "id": lambda d: [d.id]}
+
+    def __init__(self, devices, hidden, watcher):
+        """
+            :param list devices: the tree's list of visible devices
+            :param list hidden: the tree's list of hidden devices
+            :param watcher: an object with an attributeChanged(obj, attr)
+                            method
+        """
+        self.devices = devices
+        self.hidden = hidden
+        self.watcher = watcher
+
+        self._maps = dict((attr, {}) for attr in self._keyfuncs)
+
+        # id(device) -> (device, format, {attr: keys}, (hidden, seq))
+        self._entries = {}
+
+        # id(format) -> device
+        self._formats = {}
+
+        # id(device) -> parents
+        self._parents = {}
+
+        # id(parent) -> {id(child): child}, and the same for only those
+        # children which override dependsOn
+        self._children = {}
+        self._overriding = {}
+
+        self._seq = 0
+
+        for device in devices:
+            self.add(device)
+
+        for device in hidden:
+            self.add(device, hidden=True)
+
+    def _entry(self, obj):
+        entry = self._entries.get(id(obj))
+        if entry is not None and entry[0] is obj:
+            return entry
+
+    def owner(self, obj):
+        """ Return the indexed device obj is, or whose format obj is. """
+        entry = self._entry(obj)
+        if entry is not None:
+            return obj
+
+        device = self._formats.get(id(obj))
+        if device is not None and device.format is obj:
+            return device
+
+    def isHidden(self, device):
+        """ Return whether device is hidden, or None if it is not indexed. """
+        entry = self._entry(device)
+        if entry is None:
+            return None
+
+        return entry[3][0]
+
+    def _unlink(self, device, entry):
+        (_device, fmt, keys, _order) = entry
+        for (attr, values) in keys.items():
+            for value in values:
+                bucket = self._maps[attr].get(value)
+                if bucket is None:
+                    continue
+
+                bucket.remove(device)
+                if not bucket:
+                    del self._maps[attr][value]
+
+        util.remove_attribute_watcher(device, self.watcher)
+        if self._formats.get(id(fmt)) is device:
+            del self._formats[id(fmt)]
+            util.remove_attribute_watcher(fmt, self.watcher)
+
+        for parent in self._parents.pop(id(device), []):
+            for children in (self._children, self._overriding):
+                kids = children.get(id(parent))
+                if kids is not None and kids.pop(id(device), None) is not None \
+                   and not kids:
+                    del children[id(parent)]
+
+    def _link(self, device, order):
+        keys = {}
+        for (attr, func) in self._keyfuncs.items():
+            values = set(v for v in func(device) if v is not None and v != "")
+            for value in values:
+                self._maps[attr].setdefault(value, []).append(device)
+
+            keys[attr] = values
+
+        util.add_attribute_watcher(device, self.watcher)
+        fmt = getattr(device, "format", None)
+        if fmt is not None:
+            self._formats[id(fmt)] = device
+            util.add_attribute_watcher(fmt, self.watcher)
+
+        parents = list(getattr(device, "parents", []))
+        overriding = type(device).dependsOn is not Device.dependsOn
+        for parent in parents:
+            self._children.setdefault(id(parent), {})[id(device)] = device
+            if overriding:
+                self._overriding.setdefault(id(parent), {})[id(device)] = device
+
+        self._parents[id(device)] = parents
+        self._entries[id(device)] = (device, fmt, keys, order)
+
+    def add(self, device, hidden=False):
+        """ Add a device to the end of the visible or hidden ordering. """
+        entry = self._entry(device)
+        if entry is not None:
+            self._unlink(device, entry)
+
+        self._seq += 1
+        self._link(device, (hidden, self._seq))
+
+    def remove(self, device):
+        """ Remove a device from the index. """
+        entry = self._entry(device)
+        if entry is None:
+            return
+
+        self._unlink(device, entry)
+        del self._entries[id(device)]
+
+    def update(self, device):
+        """ Re-read the indexed attributes of a device. """
+        entry = self._entry(device)
+        if entry is None:
+            return
+
+        self._unlink(device, entry)
+        self._link(device, entry[3])
+
+    def candidates(self, attr, *values):
+        """ Return the devices indexed under any of values, in tree order.
+
+            :param str attr: the indexed attribute
+            :returns: a list of devices which may have a matching value
+            :rtype: list of :class:`~.devices.Device`
+        """
+        found = {}
+        for value in values:
+            for device in self._maps[attr].get(value, []):
+                found[id(device)] = device
+
+        return sorted(found.values(), key=lambda d: self._entries[id(d)][3])
+
+    def _ordered(self, devices, hidden):
+        if not hidden:
+            devices = [d for d in devices if not self._entries[id(d)][3][0]]
+
+        return sorted(devices, key=lambda d: self._entries[id(d)][3])
+
+    def children(self, device, hidden=False):
+        """ Return the indexed devices device is a parent of, in tree order.
+
+            :param device: the parent device
+            :keyword bool hidden: include hidden devices
+        """
+        return self._ordered(self._children.get(id(device), {}).values(),
+                             hidden)
+
+    def dependents(self, device, hidden=False):
+        """ Return the indexed devices that depend on device, in tree order.
+
+            :param device: the device whose dependents are wanted
+            :keyword bool hidden: include hidden devices
+
+            The dependents are the device's descendants, found via a breadth
+            first search of the children, plus devices that depend on device
+            without being descendants (eg: snapshots of an lv or logical
+            partitions of an extended partition) and their descendants. Those
+            are expected to be children of one of device's ancestors.
+        """
+        found = {}
+        queue = deque([device])
+        for ancestor in device.ancestors:
+            for other in list(self._overriding.get(id(ancestor), {}).values()):
+                if other is not device and id(other) not in found and \
+                   other.dependsOn(device):
+                    found[id(other)] = other
+                    queue.append(other)
+
+        while queue:
+            parent = queue.popleft()
+            for child in self._children.get(id(parent), {}).values():
+                if child is not device and id(child) not in found:
+                    found[id(child)] = child
+                    queue.append(child)
+
+        return self._ordered(found.values(), hidden)
+
 class DeviceTree(object):
     """ A quasi-tree that represents the devices in the system.
 
@@ -79,6 +309,9 @@ class DeviceTree(object):
             :type dasd: :class:`~.dasd.DASD`
 
         """
+        # maximum number of threads used by setupAll and teardownAll
+        self.activationThreads = multiprocessing.cpu_count()
+
         self.reset(conf, passphrase, luksDict, iscsi, dasd)
 
     def reset(self, conf=None, passphrase=None, luksDict=None,
@@ -93,6 +326,13 @@ class DeviceTree(object):
 
         self._hidden = []
 
+        # hash indexes for device lookups, built on first use
+        self._index = None
+
+        # views derived from the devices, valid until the next change
+        self._generation = 0
+        self._views = {}
+
         # initialize attributes that may later hold cached lvm info
         self.dropLVMCache()
 
@@ -105,10 +345,142 @@ class DeviceTree(object):
                                     iscsi=iscsi,
                                     dasd=dasd)
 
+    def __deepcopy__(self, memo):
+        new = util.variable_copy(self, memo, omit=("_index", "_views"))
+        new._index = None
+        new._views = {}
+        return new
+
+    def takeSnapshot(self):
+        """ Take a snapshot of the tree's devices and actions.
+
+            :returns: the snapshot
+            :rtype: :class:`~.util.ChangeJournal`
+
+            Nothing is copied up front. Instead, the state of each device,
+            format and action is saved just before it is first changed, so a
+            snapshot costs as much as the changes made after it rather than
+            as much as the tree. The snapshot has to be passed to
+            :meth:`restoreSnapshot` or :meth:`dropSnapshot` when it is no
+            longer needed.
+        """
+        snapshot = util.ChangeJournal()
+        snapshot.open()
+        snapshot.record(self)
+        snapshot.record(self._actions)
+        return snapshot
+
+    def restoreSnapshot(self, snapshot):
+        """ Return the tree to the state it was in when snapshot was taken.
+
+            :param snapshot: a snapshot returned by :meth:`takeSnapshot`
+        """
+        restored = snapshot.rollback()
+
+        # the restored disklabels have their own parted disks, so the
+        # partitions need to look up their parted partitions again
+        disklabels = set(id(obj) for obj in restored if isinstance(obj, DiskLabel))
+        if not disklabels:
+            return
+
+        for partition in self._devices + self._hidden:
+            if not isinstance(partition, PartitionDevice) or \
+               not partition._partedPartition or \
+               id(partition.disk.format) not in disklabels:
+                continue
+
+            p = partition.disk.format.partedDisk.getPartitionByPath(partition.path)
+            partition.partedPartition = p
+
+    def dropSnapshot(self, snapshot):
+        """ Stop recording changes for a snapshot that is no longer needed.
+
+            :param snapshot: a snapshot returned by :meth:`takeSnapshot`
+        """
+        snapshot.close()
+
+    def _journalState(self):
+        """ Return the state a :class:`~.util.ChangeJournal` should save. """
+        return (self._devices[:], self._hidden[:], self.names[:])
+
+    def _journalRestore(self, state):
+        """ Restore the state saved by a :class:`~.util.ChangeJournal`. """
+        (self._devices, self._hidden, self.names) = (list(l) for l in state)
+        self._index = None
+        self._invalidateViews()
+
     @property
     def actions(self):
         return self._actions
 
+    @property
+    def _deviceIndex(self):
+        """ The lookup index, (re)built if missing or out of date. """
+        if self._index is None or self._index.devices is not self._devices or \
+           self._index.hidden is not self._hidden:
+            self._index = _DeviceIndex(self._devices, self._hidden, self)
+            self._invalidateViews()
+
+        return self._index
+
+    @property
+    def generation(self):
+        """ A counter that goes up whenever the tree's devices change.
+
+            Adding, removing, hiding and unhiding devices and changing their
+            names, uuids, labels, formats, parents or mountpoints all count
+            as changes.
+        """
+        return self._generation
+
+    def _invalidateViews(self):
+        """ Drop the cached views of the tree's devices. """
+        self._generation += 1
+        self._views.clear()
+
+    def _cachedView(self, name, build):
+        """ Return a view of the tree's devices, building it if needed.
+
+            :param str name: the name of the view
+            :param build: a function returning the view
+            :returns: the view returned by build, possibly on an earlier call
+
+            Views are cached until the next change of the tree (see
+            :attr:`generation`), so they must not be modified.
+        """
+        # the index has to be watching for attribute changes before anything
+        # derived from those attributes is cached
+        self._deviceIndex # pylint: disable=pointless-statement
+        view = self._views.get(name)
+        if view is None:
+            view = build()
+            self._views[name] = view
+
+        return view
+
+    def attributeChanged(self, obj, attr):
+        """ Update the lookup index after an indexed attribute has changed.
+
+            :param obj: the device or format whose attribute changed
+            :param str attr: the name of the attribute that changed
+
+            This is called via :func:`~.util.notify_attribute_changed`.
+        """
+        if self._index is None:
+            return
+
+        device = self._index.owner(obj)
+        if device is None:
+            return
+
+        self._invalidateViews()
+        self._index.update(device)
+        if attr in ("name", "parents") and not device.isleaf:
+            # the names and paths of some devices (eg: lvs, btrfs subvolumes)
+            # are derived from those of their parents
+            for dependent in self.getDependentDevices(device):
+                self._index.update(dependent)
+
     def setDiskImages(self, images):
         """ Set the disk images and reflect them in exclusiveDisks.
 
@@ -158,15 +530,39 @@ class DeviceTree(object):
     @property
     def lvInfo(self):
         if self._lvs_cache is None:
-            lvs = blockdev.lvm.lvs()
-            self._lvs_cache = dict(("%s-%s" % (lv.vg_name, lv.lv_name), lv) for lv in lvs) # pylint: disable=attribute-defined-outside-init
+            self._cacheLVInfo()
 
         return self._lvs_cache
 
+    def getVGLVInfo(self, vg_name):
+        """ Return the cached lvm information about the LVs in a VG.
+
+            :param str vg_name: name of the VG
+            :returns: dict of full LV names ("vg-lv") to LV information
+            :rtype: dict of str to :class:`~.devicelibs.lvm.LVInfo`
+        """
+        if self._vg_lvs_cache is None:
+            self._cacheLVInfo()
+
+        return self._vg_lvs_cache.get(vg_name, {})
+
+    def _cacheLVInfo(self):
+        """ Cache the information about all LVs from a single lvs report. """
+        lvs_cache = {}
+        vg_lvs_cache = {}
+        for lv in lvm.lvs():
+            name = "%s-%s" % (lv.vg_name, lv.lv_name)
+            lvs_cache[name] = lv
+            vg_lvs_cache.setdefault(lv.vg_name, {})[name] = lv
+
+        self._lvs_cache = lvs_cache # pylint: disable=attribute-defined-outside-init
+        self._vg_lvs_cache = vg_lvs_cache # pylint: disable=attribute-defined-outside-init
+
     def dropLVMCache(self):
         """ Drop cached lvm information. """
         self._pvs_cache = None # pylint: disable=attribute-defined-outside-init
         self._lvs_cache = None # pylint: disable=attribute-defined-outside-init
+        self._vg_lvs_cache = None # pylint: disable=attribute-defined-outside-init
 
     def _addDevice(self, newdev, new=True):
         """ Add a device to the tree.
@@ -177,17 +573,21 @@ class DeviceTree(object):
             Raise ValueError if the device's identifier is already
             in the list.
         """
-        if newdev.uuid and newdev.uuid in [d.uuid for d in self._devices] and \
-           not isinstance(newdev, NoDevice):
+        index = self._deviceIndex
+        if newdev.uuid and not isinstance(newdev, NoDevice) and \
+           any(d.uuid == newdev.uuid and not index.isHidden(d)
+               for d in index.candidates("uuid", newdev.uuid)):
             raise ValueError("device is already in tree")
 
         # make sure this device's parent devices are in the tree already
         for parent in newdev.parents:
-            if parent not in self._devices:
+            if index.isHidden(parent) is not False:
                 raise DeviceTreeError("parent device not in tree")
 
         newdev.addHook(new=new)
         self._devices.append(newdev)
+        index.add(newdev)
+        self._invalidateViews()
 
         # don't include "req%d" partition names
         if ((newdev.type != "partition" or
@@ -233,6 +633,8 @@ class DeviceTree(object):
                         device.updateName()
 
         self._devices.remove(dev)
+        self._deviceIndex.remove(dev)
+        self._invalidateViews()
         if dev.name in self.names and getattr(dev, "complete", True):
             self.names.remove(dev.name)
         log.info("removed %s %s (id %d) from device tree", dev.type,
@@ -312,7 +714,8 @@ class DeviceTree(object):
             self._removeDevice(action.device)
         elif action.isCreate and action.isFormat:
             if isinstance(action.device.format, formats.fs.FS) and \
-               action.device.format.mountpoint in self.filesystems:
+               action.device.format.mountpoint in \
+               self._cachedView("filesystems", self._filesystems):
                 raise DeviceTreeError("mountpoint already in use")
 
         # apply the action before adding it in case apply raises an exception
@@ -384,25 +787,15 @@ class DeviceTree(object):
             :type dep: :class:`~.devices.StorageDevice`
             :keyword bool hidden: include hidden devices in search
         """
-        dependents = []
         log_method_call(self, dep=dep, hidden=hidden)
 
-        # don't bother looping looking for dependents if this is a leaf device
+        # don't bother looking for dependents if this is a leaf device
         # XXX all hidden devices are leaves
         if dep.isleaf and not hidden:
             log.debug("dep is a leaf")
-            return dependents
-
-        devices = self._devices[:]
-        if hidden:
-            devices.extend(self._hidden)
+            return []
 
-        for device in devices:
-            log.debug("checking if %s depends on %s", device.name, dep.name)
-            if device.dependsOn(dep):
-                dependents.append(device)
-
-        return dependents
+        return self._deviceIndex.dependents(dep, hidden=hidden)
 
     def getRelatedDisks(self, disk):
         """ Return disks related to disk by container membership.
@@ -485,6 +878,8 @@ class DeviceTree(object):
         self._removeDevice(device, force=True, modparent=False)
 
         self._hidden.append(device)
+        self._deviceIndex.add(device, hidden=True)
+        self._invalidateViews()
         lvm.lvm_cc_addFilterRejectRegexp(device.name)
 
         if isinstance(device, DASDDevice):
@@ -516,6 +911,8 @@ class DeviceTree(object):
                                                           hidden.id)
                 self._hidden.remove(hidden)
                 self._devices.append(hidden)
+                self._deviceIndex.add(hidden)
+                self._invalidateViews()
                 hidden.addHook(new=False)
                 lvm.lvm_cc_removeFilterRejectRegexp(hidden.name)
                 if isinstance(device, DASDDevice):
@@ -542,7 +939,8 @@ class DeviceTree(object):
 
             Devices excluded via disk filtering (or because of disk images) are
             scanned just the rest, but then they are hidden at the end of this
-            process.
+            process. See :meth:`~.populator.Populator.populate` for how to
+            avoid scanning them at all.
         """
         udev.settle()
         self.dropLVMCache()
@@ -556,6 +954,57 @@ class DeviceTree(object):
         if flags.installer_mode:
             self.teardownAll()
 
+    def refresh(self, changed=None):
+        """ Update the tree to reflect changes to the system's devices.
+
+            :keyword changed: sysfs paths of devices that have been added,
+                              removed or changed
+            :type changed: list of str or None
+
+            Unlike :meth:`populate`, this only rescans the devices affected by
+            the changes and leaves the rest of the tree alone. If changed is
+            None, the devices that have appeared or disappeared are used. See
+            :meth:`~.populator.Populator.refresh`.
+
+            Devices with pending actions cannot be refreshed.
+        """
+        udev.settle()
+        self.dropLVMCache()
+        try:
+            self._populator.refresh(changed=changed)
+        finally:
+            self._hideIgnoredDisks()
+
+    def refreshFromMonitor(self, monitor, timeout=0):
+        """ Refresh the tree for the devices a udev monitor has events for.
+
+            :param monitor: the monitor
+            :type monitor: :class:`pyudev.Monitor` (see
+                           :func:`~.udev.get_monitor`)
+            :keyword timeout: seconds to wait for the first event, or None to
+                              wait indefinitely
+            :type timeout: float or None
+            :returns: sysfs paths of the devices that were refreshed
+            :rtype: list of str
+
+            Call this when the monitor has pending events, eg: when its file
+            descriptor becomes readable. All pending events are handled in
+            one refresh.
+        """
+        changed = []
+        device = monitor.poll(timeout=timeout)
+        while device is not None:
+            log.debug("udev event: %s %s", device.action, device.sys_path)
+            if device.sys_path not in changed:
+                changed.append(device.sys_path)
+
+            device = monitor.poll(timeout=0)
+
+        if changed:
+            self.refresh(changed=changed)
+
+        return changed
+
     def _isIgnoredDisk(self, disk):
         return ((self.ignoredDisks and disk.name in self.ignoredDisks) or
                 (self.exclusiveDisks and
@@ -563,42 +1012,129 @@ class DeviceTree(object):
 
     def _hideIgnoredDisks(self):
         # hide any subtrees that begin with an ignored disk
-        for disk in [d for d in self._devices if d.isDisk]:
-            if self._isIgnoredDisk(disk):
-                ignored = True
-                # If the filter allows all members of a fwraid or mpath, the
-                # fwraid or mpath itself is implicitly allowed as well. I don't
-                # like this very much but we have supported this usage in the
-                # past, so I guess we will support it forever.
-                if disk.parents and all(p.format.hidden for p in disk.parents):
-                    ignored = any(self._isIgnoredDisk(d) for d in disk.parents)
-
-                if ignored:
-                    self.hide(disk)
+        with lvm.lvm_cc_batch():
+            for disk in [d for d in self._devices if d.isDisk]:
+                if self._isIgnoredDisk(disk):
+                    ignored = True
+                    # If the filter allows all members of a fwraid or mpath,
+                    # the fwraid or mpath itself is implicitly allowed as well.
+                    # I don't like this very much but we have supported this
+                    # usage in the past, so I guess we will support it forever.
+                    if disk.parents and \
+                       all(p.format.hidden for p in disk.parents):
+                        ignored = any(self._isIgnoredDisk(d)
+                                      for d in disk.parents)
+
+                    if ignored:
+                        self.hide(disk)
+
+    def _dependencyLevels(self, devices):
+        """ Group devices and all of their ancestors by dependency level.
+
+            :param devices: the devices to start from
+            :type devices: list of :class:`~.devices.StorageDevice`
+            :returns: lists of devices, roots first
+            :rtype: list of lists
+
+            Each device is in the list after the one holding the last of its
+            parents, so the devices in a list do not depend on each other.
+        """
+        levels = {}
+        order = []
+        def level(device):
+            if id(device) not in levels:
+                levels[id(device)] = 1 + max([level(p) for p in device.parents]
+                                             or [-1])
+                order.append(device)
+
+            return levels[id(device)]
+
+        for device in devices:
+            level(device)
+
+        result = [[] for _i in range(max(levels.values()) + 1 if levels else 0)]
+        for device in order:
+            result[levels[id(device)]].append(device)
+
+        return result
+
+    def _processLevels(self, levels, fn):
+        """ Call fn for each device, one dependency level at a time.
+
+            :param levels: lists of devices as returned by
+                           :meth:`_dependencyLevels`, in the order to process
+                           them in
+            :param fn: a function taking a device
+
+            The devices of each level are processed concurrently by up to
+            :attr:`activationThreads` threads.
+        """
+        threads = min(self.activationThreads, max([len(l) for l in levels] or [0]))
+        if threads <= 1:
+            for devices in levels:
+                for device in devices:
+                    fn(device)
+
+            return
+
+        pool = ThreadPool(threads)
+        try:
+            for devices in levels:
+                pool.map(fn, devices)
+        finally:
+            pool.close()
+            pool.join()
 
     def teardownAll(self):
-        """ Run teardown methods on all devices. """
-        for device in self.leaves:
-            if device.protected:
-                continue
+        """ Run teardown methods on all devices.
+
+            Devices are torn down leaves first, one dependency level at a time
+            (see :meth:`_processLevels`), and each device is torn down once.
+            Protected leaves are left alone.
+        """
+        leaves = [d for d in self.leaves if not d.protected]
+        levels = [[d for d in devices if d.exists]
+                  for devices in reversed(self._dependencyLevels(leaves))]
 
+        def teardown(device):
             try:
-                device.teardown(recursive=True)
+                device.teardown()
             except (StorageError, blockdev.BlockDevError) as e:
                 log.info("teardown of %s failed: %s", device.name, e)
 
+        self._processLevels(levels, teardown)
+
     def teardownDiskImages(self):
         """ Tear down any disk image stacks. """
         self._populator.teardownDiskImages()
 
     def setupAll(self):
-        """ Run setup methods on all devices. """
-        for device in self.leaves:
+        """ Run setup methods on all devices.
+
+            Devices are set up roots first, one dependency level at a time
+            (see :meth:`_processLevels`), and each device is set up once.
+            Devices that do not exist yet are only tried if they are leaves.
+        """
+        leaves = self.leaves
+        leaf_ids = set(id(d) for d in leaves)
+        levels = [[d for d in devices if d.exists or id(d) in leaf_ids]
+                  for devices in self._dependencyLevels(leaves)]
+
+        def setup(device):
+            # the parents have been set up with the previous level, so only
+            # this device is set up, along with the formatting its children
+            # need (eg: LUKS) that setupParents would have set up
             try:
-                device.setup()
-            except DeviceError as e:
+                device.setup(recursive=False)
+                fmt = device.format
+                if id(device) not in leaf_ids and fmt.type and fmt.exists and \
+                   not fmt.mountable:
+                    fmt.setup()
+            except (DeviceError, DeviceFormatError) as e:
                 log.error("setup of %s failed: %s", device.name, e)
 
+        self._processLevels(levels, setup)
+
     def _filterDevices(self, incomplete=False, hidden=False):
         """ Return list of devices modified according to parameters.
 
@@ -617,6 +1153,36 @@ class DeviceTree(object):
             devices = (d for d in devices if getattr(d, "complete", True))
         return devices
 
+    def _findDevice(self, attr, values, match, incomplete=False, hidden=False,
+                    last=False):
+        """ Return the first indexed device that matches.
+
+            :param str attr: the indexed attribute to look up
+            :param values: attribute values to look up
+            :type values: list
+            :param match: a function that checks a candidate device
+            :param bool incomplete: include incomplete devices in search
+            :param bool hidden: include hidden devices in search
+            :param bool last: return the last match instead of the first
+            :returns: the first (or last) matching device found
+            :rtype: :class:`~.devices.Device`
+
+            Candidates are considered in the order :meth:`_filterDevices`
+            would return them.
+        """
+        index = self._deviceIndex
+        candidates = [d for d in index.candidates(attr, *values)
+                        if (hidden or not index.isHidden(d)) and
+                           (incomplete or getattr(d, "complete", True))]
+        if last:
+            candidates.reverse()
+
+        for device in candidates:
+            if match(device):
+                return device
+
+        return None
+
     def make_dasd_list(self, dasds, disks):
         """ Create a list of DASDs recognized by the system
 
@@ -665,8 +1231,9 @@ class DeviceTree(object):
         log_method_call(self, path=path, incomplete=incomplete, hidden=hidden)
         result = None
         if path:
-            devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
-            result = next((d for d in devices if d.sysfsPath == path), None)
+            result = self._findDevice("sysfsPath", [path],
+                                      lambda d: d.sysfsPath == path,
+                                      incomplete=incomplete, hidden=hidden)
         log_method_return(self, result)
         return result
 
@@ -682,8 +1249,9 @@ class DeviceTree(object):
         log_method_call(self, uuid=uuid, incomplete=incomplete, hidden=hidden)
         result = None
         if uuid:
-            devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
-            result = next((d for d in devices if d.uuid == uuid or d.format.uuid == uuid), None)
+            result = self._findDevice("uuid", [uuid],
+                                      lambda d: d.uuid == uuid or d.format.uuid == uuid,
+                                      incomplete=incomplete, hidden=hidden)
         log_method_return(self, result)
         return result
 
@@ -720,8 +1288,9 @@ class DeviceTree(object):
         log_method_call(self, label=label, incomplete=incomplete, hidden=hidden)
         result = None
         if label:
-            devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
-            result = next((d for d in devices if getattr(d.format, "label", None) == label), None)
+            result = self._findDevice("label", [label],
+                                      lambda d: getattr(d.format, "label", None) == label,
+                                      incomplete=incomplete, hidden=hidden)
         log_method_return(self, result)
         return result
 
@@ -737,10 +1306,11 @@ class DeviceTree(object):
         log_method_call(self, name=name, incomplete=incomplete, hidden=hidden)
         result = None
         if name:
-            devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
-            result = next((d for d in devices if d.name == name or \
-               (isinstance(d, _LVM_DEVICE_CLASSES) and d.name == name.replace("--","-"))),
-               None)
+            lvm_name = name.replace("--","-")
+            result = self._findDevice("name", [name, lvm_name],
+                                      lambda d: d.name == name or \
+               (isinstance(d, _LVM_DEVICE_CLASSES) and d.name == lvm_name),
+                                      incomplete=incomplete, hidden=hidden)
         log_method_return(self, result)
         return result
 
@@ -759,14 +1329,16 @@ class DeviceTree(object):
         log_method_call(self, path=path, incomplete=incomplete, hidden=hidden)
         result = None
         if path:
-            devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
+            lvm_path = path.replace("--","-")
 
             # The usual order of the devices list is one where leaves are at
             # the end. So that the search can prefer leaves to interior nodes
-            # the list that is searched is the reverse of the devices list.
-            result = next((d for d in reversed(list(devices)) if d.path == path or \
-               (isinstance(d, _LVM_DEVICE_CLASSES) and d.path == path.replace("--","-"))),
-               None)
+            # the search starts at the end of the devices list.
+            result = self._findDevice("path", [path, lvm_path],
+                                      lambda d: d.path == path or \
+               (isinstance(d, _LVM_DEVICE_CLASSES) and d.path == lvm_path),
+                                      incomplete=incomplete, hidden=hidden,
+                                      last=True)
 
         log_method_return(self, result)
         return result
@@ -811,41 +1383,63 @@ class DeviceTree(object):
             :rtype: :class:`~.devices.Device`
         """
         log_method_call(self, id_num=id_num, incomplete=incomplete, hidden=hidden)
-        devices = self._filterDevices(incomplete=incomplete, hidden=hidden)
-        result = next((d for d in devices if d.id == id_num), None)
+        result = self._findDevice("id", [id_num], lambda d: d.id == id_num,
+                                  incomplete=incomplete, hidden=hidden)
         log_method_return(self, result)
         return result
 
-    @property
-    def devices(self):
-        """ List of devices currently in the tree """
+    def _completeDevices(self):
+        """ Return the complete devices and the completeness of each device
+            that can be incomplete.
+        """
         devices = []
+        completeness = []
+        uuids = set()
         for device in self._devices:
-            if not getattr(device, "complete", True):
+            complete = getattr(device, "complete", None)
+            if complete is not None:
+                completeness.append((device, complete))
+
+            if complete is False:
                 continue
 
-            if device.uuid and device.uuid in [d.uuid for d in devices] and \
-               not isinstance(device, NoDevice):
-                raise DeviceTreeError("duplicate uuids in device tree")
+            if device.uuid and not isinstance(device, NoDevice):
+                if device.uuid in uuids:
+                    raise DeviceTreeError("duplicate uuids in device tree")
+
+                uuids.add(device.uuid)
 
             devices.append(device)
 
-        return devices
+        return (devices, completeness)
+
+    @property
+    def devices(self):
+        """ List of devices currently in the tree """
+        (devices, completeness) = self._cachedView("devices",
+                                                   self._completeDevices)
+
+        # whether a device is complete can change without the tree being
+        # told, eg: when the pvs of a vg are found, so that is checked again
+        if any(device.complete != complete
+               for (device, complete) in completeness):
+            del self._views["devices"]
+            (devices, completeness) = self._cachedView("devices",
+                                                       self._completeDevices)
+
+        return devices[:]
+
+    def _filesystems(self):
+        return [d.format for d in self._cachedView("leaves", self._leaves)
+                if d.format and getattr(d.format, 'mountpoint', None)]
 
     @property
     def filesystems(self):
         """ List of filesystems. """
         #""" Dict with mountpoint keys and filesystem values. """
-        filesystems = []
-        for dev in self.leaves:
-            if dev.format and getattr(dev.format, 'mountpoint', None):
-                filesystems.append(dev.format)
+        return self._cachedView("filesystems", self._filesystems)[:]
 
-        return filesystems
-
-    @property
-    def uuids(self):
-        """ Dict with uuid keys and :class:`~.devices.Device` values. """
+    def _uuids(self):
         uuids = {}
         for dev in self._devices:
             try:
@@ -867,11 +1461,11 @@ class DeviceTree(object):
         return uuids
 
     @property
-    def labels(self):
-        """ Dict with label keys and Device values.
+    def uuids(self):
+        """ Dict with uuid keys and :class:`~.devices.Device` values. """
+        return self._cachedView("uuids", self._uuids).copy()
 
-            FIXME: duplicate labels are a possibility
-        """
+    def _labels(self):
         labels = {}
         for dev in self._devices:
             # don't include btrfs member devices
@@ -881,15 +1475,25 @@ class DeviceTree(object):
 
         return labels
 
+    @property
+    def labels(self):
+        """ Dict with label keys and Device values.
+
+            FIXME: duplicate labels are a possibility
+        """
+        return self._cachedView("labels", self._labels).copy()
+
+    def _leaves(self):
+        return [d for d in self._devices if d.isleaf]
+
     @property
     def leaves(self):
         """ List of all devices upon which no other devices exist. """
-        leaves = [d for d in self._devices if d.isleaf]
-        return leaves
+        return self._cachedView("leaves", self._leaves)[:]
 
     def getChildren(self, device):
         """ Return a list of a device's children. """
-        return [c for c in self._devices if device in c.parents]
+        return self._deviceIndex.children(device)
 
     def resolveDevice(self, devspec, blkidTab=None, cryptTab=None, options=None):
         """ Return the device matching the provided device specification.
@@ -917,14 +1521,14 @@ class DeviceTree(object):
             if ((uuid.startswith('"') and uuid.endswith('"')) or
                 (uuid.startswith("'") and uuid.endswith("'"))):
                 uuid = uuid[1:-1]
-            device = self.uuids.get(uuid)
+            device = self._cachedView("uuids", self._uuids).get(uuid)
         elif devspec.startswith("LABEL="):
             # device-by-label
             label = devspec.partition("=")[2]
             if ((label.startswith('"') and label.endswith('"')) or
                 (label.startswith("'") and label.endswith("'"))):
                 label = label[1:-1]
-            device = self.labels.get(label)
+            device = self._cachedView("labels", self._labels).get(label)
         elif re.match(r'(0x)?[A-Za-z0-9]{2}(p\d+)?$', devspec):
             # BIOS drive number
             spec = int(devspec, 16)
@@ -122,6 +122,9 @@ class DMError(StorageError):
 class MPathError(StorageError):
     pass
 
+class LVMError(StorageError):
+    pass
+
 class BTRFSError(StorageError):
     pass
 
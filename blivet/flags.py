@@ -20,9 +20,31 @@
 #
 
 import shlex
-import selinux
+
+def _boot_cmdline_flag(name, doc):
+    """ Return a property for a flag whose default depends on the boot
+        command line, which is read when the property is first used.
+    """
+    attr = "_%s" % name
+
+    def get(self):
+        self._read_boot_cmdline()
+        return getattr(self, attr)
+
+    def set(self, value):
+        self._read_boot_cmdline()
+        setattr(self, attr, value)
+
+    return property(get, set, doc=doc)
 
 class Flags(object):
+    # Querying SELinux and reading /proc/cmdline are put off until the flags
+    # that depend on them are used, so that importing blivet stays cheap.
+
+    multipath = _boot_cmdline_flag("multipath", "whether to use multipath")
+    dmraid = _boot_cmdline_flag("dmraid", "whether to use dmraid")
+    noiswmd = _boot_cmdline_flag("noiswmd", "whether to ignore isw md sets")
+
     def __init__(self):
         #
         # mode of operation
@@ -40,11 +62,11 @@ class Flags(object):
         #
         # enable/disable functionality
         #
-        self.selinux = selinux.is_selinux_enabled()
-        self.multipath = True
-        self.dmraid = True
+        self._selinux = None
+        self._multipath = True
+        self._dmraid = True
         self.ibft = True
-        self.noiswmd = False
+        self._noiswmd = False
 
         self.gfs2 = True
         self.jfs = True
@@ -60,15 +82,58 @@ class Flags(object):
         # backup metadata in /etc/lvm/{archive,backup}
         self.lvm_metadata_backup = True
 
+        # set to False to commit the partition table after every partition
+        # that is created or removed instead of once per run of consecutive
+        # partition actions on a disk
+        self.batch_partition_commits = True
+
+        # set to True to leave the devices excluded by ignoredDisks and
+        # exclusiveDisks out of the devicetree without scanning them instead
+        # of scanning them and hiding them once the tree has been populated
+        self.early_disk_filter = False
+
+        # maximum number of actions executed at the same time; actions that
+        # do not depend on each other and that share no disks or containers
+        # are executed concurrently if this is greater than one
+        self.action_threads = 1
+
         # whether to include nodev filesystems in the devicetree (only
         # meaningful when flags.installer_mode is False)
         self.include_nodev = False
 
-        self.boot_cmdline = {}
-
-        self.update_from_boot_cmdline()
+        self._boot_cmdline = None
         self.allow_imperfect_devices = True
 
+    def _get_selinux(self):
+        if self._selinux is None:
+            import selinux
+            self._selinux = selinux.is_selinux_enabled()
+
+        return self._selinux
+
+    def _set_selinux(self, value):
+        self._selinux = value
+
+    selinux = property(_get_selinux, _set_selinux,
+                       doc="whether SELinux is enabled")
+
+    def _read_boot_cmdline(self):
+        """ Read the boot command line unless that was done already. """
+        if self._boot_cmdline is None:
+            self._boot_cmdline = {}
+            self.update_from_boot_cmdline()
+
+    def _get_boot_cmdline(self):
+        self._read_boot_cmdline()
+        return self._boot_cmdline
+
+    def _set_boot_cmdline(self, value):
+        self._read_boot_cmdline()
+        self._boot_cmdline = value
+
+    boot_cmdline = property(_get_boot_cmdline, _set_boot_cmdline,
+                            doc="dict of the boot command line's options")
+
     def get_boot_cmdline(self):
         buf = open("/proc/cmdline").read().strip()
         args = shlex.split(buf)
@@ -28,7 +28,8 @@ from gi.repository import BlockDev as blockdev
 from ..util import notify_kernel
 from ..util import get_sysfs_path_by_name
 from ..util import run_program
-from ..util import ObjectID
+from ..util import ObjectID, JournaledObject
+from ..util import notify_attribute_changed
 from ..storage_log import log_method_call
 from ..errors import DeviceFormatError, FormatCreateError, FormatDestroyError, FormatSetupError
 from ..i18n import N_
@@ -137,7 +138,7 @@ def get_device_format_class(fmt_type):
 
     return fmt
 
-class DeviceFormat(ObjectID):
+class DeviceFormat(ObjectID, JournaledObject):
     """ Generic device format.
 
         This represents the absence of recognized formatting. That could mean a
@@ -182,6 +183,7 @@ class DeviceFormat(ObjectID):
         self._label = None
         self._options = None
         self._device = None
+        self._uuid = None
 
         self.device = kwargs.get("device")
         self.uuid = kwargs.get("uuid")
@@ -267,6 +269,7 @@ class DeviceFormat(ObjectID):
            This method is not intended to be overridden.
         """
         self._label = label
+        notify_attribute_changed(self, "label")
 
     def _getLabel(self):
         """The label for this filesystem.
@@ -315,6 +318,17 @@ class DeviceFormat(ObjectID):
                       lambda f,d: f._setDevice(d),
                       doc="Full path the device this format occupies")
 
+    def _setUuid(self, uuid):
+        self._uuid = uuid
+        notify_attribute_changed(self, "uuid")
+
+    def _getUuid(self):
+        return self._uuid
+
+    uuid = property(lambda f: f._getUuid(),
+                    lambda f,u: f._setUuid(u),
+                    doc="this format's UUID")
+
     @property
     def name(self):
         return self._name or self.type
@@ -27,6 +27,7 @@ import parted
 import _ped
 from ..errors import DiskLabelCommitError, InvalidDiskLabelError
 from .. import arch
+from .. import tracing
 from .. import udev
 from .. import util
 from ..flags import flags
@@ -69,6 +70,10 @@ class DiskLabel(DeviceFormat):
         self._alignment = None
         self._endAlignment = None
 
+        # see deferCommits
+        self._commitsDeferred = False
+        self._commitPending = False
+
         if self.partedDevice:
             # set up the parted objects and raise exception on failure
             self.updateOrigPartedDisk()
@@ -82,6 +87,24 @@ class DiskLabel(DeviceFormat):
            shallow=('_partedDevice', '_alignment', '_endAlignment'),
            duplicate=('_partedDisk', '_origPartedDisk'))
 
+    def _journalState(self):
+        """ Return this instance's state for a :class:`~.util.ChangeJournal`.
+
+            The parted disks are changed in place rather than replaced, so
+            they are duplicated.
+        """
+        state = util.journal_state(self)
+        duplicates = {}
+        for attr in ("_partedDisk", "_origPartedDisk"):
+            disk = state[attr]
+            if disk is not None:
+                if id(disk) not in duplicates:
+                    duplicates[id(disk)] = disk.duplicate()
+
+                state[attr] = duplicates[id(disk)]
+
+        return state
+
     def __repr__(self):
         s = DeviceFormat.__repr__(self)
         if flags.testing:
@@ -249,20 +272,66 @@ class DiskLabel(DeviceFormat):
         """ Commit the current partition table to disk and notify the OS. """
         log_method_call(self, device=self.device,
                         numparts=len(self.partitions))
+        if self._commitsDeferred:
+            log.debug("deferring commit of %s", self.device)
+            self._commitPending = True
+            return
+
         try:
-            self.partedDisk.commit()
+            with tracing.span(tracing.COMMIT, self.device):
+                self.partedDisk.commit()
         except parted.DiskException as msg:
             raise DiskLabelCommitError(msg)
         else:
             self.updateOrigPartedDisk()
             udev.settle()
 
+    @property
+    def commitsDeferred(self):
+        """ Whether calls to :meth:`commit` are being held back. """
+        return self._commitsDeferred
+
+    @property
+    def commitPending(self):
+        """ Whether a call to :meth:`commit` was held back. """
+        return self._commitPending
+
+    def deferCommits(self):
+        """ Hold back calls to :meth:`commit` until :meth:`flushCommits`.
+
+            This allows several changes to the partition table to be written
+            out and picked up by the kernel at once.
+        """
+        log_method_call(self, device=self.device)
+        self._commitsDeferred = True
+
+    def flushCommits(self, write=True):
+        """ Stop deferring commits and carry out any that were held back.
+
+            :keyword bool write: False if the changes were already written to
+                                 disk via another copy of this partition table
+            :raises: :class:`~.errors.DiskLabelCommitError`
+        """
+        log_method_call(self, device=self.device, pending=self._commitPending,
+                        write=write)
+        self._commitsDeferred = False
+        if not self._commitPending:
+            return
+
+        if write:
+            self.commit()
+        else:
+            self.updateOrigPartedDisk()
+
+        self._commitPending = False
+
     def commitToDisk(self):
         """ Commit the current partition table to disk. """
         log_method_call(self, device=self.device,
                         numparts=len(self.partitions))
         try:
-            self.partedDisk.commitToDevice()
+            with tracing.span(tracing.COMMIT, self.device, {"notify": False}):
+                self.partedDisk.commitToDevice()
         except parted.DiskException as msg:
             raise DiskLabelCommitError(msg)
         else:
@@ -294,6 +363,7 @@ class DiskLabel(DeviceFormat):
                                          geometry=geometry)
 
         constraint = parted.Constraint(exactGeom=geometry)
+        util.record_change(self)
         self.partedDisk.addPartition(partition=new_partition,
                                      constraint=constraint)
 
@@ -303,6 +373,7 @@ class DiskLabel(DeviceFormat):
             :param partition: the partition to remove
             :type partition: :class:`parted.Partition`
         """
+        util.record_change(self)
         self.partedDisk.removePartition(partition)
 
     @property
@@ -23,6 +23,8 @@
 
 """ Filesystem classes. """
 from decimal import Decimal
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import tempfile
 
@@ -38,7 +40,7 @@ from ..tasks import fssize
 from ..tasks import fssync
 from ..tasks import fswritelabel
 from ..errors import FormatCreateError, FSError, FSReadLabelError
-from ..errors import FSWriteLabelError, FSResizeError
+from ..errors import FSWriteLabelError, FSResizeError, StorageError
 from . import DeviceFormat, register_device_format
 from .. import util
 from .. import platform
@@ -128,13 +130,12 @@ class FS(DeviceFormat):
         # Resize operations are limited to error-free filesystems whose current
         # size is known.
         self._resizable = False
-        if flags.installer_mode and self._resize.available:
-            # if you want current/min size you have to call updateSizeInfo
-            try:
-                self.updateSizeInfo()
-            except FSError:
-                log.warning("%s filesystem on %s needs repair", self.type,
-                                                                self.device)
+
+        # In installer mode current/min size are gathered the first time they
+        # are needed, see _ensureSizeInfo. Otherwise, if you want current/min
+        # size you have to call updateSizeInfo.
+        self._sizeInfoPending = (flags.installer_mode and self.exists and
+                                 self._resize.available)
 
         self._targetSize = self._size
 
@@ -196,6 +197,14 @@ class FS(DeviceFormat):
     label = property(lambda s: s._getLabel(), lambda s,l: s._setLabel(l),
        doc="this filesystem's label")
 
+    def _setMountpoint(self, mountpoint):
+        self._mountpoint = mountpoint
+        util.notify_attribute_changed(self, "mountpoint")
+
+    mountpoint = property(lambda s: s._mountpoint,
+                          lambda s,m: s._setMountpoint(m),
+                          doc="this filesystem's planned mountpoint")
+
     def _setTargetSize(self, newsize):
         """ Set a target size for this filesystem. """
         if not isinstance(newsize, Size):
@@ -219,6 +228,7 @@ class FS(DeviceFormat):
 
     def _getTargetSize(self):
         """ Get this filesystem's target size. """
+        self._ensureSizeInfo()
         return self._targetSize
 
     targetSize = property(_getTargetSize, _setTargetSize,
@@ -231,8 +241,51 @@ class FS(DeviceFormat):
     size = property(_getSize, doc="This filesystem's size, accounting "
                                   "for pending changes")
 
+    def _ensureSizeInfo(self):
+        """ Gather current and minimum size if that has been put off.
+
+            Running fsck and the info and min size tools takes a while, so
+            it is only done for filesystems whose size information is used.
+            See :func:`ensureSizeInfo` for gathering it for many filesystems
+            at once.
+        """
+        if not self._sizeInfoPending:
+            return
+
+        if not os.path.exists(self.device):
+            # the device is not set up, so leave the probes for later; see
+            # sizeInfoPending and ensureDeviceSizeInfo
+            log.debug("not probing %s filesystem on inactive device %s",
+                      self.type, self.device)
+            return
+
+        size = self._size
+        try:
+            self.updateSizeInfo()
+        except FSError:
+            log.warning("%s filesystem on %s needs repair", self.type,
+                                                            self.device)
+
+        # keep a target size somebody has set already
+        if self._targetSize == size:
+            self._targetSize = self._size
+
+    @property
+    def sizeInfoPending(self):
+        """ Whether current and minimum size are still to be gathered.
+
+            The probes are put off until the size information is first
+            needed and for as long as the device is not set up. Until then
+            :attr:`resizable`, :attr:`minSize`, :attr:`currentSize` and
+            :attr:`free` only report defaults. See
+            :func:`ensureDeviceSizeInfo`.
+        """
+        self._ensureSizeInfo()
+        return self._sizeInfoPending
+
     def updateSizeInfo(self):
         """ Update this filesystem's current and minimum size (for resize). """
+        self._sizeInfoPending = False
 
         #   This method ensures:
         #   * If there are fsck errors, self._resizable is False.
@@ -302,6 +355,7 @@ class FS(DeviceFormat):
         # If self._minInstanceSize is less than self._minSize,
         # but not 0, then there must be some mistake, so better to use
         # self._minSize.
+        self._ensureSizeInfo()
         return max(self._minInstanceSize, self._minSize)
 
     def _padSize(self, size):
@@ -327,6 +381,7 @@ class FS(DeviceFormat):
     @property
     def currentSize(self):
         """ The filesystem's current actual size. """
+        self._ensureSizeInfo()
         return self._size if self.exists else Size(0)
 
     @property
@@ -705,6 +760,7 @@ class FS(DeviceFormat):
     @property
     def resizable(self):
         """ Can formats of this filesystem type be resized? """
+        self._ensureSizeInfo()
         return super(FS, self).resizable and self._resize.available
 
     def _getOptions(self):
@@ -783,6 +839,79 @@ class FS(DeviceFormat):
 
         data.fsprofile = self.fsprofile or ""
 
+def ensureSizeInfo(filesystems, threads=None):
+    """ Gather the size information put off for filesystems concurrently.
+
+        :param filesystems: the filesystems
+        :type filesystems: list of :class:`FS`
+        :keyword int threads: maximum number of threads (default: cpu count)
+
+        Each filesystem's probes run fsck and other tools on its own device,
+        so the put off probes (see :meth:`FS._ensureSizeInfo`) of different
+        filesystems are run in a pool of threads. Filesystems whose size
+        information is already known are skipped.
+    """
+    # pylint: disable=protected-access
+    pending = []
+    seen = set()
+    for fmt in filesystems:
+        if fmt._sizeInfoPending and id(fmt) not in seen:
+            seen.add(id(fmt))
+            pending.append(fmt)
+
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+
+    threads = min(threads, len(pending))
+    if threads <= 1:
+        for fmt in pending:
+            fmt._ensureSizeInfo()
+        return
+
+    pool = ThreadPool(threads)
+    try:
+        pool.map(lambda fmt: fmt._ensureSizeInfo(), pending)
+    finally:
+        pool.close()
+        pool.join()
+
+def ensureDeviceSizeInfo(devices, threads=None):
+    """ Gather the size information put off for the filesystems on devices.
+
+        :param devices: the devices
+        :type devices: list of :class:`~.devices.StorageDevice`
+        :keyword int threads: maximum number of threads (default: cpu count)
+
+        The probes need the devices' nodes, so the devices whose filesystems
+        have not been probed yet are set up first. The devices set up here,
+        including their ancestors, are torn down again afterwards. See
+        :func:`ensureSizeInfo`.
+    """
+    # pylint: disable=protected-access
+    pending = [d for d in devices
+               if isinstance(d.format, FS) and d.format._sizeInfoPending]
+    inactive = set()
+    for device in pending:
+        inactive.update(a for a in device.ancestors if not a.status)
+        try:
+            device.setup()
+        except StorageError as e:
+            log.warning("failed to set up %s to probe its filesystem: %s",
+                        device.name, e)
+
+    try:
+        ensureSizeInfo([d.format for d in pending], threads=threads)
+    finally:
+        # a device has more ancestors than any of its ancestors, so this
+        # tears down the children first
+        for device in sorted(inactive, key=lambda d: len(d.ancestors),
+                             reverse=True):
+            try:
+                device.teardown()
+            except StorageError as e:
+                log.warning("failed to tear down %s after probing: %s",
+                            device.name, e)
+
 class Ext2FS(FS):
     """ ext2 filesystem. """
     _type = "ext2"
@@ -1179,6 +1308,9 @@ class TmpFS(NoDevFS):
 
     def __init__(self, **kwargs):
         NoDevFS.__init__(self, **kwargs)
+        # whether the default size is accepted depends on the size found
+        # here, so it is not put off
+        self._ensureSizeInfo()
         self._device = "tmpfs"
 
         # according to the following Kernel ML thread:
@@ -22,6 +22,7 @@
 
 from operator import gt, lt
 from decimal import Decimal
+from fractions import Fraction
 from gi.repository import BlockDev as blockdev
 import functools
 
@@ -32,7 +33,7 @@ from .flags import flags
 from .devices import Device, PartitionDevice, LUKSDevice, devicePathToName
 from .size import Size
 from .i18n import _
-from .util import stringize, unicodeize, compare
+from .util import stringize, unicodeize, compare, record_change
 
 import logging
 log = logging.getLogger("blivet")
@@ -305,6 +306,7 @@ def removeNewPartitions(disks, remove, all_partitions):
                 # these get removed last
                 continue
 
+            record_change(part.disk.format)
             part.disk.format.partedDisk.removePartition(part.partedPartition)
             part.partedPartition = None
             part.disk = None
@@ -316,6 +318,7 @@ def removeNewPartitions(disks, remove, all_partitions):
            (flags.installer_mode or
             extended not in (p.partedPartition for p in all_partitions)):
             log.debug("removing empty extended partition from %s", disk.name)
+            record_change(disk.format)
             disk.format.partedDisk.removePartition(extended)
 
 def addPartition(disklabel, free, part_type, size, start=None, end=None):
@@ -389,6 +392,7 @@ def addPartition(disklabel, free, part_type, size, start=None, end=None):
                                  type=part_type,
                                  geometry=new_geom)
     constraint = parted.Constraint(exactGeom=new_geom)
+    record_change(disklabel)
     disklabel.partedDisk.addPartition(partition=partition,
                                       constraint=constraint)
     return partition
@@ -554,6 +558,56 @@ def doPartitioning(storage):
                                         % {"format": part.format.name, "minSize": part.format.minSize,
                                             "maxSize": part.format.maxSize})
 
+def _diskGrowthKey(disk_path, partitions):
+    """ Return a key identifying the layout of new partitions on a disk.
+
+        :param str disk_path: the path of the disk
+        :param partitions: the new partitions allocated on the disk
+        :type partitions: list of :class:`~.devices.PartitionDevice`
+
+        Allocated partitions keep their geometry for the remainder of
+        :func:`allocatePartitions`, so the disk and the ids of the partitions
+        on it are enough to identify the layout.
+    """
+    return (disk_path, tuple(p.id for p in partitions))
+
+def _getDiskGrowth(disk, partitions, free):
+    """ Grow the new partitions on a disk and return the total growth.
+
+        :param disk: the disk
+        :type disk: :class:`~.devices.StorageDevice`
+        :param partitions: list of partitions
+        :type partitions: list of :class:`~.devices.PartitionDevice`
+        :param free: list of free regions
+        :type free: list of :class:`parted.Geometry`
+        :returns: the combined growth of the disk's requests, in sectors
+        :rtype: int
+    """
+    chunks = getDiskChunks(disk, partitions, free)
+
+    # grow all growable requests
+    disk_growth = 0 # in sectors
+    disk_sector_size = Size(disk.format.partedDevice.sectorSize)
+    for chunk in chunks:
+        chunk.growRequests()
+        # record the growth for this layout
+        disk_growth += chunk.growth
+        for req in chunk.requests:
+            log.debug("request %d (%s) growth: %d (%s) "
+                      "size: %s",
+                      req.device.id,
+                      req.device.name,
+                      req.growth,
+                      sectorsToSize(req.growth,
+                                    disk_sector_size),
+                      sectorsToSize(req.growth + req.base,
+                                    disk_sector_size))
+    log.debug("disk %s growth: %d (%s)",
+                    disk.path, disk_growth,
+                    sectorsToSize(disk_growth,
+                                  disk_sector_size))
+    return disk_growth
+
 def allocatePartitions(storage, disks, partitions, freespace):
     """ Allocate partitions based on requested features.
 
@@ -595,6 +649,10 @@ def allocatePartitions(storage, disks, partitions, freespace):
 
     removeNewPartitions(disks, new_partitions, partitions)
 
+    # growth (in sectors) of each disk layout evaluated so far, keyed by
+    # _diskGrowthKey
+    growth_cache = {}
+
     for _part in new_partitions:
         if _part.partedPartition and _part.isExtended:
             # ignore new extendeds as they are implicit requests
@@ -694,6 +752,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
                 if any([p.req_grow for p in allocated]):
                     log.debug("evaluating growth potential for new layout")
                     new_growth = 0
+                    prior_parts = new_partitions[:new_partitions.index(_part)]
                     for disk_path in disklabels.keys():
                         log.debug("calculating growth for disk %s", disk_path)
                         # Now we check, for growable requests, which of the two
@@ -701,7 +760,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
 
                         # set up chunks representing the disks' layouts
                         temp_parts = []
-                        for _p in new_partitions[:new_partitions.index(_part)]:
+                        for _p in prior_parts:
                             if _p.disk.path == disk_path:
                                 temp_parts.append(_p)
 
@@ -728,6 +787,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
                                              "extended partition for growth test")
                                     if new_part_type == parted.PARTITION_EXTENDED:
                                         e = disklabel.extendedPartition
+                                        record_change(disklabel)
                                         disklabel.partedDisk.removePartition(e)
 
                                     continue
@@ -749,39 +809,34 @@ def allocatePartitions(storage, disks, partitions, freespace):
                             _part.disk = _disk
                             temp_parts.append(_part)
 
-                        chunks = getDiskChunks(all_disks[disk_path],
-                                               temp_parts, freespace)
-
-                        # grow all growable requests
-                        disk_growth = 0 # in sectors
-                        disk_sector_size = Size(disklabels[disk_path].partedDevice.sectorSize)
-                        for chunk in chunks:
-                            chunk.growRequests()
-                            # record the growth for this layout
-                            new_growth += chunk.growth
-                            disk_growth += chunk.growth
-                            for req in chunk.requests:
-                                log.debug("request %d (%s) growth: %d (%s) "
-                                          "size: %s",
-                                          req.device.id,
-                                          req.device.name,
-                                          req.growth,
-                                          sectorsToSize(req.growth,
-                                                        disk_sector_size),
-                                          sectorsToSize(req.growth + req.base,
-                                                        disk_sector_size))
-                        log.debug("disk %s growth: %d (%s)",
-                                        disk_path, disk_growth,
-                                        sectorsToSize(disk_growth,
-                                                      disk_sector_size))
+                            new_growth += _getDiskGrowth(all_disks[disk_path],
+                                                         temp_parts, freespace)
+                            continue
+
+                        # The layout of any other disk does not depend on
+                        # where the current request goes, so its growth only
+                        # has to be recomputed when a partition has been
+                        # allocated on it since it was last evaluated.
+                        key = _diskGrowthKey(disk_path, temp_parts)
+                        if key not in growth_cache:
+                            growth_cache[key] = _getDiskGrowth(all_disks[disk_path],
+                                                               temp_parts,
+                                                               freespace)
+                        else:
+                            log.debug("disk %s growth unchanged: %d",
+                                      disk_path, growth_cache[key])
+
+                        new_growth += growth_cache[key]
 
                     if temp_part:
+                        record_change(disklabel)
                         disklabel.partedDisk.removePartition(temp_part)
                     _part.partedPartition = None
                     _part.disk = None
 
                     if new_part_type == parted.PARTITION_EXTENDED:
                         e = disklabel.extendedPartition
+                        record_change(disklabel)
                         disklabel.partedDisk.removePartition(e)
 
                     log.debug("total growth: %d sectors", new_growth)
@@ -1110,6 +1165,12 @@ class Chunk(object):
 
             Under uniform growth, all requests receive an equal portion of the
             free units.
+
+            The allotments are calculated by :func:`_fillPool` in a single
+            pass. Since the maximum growth of a request can depend on the
+            growth of other requests (see :meth:`DiskChunk.maxGrowth`), the
+            limits are enforced again afterwards and any units taken back are
+            handed out among the requests that can still grow.
         """
         log.debug("Chunk.growRequests: %r", self)
 
@@ -1117,69 +1178,109 @@ class Chunk(object):
         for req in self.requests:
             log.debug("req: %r", req)
 
-        # we use this to hold the base for the next loop through the
-        # chunk's requests since we want the base to be the same for
-        # all requests in any given growth iteration
-        new_base = self.base
-        last_pool = 0 # used to track changes to the pool across iterations
-        while not self.done and self.pool and last_pool != self.pool:
-            last_pool = self.pool    # to keep from getting stuck
-            self.base = new_base
-            if uniform:
-                growth = int(last_pool / self.remaining)
-
+        growing = [p for p in self.requests
+                   if not p.done and p not in self.skip_list]
+        while growing and self.pool > 0:
             log.debug("%d requests and %s (%s) left in chunk",
-                        self.remaining, self.pool, self.lengthToSize(self.pool))
-            for p in self.requests:
-                if p.done or p in self.skip_list:
-                    continue
+                        len(growing), self.pool, self.lengthToSize(self.pool))
 
-                if not uniform:
-                    # Each request is allocated free units from the pool
-                    # based on the relative _base_ sizes of the remaining
-                    # growable requests.
-                    share = Decimal(p.base) / Decimal(self.base)
-                    growth = int(share * last_pool) # truncate, don't round
+            weights = []
+            limits = []
+            for p in growing:
+                weights.append(1 if uniform else p.base)
+                max_growth = self.maxGrowth(p)
+                limits.append(max_growth - p.growth if max_growth else None)
 
+            amounts = _fillPool(self.pool, weights, limits)
+            for (p, growth) in zip(growing, amounts):
                 p.growth += growth
                 self.pool -= growth
                 log.debug("adding %s (%s) to %d (%s)",
                             growth, self.lengthToSize(growth),
                             p.device.id, p.device.name)
 
-                new_base = self.trimOverGrownRequest(p, base=new_base)
+            for p in growing:
+                self.base = self.trimOverGrownRequest(p, base=self.base)
                 log.debug("new grow amount for request %d (%s) is %s "
                           "units, or %s",
                             p.device.id, p.device.name, p.growth,
                             self.lengthToSize(p.growth))
 
-        if self.pool:
-            # allocate any leftovers in pool to the first partition
-            # that can still grow
-            for p in self.requests:
-                if p.done or p in self.skip_list:
-                    continue
-
-                growth = self.pool
-                p.growth += growth
-                self.pool = 0
-                log.debug("adding %s (%s) to %d (%s)",
-                            growth, self.lengthToSize(growth),
-                            p.device.id, p.device.name)
+            still_growing = [p for p in growing if not p.done]
+            if len(still_growing) == len(growing):
+                break
 
-                self.trimOverGrownRequest(p)
-                log.debug("new grow amount for request %d (%s) is %s "
-                          "units, or %s",
-                            p.device.id, p.device.name, p.growth,
-                            self.lengthToSize(p.growth))
-
-                if self.pool == 0:
-                    break
+            growing = still_growing
 
         # requests that were skipped over this time through are back on the
         # table next time
         self.skip_list = []
 
+def _fillPool(pool, weights, limits):
+    """ Divide a pool of units among requests in proportion to their weights.
+
+        :param int pool: the number of units to hand out
+        :param weights: the weight of each request
+        :type weights: list of int
+        :param limits: the most units each request can take (None for no limit)
+        :type limits: list of int or None
+        :returns: the number of units allotted to each request
+        :rtype: list of int
+
+        Requests whose limit is reached before the pool runs dry get exactly
+        their limit. They are found in order of the fill level at which they
+        reach it, and their units are taken out of the pool before the rest
+        of it is divided among the remaining requests. Units lost to
+        truncation go to the first requests in the list that can take them.
+    """
+    amounts = [0] * len(weights)
+    total = sum(weights)
+    remaining = pool
+
+    # the fill level at which each limited request reaches its limit
+    levels = []
+    for (i, limit) in enumerate(limits):
+        if limit is None:
+            continue
+
+        limit = max(limit, 0)
+        if weights[i]:
+            levels.append((Fraction(limit, weights[i]), i))
+        elif not limit:
+            levels.append((Fraction(0), i))
+
+    unlimited = set(range(len(weights)))
+    for (level, i) in sorted(levels):
+        if level * total > remaining:
+            # the pool runs out before this request reaches its limit
+            break
+
+        amounts[i] = max(limits[i], 0)
+        remaining -= amounts[i]
+        total -= weights[i]
+        unlimited.remove(i)
+
+    if total:
+        share_pool = remaining
+        for i in unlimited:
+            amounts[i] = weights[i] * share_pool // total
+            remaining -= amounts[i]
+
+    # allocate any leftovers in the pool to the first request that can
+    # still grow
+    for i in sorted(unlimited):
+        if not remaining:
+            break
+
+        extra = remaining
+        if limits[i] is not None:
+            extra = min(extra, limits[i] - amounts[i])
+
+        amounts[i] += extra
+        remaining -= extra
+
+    return amounts
+
 
 class DiskChunk(Chunk):
     """ A free region on disk from which partitions will be allocated """
@@ -1737,6 +1838,7 @@ def growPartitions(disks, partitions, free, size_sets=None):
                 log.debug("setting %s new geometry: %s", name,
                                                          partition.geometry)
                 constraint = parted.Constraint(exactGeom=partition.geometry)
+                record_change(disklabel)
                 disklabel.partedDisk.addPartition(partition=partition,
                                                   constraint=constraint)
                 path = partition.path
@@ -25,6 +25,8 @@ import re
 import shutil
 import pprint
 import copy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import parted
 
 from gi.repository import BlockDev as blockdev
@@ -47,7 +49,7 @@ from .devicelibs import raid
 from . import udev
 from . import util
 from .flags import flags
-from .storage_log import log_exception_info, log_method_call
+from .storage_log import log_exception_info, log_method_call, DeferredFormat
 from .i18n import _
 from .size import Size
 
@@ -117,6 +119,17 @@ class Populator(object):
 
         self._cleanup = False
 
+        # maximum number of threads used to probe devices, see _probeDevices
+        self.probeThreads = multiprocessing.cpu_count()
+
+        # results of probing devices, by sysfs path
+        self._probes = {}
+
+        # sysfs paths of devices excluded by the disk filters and uuids of the
+        # vgs and md arrays with members on them, see _excludeFilteredDevices
+        self._excluded = set()
+        self._excludedContainers = set()
+
     def setDiskImages(self, images):
         """ Set the disk images and reflect them in exclusiveDisks.
 
@@ -197,6 +210,125 @@ class Populator(object):
     def _isIgnoredDisk(self, disk):
         return self.devicetree._isIgnoredDisk(disk)
 
+    def _udevSlaves(self, info):
+        """ Return the sysfs paths of a device's slaves. """
+        slave_dir = os.path.normpath("%s/slaves" % udev.device_get_sysfs_path(info))
+        try:
+            slave_names = os.listdir(slave_dir)
+        except OSError:
+            return []
+
+        return [os.path.realpath(os.path.join(slave_dir, slave_name))
+                for slave_name in slave_names]
+
+    def _excludeFilteredDevices(self, devices):
+        """ Find the devices excluded by the disk filters before scanning them.
+
+            :param devices: udevdb device entries
+            :type devices: list
+
+            This is only done if :attr:`~.flags.Flags.early_disk_filter` is
+            set. Whether a device is excluded is decided from udev data
+            alone, the way :meth:`~.DeviceTree._hideIgnoredDisks` decides
+            which disks to hide after scanning: a disk without slaves is
+            excluded if the filters ignore it, and everything else is
+            excluded if any of its slaves, or the disk it is a partition of,
+            is excluded. The members of a multipath or fwraid disk in
+            exclusiveDisks are exclusive as well.
+
+            Members of a vg or md array on disks that are not excluded are
+            still scanned when the vg or array also has members on excluded
+            disks, but the vg or array is not set up from them, the same way
+            hiding the excluded disks after scanning would hide it.
+
+            Devices whose status cannot be told from udev data, like members
+            of fwraid sets and loop devices, are scanned and left to be
+            hidden after scanning as before.
+        """
+        if not flags.early_disk_filter or \
+           not (self.ignoredDisks or self.exclusiveDisks):
+            return
+
+        infos = dict((udev.device_get_sysfs_path(info), info) for info in devices)
+        parents = {}
+        for (path, info) in infos.items():
+            parents[path] = self._udevSlaves(info)
+            if udev.device_is_partition(info):
+                parents[path].append(os.path.dirname(path))
+
+        # members of exclusive multipath and fwraid disks are exclusive too
+        members = set()
+        todo = [path for (path, info) in infos.items()
+                if parents[path] and self.udevDeviceIsDisk(info) and
+                udev.device_get_name(info) in self.exclusiveDisks]
+        while todo:
+            for parent in parents.get(todo.pop(), []):
+                if parent not in members:
+                    members.add(parent)
+                    todo.append(parent)
+
+        results = {}
+        def excluded(path):
+            if path in self._excluded:
+                return True
+
+            info = infos.get(path)
+            if info is None:
+                return False
+
+            if path in results:
+                return results[path]
+
+            if parents[path]:
+                result = any(excluded(p) for p in parents[path])
+            elif not self.udevDeviceIsDisk(info) or udev.device_is_loop(info) or \
+                 udev.device_is_biosraid_member(info):
+                result = False
+            else:
+                name = udev.device_get_name(info)
+                result = (name in self.ignoredDisks or
+                          (bool(self.exclusiveDisks) and
+                           name not in self.exclusiveDisks and
+                           path not in members))
+
+            results[path] = result
+            if result:
+                self._excluded.add(path)
+
+            return result
+
+        for path in infos:
+            excluded(path)
+
+        pvs = None
+        for (path, info) in infos.items():
+            if path not in self._excluded:
+                continue
+
+            fmt = udev.device_get_format(info)
+            if fmt == "LVM2_member":
+                if pvs is None:
+                    pvs = dict((devicePathToName(pv_name), pv) for (pv_name, pv)
+                               in self.devicetree.pvInfo.items())
+
+                pv_info = pvs.get(udev.device_get_name(info))
+                if pv_info and pv_info.vg_uuid:
+                    self._excludedContainers.add(pv_info.vg_uuid)
+            elif fmt == "linux_raid_member":
+                md_uuid = udev.device_get_uuid(info)
+                if md_uuid:
+                    self._excludedContainers.add(md_uuid)
+
+    def _isExcluded(self, info):
+        """ Return True if the disk filters exclude the device.
+
+            :param info: udevdb device entry
+            :type info: dict
+
+            See :meth:`_excludeFilteredDevices`.
+        """
+        return udev.device_get_sysfs_path(info) in self._excluded
+
     def udevDeviceIsDisk(self, info):
         """ Return True if the udev device looks like a disk.
 
@@ -603,9 +735,74 @@ class Populator(object):
         self.devicetree._addDevice(device)
         return device
 
+    def _probeDevice(self, info):
+        """ Gather information about a device before adding it to the tree.
+
+            :param info: udevdb device entry
+            :returns: the information, by sysfs path
+            :rtype: dict
+
+            This runs in a worker thread (see :meth:`_probeDevices`), so it
+            must not change the tree or any other shared state. Disklabels
+            and multipath membership are read by the handlers since libparted
+            and libblockdev's mpath plugin may only be used by one thread.
+        """
+        probe = {}
+        sysfs_path = udev.device_get_sysfs_path(info)
+        try:
+            # reading a property makes libudev load the device's database
+            # entry, which also holds what blkid found on the device
+            udev.device_get_format(info)
+            if self.udevDeviceIsDisk(info):
+                probe["ro"] = util.get_sysfs_attr(sysfs_path, "ro")
+        except Exception: # pylint: disable=broad-except
+            # anything not probed here will be read again by the handlers
+            log_exception_info(fmt_str="probing %s failed",
+                               fmt_args=[sysfs_path])
+
+        return probe
+
+    def _probeDevices(self, devices):
+        """ Probe devices concurrently before adding them to the tree.
+
+            :param devices: udevdb device entries
+            :type devices: list
+
+            Loading the udev database entries and reading sysfs attributes
+            blocks on I/O, so it is done for all of the devices at once in a
+            pool of up to :attr:`probeThreads` threads. The devices are then
+            added to the tree one at a time, in order, using the results.
+        """
+        threads = min(self.probeThreads, len(devices))
+        if threads <= 1:
+            return
+
+        pool = ThreadPool(threads)
+        try:
+            probes = pool.map(self._probeDevice, devices)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (info, probe) in zip(devices, probes):
+            self._probes[udev.device_get_sysfs_path(info)] = probe
+
+    def _dropProbes(self):
+        """ Forget all results of probing devices. """
+        self._probes = {}
+
+    def _getReadOnly(self, info):
+        sysfs_path = udev.device_get_sysfs_path(info)
+        probe = self._probes.get(sysfs_path, {})
+        if "ro" in probe:
+            return probe["ro"]
+
+        return util.get_sysfs_attr(sysfs_path, 'ro')
+
     def addUdevDevice(self, info):
         name = udev.device_get_name(info)
-        log_method_call(self, name=name, info=pprint.pformat(dict(info)))
+        log_method_call(self, name=name,
+                        info=DeferredFormat(lambda: pprint.pformat(dict(info))))
         uuid = udev.device_get_uuid(info)
         sysfs_path = udev.device_get_sysfs_path(info)
 
@@ -629,6 +826,12 @@ class Populator(object):
         if name not in self.names:
             self.names.append(name)
 
+        if self._isExcluded(info):
+            log.info("skipping %s (%s), excluded by the disk filters",
+                     name, sysfs_path)
+            lvm.lvm_cc_addFilterRejectRegexp(name)
+            return
+
         if self.isIgnored(info):
             log.info("ignoring %s (%s)", name, sysfs_path)
             if name not in self.ignoredDisks:
@@ -717,7 +920,7 @@ class Populator(object):
 
         # If this device is read-only, mark it as such now.
         if self.udevDeviceIsDisk(info) and \
-                util.get_sysfs_attr(udev.device_get_sysfs_path(info), 'ro') == '1':
+                self._getReadOnly(info) == '1':
             device.readonly = True
 
         # If this device is protected, mark it as such now. Once the tree
@@ -850,8 +1053,7 @@ class Populator(object):
     def handleVgLvs(self, vg_device):
         """ Handle setup of the LV's in the vg_device. """
         vg_name = vg_device.name
-        lv_info = dict((k, v) for (k, v) in iter(self.devicetree.lvInfo.items())
-                                if v.vg_name == vg_name)
+        lv_info = self.devicetree.getVGLVInfo(vg_name)
 
         self.names.extend(n for n in lv_info.keys() if n not in self.names)
 
@@ -906,7 +1108,7 @@ class Populator(object):
 
             if lv_attr[0] in 'Ss':
                 log.info("found lvm snapshot volume '%s'", name)
-                origin_name = blockdev.lvm.lvorigin(vg_name, lv_name)
+                origin_name = lv.origin
                 if not origin_name:
                     log.error("lvm snapshot '%s-%s' has unknown origin",
                                 vg_name, lv_name)
@@ -956,11 +1158,11 @@ class Populator(object):
                 lv_class = LVMThinPoolDevice
             elif lv_attr[0] == 'V':
                 # thin volume
-                pool_name = blockdev.lvm.thlvpoolname(vg_name, lv_name)
+                pool_name = lv.pool_lv
                 pool_device_name = "%s-%s" % (vg_name, pool_name)
                 addRequiredLV(pool_device_name, "failed to look up thin pool")
 
-                origin_name = blockdev.lvm.lvorigin(vg_name, lv_name)
+                origin_name = lv.origin
                 if origin_name:
                     origin_device_name = "%s-%s" % (vg_name, origin_name)
                     addRequiredLV(origin_device_name, "failed to locate origin lv")
@@ -1040,6 +1242,11 @@ class Populator(object):
             log.info("lvm pv %s has no vg", device.name)
             return
 
+        if vg_uuid in self._excludedContainers:
+            log.info("not setting up vg %s, which has pvs on ignored disks",
+                     vg_name)
+            return
+
         vg_device = self.getDeviceByUuid(vg_uuid, incomplete=True)
         if vg_device:
             vg_device.parents.append(device)
@@ -1083,6 +1290,11 @@ class Populator(object):
         # Use mdadm info if udev info is missing
         md_uuid = md_info.uuid
         device.format.mdUuid = device.format.mdUuid or md_uuid
+        if device.format.mdUuid in self._excludedContainers:
+            log.info("not setting up md array %s, which has members on "
+                     "ignored disks", device.format.mdUuid)
+            return
+
         md_array = self.getDeviceByUuid(device.format.mdUuid, incomplete=True)
 
         if md_array:
@@ -1523,7 +1735,9 @@ class Populator(object):
 
             Devices excluded via disk filtering (or because of disk images) are
             scanned just the rest, but then they are hidden at the end of this
-            process.
+            process, unless :attr:`~.flags.Flags.early_disk_filter` is set. In
+            that case the devices that can be told to be excluded from their
+            udev data are not scanned at all. Their names are still noted.
         """
         self.backupConfigs()
         if cleanupOnly:
@@ -1548,6 +1762,8 @@ class Populator(object):
             blockdev.mpath.set_friendly_names(flags.multipath_friendly_names)
 
         self.setupDiskImages()
+        self._excluded = set()
+        self._excludedContainers = set()
 
         # mark the tree as unpopulated so exception handlers can tell the
         # exception originated while finding storage devices
@@ -1580,7 +1796,7 @@ class Populator(object):
         # blocks or since previous iterations.
         while True:
             devices = []
-            new_devices = udev.get_devices()
+            new_devices = udev.get_devices(settle_first=True)
 
             for new_device in new_devices:
                 new_name = udev.device_get_name(new_device)
@@ -1593,8 +1809,13 @@ class Populator(object):
                 break
 
             log.info("devices to scan: %s", [udev.device_get_name(d) for d in devices])
-            for dev in devices:
-                self.addUdevDevice(dev)
+            self._excludeFilteredDevices(new_devices)
+            self._probeDevices([d for d in devices if not self._isExcluded(d)])
+            try:
+                for dev in devices:
+                    self.addUdevDevice(dev)
+            finally:
+                self._dropProbes()
 
         self.populated = True
 
@@ -1602,6 +1823,116 @@ class Populator(object):
         # inconsistencies are ignored or resolved.
         self._handleInconsistencies()
 
+    def refresh(self, changed=None):
+        """ Update the tree for devices that have been added, removed or
+            changed since the tree was populated.
+
+            :keyword changed: sysfs paths of devices that changed
+            :type changed: list of str or None
+
+            If changed is None, devices that have appeared or disappeared
+            are looked up by comparing the system's devices to the tree's.
+
+            Only the affected parts of the tree are rescanned. A changed
+            device that is in the tree is rescanned along with the disks it
+            lives on, everything that depends on them and all disks related
+            to those by container membership. Other changed devices are added
+            as they would be by :meth:`populate`.
+        """
+        parted.register_exn_handler(parted_exn_handler)
+        try:
+            self._refresh(changed)
+        finally:
+            parted.clear_exn_handler()
+
+    def _refreshRoots(self, device):
+        """ Return the disks to rescan because device changed. """
+        roots = set(device.disks)
+        roots.update(self.devicetree.getRelatedDisks(device))
+        if device.isDisk:
+            roots.add(device)
+
+        # rescanning a disk drops everything on it, so all disks sharing
+        # a container with it have to be rescanned as well
+        todo = list(roots)
+        while todo:
+            disk = todo.pop()
+            for related in self.devicetree.getRelatedDisks(disk):
+                if related not in roots:
+                    roots.add(related)
+                    todo.append(related)
+
+        return roots
+
+    def _refresh(self, changed):
+        log.info("DeviceTree.refresh: changed is %s", changed)
+        if changed is None:
+            changed = [d.sysfsPath for d in self.devicetree.devices
+                       if d.exists and d.sysfsPath and
+                       not os.path.exists(d.sysfsPath)]
+            changed.extend(udev.device_get_sysfs_path(i)
+                           for i in udev.get_devices(settle_first=True)
+                           if udev.device_get_name(i) not in self.names)
+
+        roots = set()
+        new_paths = []
+        for path in changed:
+            device = self.devicetree.getDeviceBySysfsPath(path)
+            if device is None:
+                if path not in new_paths:
+                    new_paths.append(path)
+            else:
+                roots.update(self._refreshRoots(device))
+
+        # list the disks and everything on them in tree order
+        affected = set(roots)
+        for disk in roots:
+            affected.update(self.devicetree.getDependentDevices(disk))
+        affected = [d for d in self.devicetree.devices if d in affected]
+
+        for action in self.devicetree.actions.find():
+            if any(action.device is d or action.device.dependsOn(d)
+                   for d in roots):
+                raise DeviceTreeError("cannot refresh %s with pending actions"
+                                      % action.device.name)
+
+        rescan = [d.sysfsPath for d in affected if d.sysfsPath]
+        rescan.extend(p for p in new_paths if p not in rescan)
+        log.info("devices to rescan: %s", rescan)
+
+        disks = [d for d in affected if d in roots]
+        for disk in disks:
+            self.devicetree.recursiveRemove(disk, actions=False)
+            if disk.sysfsPath and not os.path.exists(disk.sysfsPath):
+                self.devicetree._removeDevice(disk)
+
+        devices = []
+        for path in rescan:
+            if not os.path.exists(path):
+                log.info("%s has been removed", path)
+                continue
+
+            info = udev.get_device(path)
+            if info is not None:
+                devices.append(info)
+
+        self._excluded = set()
+        self._excludedContainers = set()
+        if flags.early_disk_filter:
+            self._excludeFilteredDevices(udev.get_devices())
+        self._probeDevices([d for d in devices if not self._isExcluded(d)])
+        try:
+            for info in devices:
+                self.addUdevDevice(info)
+        finally:
+            self._dropProbes()
+
+        for disk in disks:
+            if disk in self.devicetree.devices:
+                disk.originalFormat = copy.copy(disk.format)
+
+        self._handleInconsistencies()
+
     @property
     def names(self):
         return self.devicetree.names
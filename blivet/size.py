@@ -23,7 +23,8 @@ import re
 import string           # pylint: disable=deprecated-module
 import locale
 import sys
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict
 
 from decimal import Decimal
 from decimal import InvalidOperation
@@ -92,6 +93,53 @@ def _lowerASCII(s):
         s = s.decode(sys.getdefaultencoding())
     return s.translate(_ASCIIlower_table) # pylint: disable=no-member
 
+class _LRUCache(object):
+    """ A thread-safe mapping that keeps only the most recently used items. """
+
+    def __init__(self, maxsize):
+        """
+            :param int maxsize: the maximum number of items to keep
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value for key, or None if it is not in the cache. """
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+
+            return value
+
+    def set(self, key, value):
+        """ Add or replace the value for key. """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+# parsed size specs and the default string representations of sizes, which
+# depend on the locale as well as on the spec or size
+_spec_cache = _LRUCache(1024)
+_str_cache = _LRUCache(1024)
+
+# unit spec tables, see _unitSpecs
+_unit_specs = {}
+
+def _localeKey():
+    """ Return a key for the locale settings that parsing and formatting
+        sizes depend on.
+    """
+    return (locale.setlocale(locale.LC_MESSAGES, None),
+            locale.nl_langinfo(locale.RADIXCHAR))
+
 def _makeSpec(prefix, suffix, xlate, lowercase=True):
     """ Synthesizes a whole word from prefix and suffix.
 
@@ -120,6 +168,31 @@ def unitStr(unit, xlate=False):
     """
     return _makeSpec(unit.abbr, _BYTES_SYMBOL, xlate, lowercase=False)
 
+def _unitSpecs(xlate):
+    """ Return tables of the lowercase specs of all units.
+
+        :param bool xlate: if True, use the specs for the current locale
+        :returns: a dict of whole specs to units and a list of pairs of
+                  binary abbreviations and units
+        :rtype: tuple of (dict, list)
+
+        The tables are built once for each locale.
+    """
+    key = locale.setlocale(locale.LC_MESSAGES, None) if xlate else None
+    specs = _unit_specs.get(key)
+    if specs is None:
+        whole = {}
+        for unit in [_EMPTY_PREFIX] + _BINARY_PREFIXES + _DECIMAL_PREFIXES:
+            # the first unit with a spec takes precedence
+            whole.setdefault(_makeSpec(unit.abbr, _BYTES_SYMBOL, xlate), unit)
+            for word in _BYTES_WORDS:
+                whole.setdefault(_makeSpec(unit.prefix, word, xlate), unit)
+
+        abbrs = [(_makeSpec(p.abbr, "", xlate), p) for p in _BINARY_PREFIXES]
+        specs = _unit_specs.setdefault(key, (whole, abbrs))
+
+    return specs
+
 def parseUnits(spec, xlate):
     """ Parse a unit specification and return corresponding factor.
 
@@ -143,14 +216,15 @@ def parseUnits(spec, xlate):
     else:
         spec = _lowerASCII(spec)
 
+    (whole, abbrs) = _unitSpecs(xlate)
+
     # Search for complete matches
-    for unit in [_EMPTY_PREFIX] + _BINARY_PREFIXES + _DECIMAL_PREFIXES:
-        if spec == _makeSpec(unit.abbr, _BYTES_SYMBOL, xlate) or \
-           spec in (_makeSpec(unit.prefix, s, xlate) for s in _BYTES_WORDS):
-            return unit
+    unit = whole.get(spec)
+    if unit is not None:
+        return unit
 
     # Search for unambiguous partial match among binary abbreviations
-    matches = [p for p in _BINARY_PREFIXES if _makeSpec(p.abbr, "", xlate).startswith(spec)]
+    matches = [p for (abbr, p) in abbrs if abbr.startswith(spec)]
     if len(matches) == 1:
         return matches[0]
 
@@ -168,11 +242,22 @@ def parseSpec(spec):
 
         Tries to parse the spec first as English, if that fails, as
         a locale specific string.
+
+        Results are cached, since the same specs are parsed over and over.
     """
 
     if not spec:
         raise ValueError("invalid size specification", spec)
 
+    key = (spec, _localeKey())
+    size = _spec_cache.get(key)
+    if size is None:
+        size = _parseSpec(spec)
+        _spec_cache.set(key, size)
+
+    return size
+
+def _parseSpec(spec):
     # Replace the localized radix character with a .
     radix = locale.nl_langinfo(locale.RADIXCHAR)
     if radix != '.':
@@ -241,13 +326,29 @@ def parseSpec(spec):
 
     raise ValueError("invalid size specification", spec)
 
+def _truncDiv(a, b):
+    """ Divide two integers, rounding toward zero as Decimal does. """
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def _fromBytes(value):
+    """ Return a new Size for an integral number of bytes. """
+    size = Decimal.__new__(Size, value)
+    size._bytes = value # pylint: disable=protected-access
+    return size
+
 class Size(Decimal):
     """ Common class to represent storage device and filesystem sizes.
         Can handle parsing strings such as 45MB or 6.7GB to initialize
         itself, or can be initialized with a numerical size in bytes.
         Also generates human readable strings to a specified number of
         decimal places.
+
+        The number of bytes is also kept as an int, which is used for
+        arithmetic with other sizes and integers. Arithmetic with any other
+        kind of number is done by :class:`~decimal.Decimal`.
     """
+    __slots__ = ("_bytes",)
 
     def __new__(cls, value=0, context=None):
         """ Initialize a new Size object.  Must pass a bytes or a spec value
@@ -267,23 +368,39 @@ class Size(Decimal):
             If you want to use a spec value to represent a bytes value,
             you can use the letter 'b' or 'B' or omit the size specifier.
         """
-        if isinstance(value, (six.string_types, bytes)):
-            size = parseSpec(value)
-        elif isinstance(value, (six.integer_types, float, Decimal)):
-            size = Decimal(value)
+        if isinstance(value, six.integer_types):
+            size = int(value)
         elif isinstance(value, Size):
-            size = Decimal(value.convertTo())
+            size = value._bytes
         else:
-            raise ValueError("invalid value %s for size" % value)
+            if isinstance(value, (six.string_types, bytes)):
+                size = parseSpec(value)
+            elif isinstance(value, (float, Decimal)):
+                size = Decimal(value)
+            else:
+                raise ValueError("invalid value %s for size" % value)
+
+            # drop any partial byte
+            try:
+                size = int(size.to_integral_value(rounding=ROUND_DOWN))
+            except (ValueError, OverflowError):
+                raise ValueError("invalid value %s for size" % value)
 
-        # drop any partial byte
-        size = size.to_integral_value(rounding=ROUND_DOWN)
         self = Decimal.__new__(cls, value=size, context=context)
+        self._bytes = size
         return self
 
     # Force str and unicode types since the translated sizespec may be unicode
     def _toString(self):
-        return self.humanReadable()
+        # sizes are converted to strings for nearly every log message, and
+        # mostly the same few sizes at that
+        key = (self._bytes, _localeKey())
+        string = _str_cache.get(key)
+        if string is None:
+            string = self.humanReadable()
+            _str_cache.set(key, string)
+
+        return string
 
     def __str__(self, eng=False, context=None):
         return stringize(self._toString())
@@ -295,27 +412,55 @@ class Size(Decimal):
         return "Size('%s')" % self
 
     def __deepcopy__(self, memo):
-        return Size(self.convertTo())
+        # sizes are immutable
+        return self
 
     # pickling support for Size
     # see https://docs.python.org/3/library/pickle.html#object.__reduce__
     def __reduce__(self):
-        return (self.__class__, (self.convertTo(),))
+        return (self.__class__, (self._bytes,))
 
     def __add__(self, other, context=None):
+        if isinstance(other, Size):
+            return _fromBytes(self._bytes + other._bytes)
+        elif isinstance(other, six.integer_types):
+            return _fromBytes(self._bytes + other)
+
         return Size(Decimal.__add__(self, other))
 
     # needed to make sum() work with Size arguments
     def __radd__(self, other, context=None):
+        if isinstance(other, six.integer_types):
+            return _fromBytes(other + self._bytes)
+
         return Size(Decimal.__radd__(self, other))
 
     def __sub__(self, other, context=None):
+        if isinstance(other, Size):
+            return _fromBytes(self._bytes - other._bytes)
+        elif isinstance(other, six.integer_types):
+            return _fromBytes(self._bytes - other)
+
         return Size(Decimal.__sub__(self, other))
 
     def __mul__(self, other, context=None):
+        if isinstance(other, Size):
+            return _fromBytes(self._bytes * other._bytes)
+        elif isinstance(other, six.integer_types):
+            return _fromBytes(self._bytes * other)
+
         return Size(Decimal.__mul__(self, other))
     __rmul__ = __mul__
 
+    def _divisor(self, other):
+        """ Return other as a non-zero int if it is a size or an integer. """
+        if isinstance(other, Size):
+            other = other._bytes
+        elif not isinstance(other, six.integer_types):
+            return None
+
+        return other or None
+
     def __div__(self, other, context=None):
         if six.PY2:
             # This still needs to be ignored by pylint, because it will get
@@ -325,12 +470,24 @@ class Size(Decimal):
             raise AttributeError
 
     def __truediv__(self, other, context=None):
+        divisor = self._divisor(other)
+        if divisor is not None:
+            return _fromBytes(_truncDiv(self._bytes, divisor))
+
         return Size(Decimal.__truediv__(self, other))
 
     def __floordiv__(self, other, context=None):
+        divisor = self._divisor(other)
+        if divisor is not None:
+            return _fromBytes(_truncDiv(self._bytes, divisor))
+
         return Size(Decimal.__floordiv__(self, other))
 
     def __mod__(self, other, context=None):
+        divisor = self._divisor(other)
+        if divisor is not None:
+            return _fromBytes(self._bytes - divisor * _truncDiv(self._bytes, divisor))
+
         return Size(Decimal.__mod__(self, other))
 
     def convertTo(self, spec=None):
@@ -340,7 +497,7 @@ class Size(Decimal):
             :returns: a numeric value in the units indicated by the specifier
             :rtype: Decimal
         """
-        return Decimal(self) / Decimal((spec or B).factor)
+        return Decimal(self._bytes) / Decimal((spec or B).factor)
 
     def humanReadable(self, max_places=2, strip=True, min_value=1, xlate=True):
         """ Return a string representation of this size with appropriate
@@ -429,9 +586,23 @@ class Size(Decimal):
 
         factor = getattr(unit, "factor", unit)
 
-        if factor == Size(0):
+        if factor == 0:
             return Size(0)
 
+        if isinstance(factor, Size):
+            factor = factor._bytes
+
+        if isinstance(factor, six.integer_types) and factor > 0:
+            (rounded, remainder) = divmod(abs(self._bytes), factor)
+            if remainder and (rounding == ROUND_UP or
+                              (rounding == ROUND_HALF_UP and 2 * remainder >= factor)):
+                rounded += 1
+
+            if self._bytes < 0:
+                rounded = -rounded
+
+            return _fromBytes(rounded * factor)
+
         factor = Decimal(factor)
         if factor < 0:
             raise ValueError("invalid rounding unit: %s" % factor)
@@ -1,4 +1,3 @@
-import inspect
 import logging
 import sys
 import traceback
@@ -6,20 +5,58 @@ import traceback
 log = logging.getLogger("blivet")
 log.addHandler(logging.NullHandler())
 
+IGNORED_FUNCS = frozenset(["function_name_and_depth",
+                           "log_method_call",
+                           "log_method_return"])
+
 def function_name_and_depth():
-    IGNORED_FUNCS = ["function_name_and_depth",
-                     "log_method_call",
-                     "log_method_return"]
-    stack = inspect.stack()
+    """ Return the name and stack depth of the first interesting caller.
+
+        This walks the frames directly since :func:`inspect.stack` reads the
+        source context of every frame in the stack, which is expensive.
+    """
+    frame = sys._getframe(1) # pylint: disable=protected-access
+    while frame is not None and frame.f_code.co_name in IGNORED_FUNCS:
+        frame = frame.f_back
+
+    if frame is None:
+        return ("unknown function?", 0)
+
+    methodname = frame.f_code.co_name
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+
+    return (methodname, depth)
+
+class DeferredFormat(object):
+    """ An argument for a log message that is only formatted when needed.
 
-    for i, frame in enumerate(stack):
-        methodname = frame[3]
-        if methodname not in IGNORED_FUNCS:
-            return (methodname, len(stack) - i)
+        Use this for arguments that are expensive to format, eg::
 
-    return ("unknown function?", 0)
+            log_method_call(self, info=DeferredFormat(pprint.pformat, info))
+
+        The function is called with the given arguments when the message is
+        actually emitted, which does not happen if debug logging is disabled.
+        It is only called once, however many handlers emit the message.
+    """
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._formatted = None
+
+    def __str__(self):
+        if self._formatted is None:
+            self._formatted = str(self.func(*self.args, **self.kwargs))
+
+        return self._formatted
 
 def log_method_call(d, *args, **kwargs):
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
@@ -39,6 +76,9 @@ def log_method_call(d, *args, **kwargs):
     log.debug(fmt, *fmt_args)
 
 def log_method_return(d, retval):
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
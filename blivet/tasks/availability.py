@@ -21,12 +21,10 @@
 
 import abc
 from distutils.version import LooseVersion
-import hawkey
 
 from six import add_metaclass
 
-from gi.repository import BlockDev as blockdev
-
+from .. import load_blockdev_plugins
 from .. import util
 from ..errors import AvailabilityError
 
@@ -141,6 +139,9 @@ class PackageMethod(Method):
             :rtype: LooseVersion
             :raises AvailabilityError: on failure to obtain package version
         """
+        # loading hawkey takes a while, so it is not done at import time
+        import hawkey
+
         sack = hawkey.Sack()
 
         try:
@@ -189,7 +190,7 @@ class BlockDevMethod(Method):
             :returns: [] if the name of the plugin is loaded
             :rtype: list of str
         """
-        if resource.name in blockdev.get_available_plugin_names():
+        if resource.name in load_blockdev_plugins([resource.name]):
             return []
         else:
             return ["libblockdev plugin %s not loaded" % resource.name]
@@ -266,6 +267,7 @@ FSCK_HFSPLUS_APP = application("fsck.hfsplus")
 HFORMAT_APP = application("hformat")
 JFSTUNE_APP = application("jfs_tune")
 KPARTX_APP = application("kpartx")
+LVM_APP = application("lvm")
 MKDOSFS_APP = application("mkdosfs")
 MKE2FS_APP = application_by_package("mke2fs", E2FSPROGS_PACKAGE)
 MKFS_BTRFS_APP = application("mkfs.btrfs")
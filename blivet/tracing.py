@@ -0,0 +1,254 @@
+# tracing.py
+# Timing of action execution.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU Lesser General Public License v.2, or (at your option) any later
+# version. This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY expressed or implied, including the implied
+# warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See
+# the GNU Lesser General Public License for more details.  You should have
+# received a copy of the GNU Lesser General Public License along with this
+# program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.  Any Red Hat trademarks
+# that are incorporated in the source code or documentation are not subject
+# to the GNU Lesser General Public License and may only be used or
+# replicated with the express permission of Red Hat, Inc.
+#
+
+"""
+Module recording where the execution of actions spends its time.
+
+While an :class:`ExecutionTrace` is active (see :func:`tracing`) the time
+spent setting up devices, running external programs, waiting for udev to
+settle and committing disklabels is recorded as :class:`TraceEvent` instances.
+Events are attributed to the action being executed by the thread they happen
+in (see :func:`action_span`). When no trace is active recording is a no-op.
+
+"""
+
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+SETUP = "setup"
+PROGRAM = "program"
+SETTLE = "settle"
+COMMIT = "commit"
+ACTION = "action"
+
+CATEGORIES = (SETUP, PROGRAM, SETTLE, COMMIT)
+""" Categories of events the time of an action is split into. """
+
+_trace = None
+_current = threading.local()
+
+class TraceEvent(object):
+    """ Something that took time while a trace was active. """
+
+    def __init__(self, category, name, start, duration, args=None):
+        """
+            :param str category: the kind of event, eg: :const:`PROGRAM`
+            :param str name: a description of the event
+            :param float start: the time the event started, in seconds
+            :param float duration: the time the event took, in seconds
+            :keyword dict args: additional information about the event
+        """
+        self.category = category
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.args = args or {}
+        self.thread = threading.current_thread().name
+
+    @property
+    def dict(self):
+        return {"category": self.category, "name": self.name,
+                "start": self.start, "duration": self.duration,
+                "thread": self.thread, "args": self.args}
+
+class ActionTrace(object):
+    """ The events that happened while an action was executed. """
+
+    def __init__(self, action):
+        """
+            :param action: the action
+            :type action: :class:`~.deviceaction.DeviceAction`
+        """
+        self.action = str(action)
+        self.actionId = action.id
+        self.start = time.time()
+        self.duration = None
+        self.events = []
+        self.thread = threading.current_thread().name
+
+    def durations(self):
+        """ Return the time spent on each category of events.
+
+            :returns: seconds, by category (see :const:`CATEGORIES`)
+            :rtype: dict
+
+            Events can be nested, eg: programs run by a device setup, so
+            their times are counted in each of the categories involved.
+        """
+        durations = dict((category, 0.0) for category in CATEGORIES)
+        for event in self.events:
+            durations[event.category] = (durations.get(event.category, 0.0) +
+                                         event.duration)
+
+        return durations
+
+    @property
+    def dict(self):
+        return {"action": self.action, "id": self.actionId,
+                "start": self.start, "duration": self.duration,
+                "thread": self.thread, "durations": self.durations(),
+                "events": [e.dict for e in self.events]}
+
+class ExecutionTrace(object):
+    """ The events that happened while actions were processed. """
+
+    def __init__(self):
+        self.start = time.time()
+        self.duration = None
+        self.actions = []
+        """ :class:`ActionTrace` for each executed action, in order """
+
+        self.events = []
+        """ :class:`TraceEvent` that happened outside of any action """
+
+        self._lock = threading.Lock()
+
+    def _addAction(self, action_trace):
+        with self._lock:
+            self.actions.append(action_trace)
+
+    def _addEvent(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    @property
+    def dict(self):
+        return {"start": self.start, "duration": self.duration,
+                "actions": [a.dict for a in self.actions],
+                "events": [e.dict for e in self.events]}
+
+    def toJSON(self, **kwargs):
+        """ Return the trace as a JSON document.
+
+            Keyword arguments are passed on to :func:`json.dumps`.
+        """
+        return json.dumps(self.dict, **kwargs)
+
+    def toChromeTrace(self, **kwargs):
+        """ Return the trace in the Chrome trace event format.
+
+            The result can be loaded into chrome://tracing or similar viewers.
+            Keyword arguments are passed on to :func:`json.dumps`.
+        """
+        threads = {}
+        def event(category, name, start, duration, thread, args):
+            tid = threads.setdefault(thread, len(threads) + 1)
+            return {"cat": category, "name": name, "ph": "X", "pid": 1,
+                    "tid": tid, "ts": int((start - self.start) * 1000000),
+                    "dur": int((duration or 0) * 1000000), "args": args}
+
+        events = []
+        for action_trace in self.actions:
+            events.append(event(ACTION, action_trace.action,
+                                action_trace.start, action_trace.duration,
+                                action_trace.thread,
+                                {"id": action_trace.actionId}))
+            events.extend(event(e.category, e.name, e.start, e.duration,
+                                e.thread, e.args)
+                          for e in action_trace.events)
+
+        events.extend(event(e.category, e.name, e.start, e.duration, e.thread,
+                            e.args)
+                      for e in self.events)
+
+        events.extend({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                       "args": {"name": thread}}
+                      for (thread, tid) in threads.items())
+        return json.dumps({"traceEvents": events,
+                           "displayTimeUnit": "ms"}, **kwargs)
+
+def active():
+    """ Return True if a trace is being recorded. """
+    return _trace is not None
+
+@contextmanager
+def tracing(trace):
+    """ Record events into trace while the context is active.
+
+        :param trace: the trace to record into
+        :type trace: :class:`ExecutionTrace`
+    """
+    global _trace # pylint: disable=global-statement
+    _trace = trace
+    try:
+        yield trace
+    finally:
+        _trace = None
+        trace.duration = time.time() - trace.start
+
+@contextmanager
+def action_span(action):
+    """ Attribute events in this thread to action while the context is active.
+
+        :param action: the action being executed
+        :type action: :class:`~.deviceaction.DeviceAction`
+    """
+    trace = _trace
+    if trace is None:
+        yield None
+        return
+
+    action_trace = ActionTrace(action)
+    _current.action = action_trace
+    try:
+        yield action_trace
+    finally:
+        _current.action = None
+        action_trace.duration = time.time() - action_trace.start
+        trace._addAction(action_trace) # pylint: disable=protected-access
+
+def record(category, name, start, args=None):
+    """ Record an event that started at start and ended now.
+
+        :param str category: the kind of event, eg: :const:`PROGRAM`
+        :param str name: a description of the event
+        :param float start: the value of :func:`time.time` at the start
+        :keyword dict args: additional information about the event
+    """
+    trace = _trace
+    if trace is None:
+        return
+
+    event = TraceEvent(category, name, start, time.time() - start, args)
+    action_trace = getattr(_current, "action", None)
+    if action_trace is not None:
+        action_trace.events.append(event)
+    else:
+        trace._addEvent(event) # pylint: disable=protected-access
+
+@contextmanager
+def span(category, name, args=None):
+    """ Record an event for the duration of the context.
+
+        :param str category: the kind of event, eg: :const:`SETTLE`
+        :param str name: a description of the event
+        :keyword dict args: additional information about the event
+    """
+    if _trace is None:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(category, name, start, args)
@@ -20,71 +20,147 @@
 # Red Hat Author(s): Dave Lehman <dlehman@redhat.com>
 #
 
+from collections import deque
+
 class CyclicGraphError(Exception):
     pass
 
 def tsort(graph):
+    """ Return the items of a graph in an order satisfying all of its edges.
+
+        Arguments:
+
+            graph   -   a graph as returned by create_graph
+
+        Return Value:
+
+            A list containing the graph's items in sorted order.
+
+        This is Kahn's algorithm. Items whose incoming edges have all been
+        processed are kept on a stack, so the most recently freed item is
+        processed next. Items freed by the same item are pushed in the order
+        of the edges leading to them or, when ranks free items at the same
+        time, in the order of the graph's items.
+
+        Raises CyclicGraphError if the graph contains cycles.
+    """
     order = []  # sorted list of items
 
     if not graph or not graph['items']:
         return order
 
+    items = graph['items']
+    children = graph['children']
+    incoming = dict(graph['incoming'])
+    ranks = graph['ranks']
+
+    # for each rank, the number of unprocessed items of a higher rank
+    levels = sorted(set(r for r in ranks.values() if r is not None))
+    above = dict((level, 0) for level in levels)
+    ranked = dict((level, []) for level in levels)
+    for item in items:
+        rank = ranks[item]
+        if rank is None:
+            continue
+
+        ranked[rank].append(item)
+        for level in levels:
+            if level < rank:
+                above[level] += 1
+
+    def ready(item):
+        rank = ranks[item]
+        return incoming[item] == 0 and (rank is None or above[rank] == 0)
+
     # determine which nodes have no incoming edges
-    roots = [n for n in graph['items'] if graph['incoming'][n] == 0]
+    roots = deque(n for n in items if ready(n))
     if not roots:
         raise CyclicGraphError("no root nodes")
 
-    visited = []    # list of nodes visited, for cycle detection
+    position = None
+    visited = 0
     while roots:
         # remove a root, add it to the order
         root = roots.pop()
-        if root in visited:
-            raise CyclicGraphError("graph contains cycles")
-
-        visited.append(root)
+        visited += 1
         order.append(root)
+
         # remove each edge from the root to another node
-        for (parent, child) in [e for e in graph['edges'] if e[0] == root]:
-            graph['incoming'][child] -= 1
-            graph['edges'].remove((parent, child))
-            # if destination node is now a root, add it to roots
-            if graph['incoming'][child] == 0:
-                roots.append(child)
-
-    if len(graph['items']) != len(visited):
+        freed = []
+        for child in children[root]:
+            incoming[child] -= 1
+            if ready(child):
+                freed.append(child)
+
+        # a root's rank also acts as an edge to every item of a lower rank
+        rank = ranks[root]
+        unranked = []
+        if rank is not None:
+            for level in levels:
+                if level >= rank:
+                    break
+
+                above[level] -= 1
+                if above[level] == 0:
+                    unranked.extend(n for n in ranked[level]
+                                        if incoming[n] == 0)
+
+        if unranked:
+            if position is None:
+                position = dict((item, i) for (i, item) in enumerate(items))
+
+            freed = sorted(set(freed + unranked), key=position.get)
+
+        # if destination node is now a root, add it to roots
+        roots.extend(freed)
+
+    if len(items) != visited:
         raise CyclicGraphError("graph contains cycles")
 
-
     return order
 
-def create_graph(items, edges):
+def create_graph(items, edges, ranks=None):
     """ Create a graph based on a list of items and a list of edges.
 
         Arguments:
 
             items   -   an iterable containing (hashable) items to sort
             edges   -   an iterable containing (parent, child) edge pair tuples
+            ranks   -   an optional dict mapping items to numeric ranks
 
         Return Value:
 
             The return value is a dictionary representing the directed graph.
-            It has three keys:
+            It has the following keys:
 
                 items is the same as the input argument of the same name
                 edges is the same as the input argument of the same name
+                children is a dict of child lists hashed by item
                 incoming is a dict of incoming edge count hashed by item
+                ranks is a dict of rank (or None) hashed by item
+
+        Every item with a rank must come before all items with a lower rank.
+        This has the same effect as an edge from each item to every item of
+        lower rank, but without the cost of creating all of those edges.
+        Items without a rank are only ordered by edges.
 
     """
     graph = {'items': [],       # the items to sort
              'edges': [],       # partial order info: (parent, child) pairs
-             'incoming': {}}    # incoming edge count for each item
+             'children': {},    # children of each item, in edge order
+             'incoming': {},    # incoming edge count for each item
+             'ranks': {}}       # rank of each item
 
+    ranks = ranks or {}
     graph['items'] = items
     graph['edges'] = edges
     for item in items:
+        graph['children'][item] = []
         graph['incoming'][item] = 0
+        graph['ranks'][item] = ranks.get(item)
 
-    for (_parent, child) in edges:
+    for (parent, child) in edges:
+        graph['children'][parent].append(child)
         graph['incoming'][child] += 1
 
     return graph
@@ -24,6 +24,7 @@
 import os
 import re
 
+from . import tracing
 from . import util
 from .size import Size
 from .flags import flags
@@ -46,16 +47,141 @@ def get_device(sysfs_path):
 
     return dev
 
-def get_devices(subsystem="block"):
+class DeviceSnapshot(object):
+    """ The block devices in the udev database at one point in time.
+
+        The devices are enumerated once and indexed by name, UUID, label and
+        symlink so that looking devices up does not require scanning them all.
+        Use :func:`get_snapshot` to get an up-to-date snapshot.
+    """
+    def __init__(self, devices):
+        """
+            :param devices: udev database entries of block devices
+            :type devices: list of :class:`pyudev.Device`
+        """
+        self.devices = devices
+        self.by_name = {}
+        self.by_uuid = {}
+        self.by_label = {}
+        self.by_symlink = {}
+
+        for dev in devices:
+            self.by_name.setdefault(device_get_name(dev), dev)
+
+            uuid = device_get_uuid(dev)
+            if uuid:
+                self.by_uuid.setdefault(uuid, dev)
+
+            label = device_get_label(dev)
+            if label:
+                self.by_label.setdefault(label, dev)
+
+            # resolve_devspec has always used the last device with a symlink
+            for link in device_get_symlinks(dev):
+                self.by_symlink[link] = dev
+
+_snapshot = None
+_monitor = None
+
+def _devices_changed():
+    """ Return True if block devices may have changed since the last snapshot.
+
+        Changes are detected via events on a udev monitor and via the udev
+        event queue. If no monitor can be set up, assume that something has
+        changed.
+    """
+    global _monitor # pylint: disable=global-statement
+
+    if _monitor is None:
+        try:
+            _monitor = get_monitor()
+        except (EnvironmentError, pyudev.DeviceNotFoundError) as e:
+            log.debug("failed to set up udev monitor: %s", e)
+            return True
+
+        # events from before the monitor was set up could have been missed
+        return True
+
+    changed = False
+    try:
+        while _monitor.poll(timeout=0) is not None:
+            changed = True
+    except EnvironmentError as e:
+        log.debug("failed to read udev events: %s", e)
+        _monitor = None
+        return True
+
+    return changed or _queue_busy()
+
+def _queue_busy():
+    """ Return True if udev has events queued that it has not handled yet. """
+    return os.path.exists("/run/udev/queue")
+
+def get_snapshot(settle_first=False):
+    """ Return a snapshot of the system's block devices.
+
+        :keyword bool settle_first: wait for udev to handle its queued events
+                                    before checking for changes
+        :rtype: :class:`DeviceSnapshot`
+
+        The previous snapshot is returned unless the devices may have changed
+        since it was taken. Only then are the block devices enumerated again,
+        after udev has been settled.
+    """
+    global _snapshot # pylint: disable=global-statement
+
+    if settle_first:
+        settle()
+
+    # check for changes first so the monitor gets set up with the snapshot
+    changed = _devices_changed()
+    if _snapshot is None or changed:
+        if not settle_first:
+            settle()
+
+        _snapshot = DeviceSnapshot([d for d in global_udev.list_devices(subsystem="block")
+                                    if not __is_blacklisted_blockdev(d.sys_name)])
+
+    return _snapshot
+
+def drop_snapshot():
+    """ Make the next call to :func:`get_snapshot` enumerate devices again. """
+    global _snapshot # pylint: disable=global-statement
+    _snapshot = None
+
+def get_devices(subsystem="block", settle_first=False):
+    """ Return the devices of a subsystem.
+
+        :keyword str subsystem: the subsystem
+        :keyword bool settle_first: for block devices, wait for udev to handle
+                                    its queued events first even if no changes
+                                    have been seen (see :func:`get_snapshot`)
+        :rtype: list of :class:`pyudev.Device`
+    """
+    if subsystem == "block":
+        return get_snapshot(settle_first=settle_first).devices[:]
+
     settle()
     return [d for d in global_udev.list_devices(subsystem=subsystem)
                         if not __is_blacklisted_blockdev(d.sys_name)]
 
+def get_monitor(subsystem="block"):
+    """ Return a started monitor for udev events on a subsystem's devices.
+
+        :keyword str subsystem: the subsystem to monitor
+        :rtype: :class:`pyudev.Monitor`
+    """
+    monitor = pyudev.Monitor.from_netlink(global_udev)
+    monitor.filter_by(subsystem=subsystem)
+    monitor.start()
+    return monitor
+
 def settle():
     # wait maximal 300 seconds for udev to be done running blkid, lvm,
     # mdadm etc. This large timeout is needed when running on machines with
     # lots of disks, or with slow disks
-    util.run_program(["udevadm", "settle", "--timeout=300"])
+    with tracing.span(tracing.SETTLE, "udevadm settle"):
+        util.run_program(["udevadm", "settle", "--timeout=300"])
 
 def trigger(subsystem=None, action="add", name=None):
     argv = ["trigger", "--action=%s" % action]
@@ -74,28 +200,19 @@ def resolve_devspec(devspec):
     # import devices locally to avoid cyclic import (devices <-> udev)
     from . import devices
 
-    ret = None
-    for dev in get_devices():
-        if devspec.startswith("LABEL="):
-            if device_get_label(dev) == devspec[6:]:
-                ret = dev
-                break
-        elif devspec.startswith("UUID="):
-            if device_get_uuid(dev) == devspec[5:]:
-                ret = dev
-                break
-        elif device_get_name(dev) == devices.devicePathToName(devspec):
-            ret = dev
-            break
-        else:
+    snapshot = get_snapshot()
+    if devspec.startswith("LABEL="):
+        ret = snapshot.by_label.get(devspec[6:])
+    elif devspec.startswith("UUID="):
+        ret = snapshot.by_uuid.get(devspec[5:])
+    else:
+        ret = snapshot.by_name.get(devices.devicePathToName(devspec))
+        if ret is None:
             spec = devspec
             if not spec.startswith("/dev/"):
                 spec = os.path.normpath("/dev/" + spec)
 
-            for link in device_get_symlinks(dev):
-                if spec == link:
-                    ret = dev
-                    break
+            ret = snapshot.by_symlink.get(spec)
 
     if ret:
         return device_get_name(ret)
@@ -107,7 +224,7 @@ def resolve_glob(glob):
     if not glob:
         return ret
 
-    for dev in get_devices():
+    for dev in get_snapshot().devices:
         name = device_get_name(dev)
 
         if fnmatch.fnmatch(name, glob):
@@ -9,7 +9,9 @@ import subprocess
 import re
 import sys
 import tempfile
+import time
 import uuid
+import weakref
 import hashlib
 from decimal import Decimal
 from contextlib import contextmanager
@@ -17,15 +19,58 @@ from gi.repository import BlockDev as blockdev
 
 import six
 
+from . import tracing
+
 import logging
 log = logging.getLogger("blivet")
 program_log = logging.getLogger("program")
 
+import threading
 from threading import Lock
 # this will get set to anaconda's program_log_lock in enable_installer_mode
 program_log_lock = Lock()
 
 
+def _log_output(pipe, prefix, chunks):
+    """ Log the lines read from pipe as they arrive and collect them.
+
+        :param pipe: the pipe to read from
+        :param str prefix: a string to put in front of each logged line
+        :param list chunks: list to append the raw lines to
+
+        The log lock is only held while a line is being logged, so that other
+        threads can log and run programs while this one is still running.
+    """
+    for line in iter(pipe.readline, b""):
+        chunks.append(line)
+        if six.PY3:
+            line = line.decode("utf-8", "replace")
+
+        with program_log_lock:
+            program_log.info("%s%s", prefix, line.rstrip("\n"))
+
+    pipe.close()
+
+def _get_child_env(root, env_prune):
+    """ Return the environment for a program run by :func:`_run_program`.
+
+        :param str root: the root directory the program is run in
+        :param env_prune: names of variables to leave out
+        :type env_prune: list of str
+        :rtype: dict
+
+        The environment is built in the parent since the child may not
+        allocate memory before it runs the program if other threads are
+        running.
+    """
+    env = os.environ.copy()
+    env.update({"LC_ALL": "C",
+                "INSTALL_PATH": root})
+    for var in env_prune:
+        env.pop(var, None)
+
+    return env
+
 def _run_program(argv, root='/', stdin=None, env_prune=None, stderr_to_stdout=False, binary_output=False):
     if env_prune is None:
         env_prune = []
@@ -34,49 +79,74 @@ def _run_program(argv, root='/', stdin=None, env_prune=None, stderr_to_stdout=Fa
         if root and root != '/':
             os.chroot(root)
 
+    start = time.time()
     with program_log_lock:
         program_log.info("Running... %s", " ".join(argv))
 
-        env = os.environ.copy()
-        env.update({"LC_ALL": "C",
-                    "INSTALL_PATH": root})
-        for var in env_prune:
-            env.pop(var, None)
+    if stderr_to_stdout:
+        stderr_dir = subprocess.STDOUT
+    else:
+        stderr_dir = subprocess.PIPE
 
-        if stderr_to_stdout:
-            stderr_dir = subprocess.STDOUT
-        else:
-            stderr_dir = subprocess.PIPE
-        try:
-            proc = subprocess.Popen(argv,
-                                    stdin=stdin,
-                                    stdout=subprocess.PIPE,
-                                    stderr=stderr_dir,
-                                    close_fds=True,
-                                    preexec_fn=chroot, cwd=root, env=env)
-
-            out, err = proc.communicate()
-            if not binary_output and six.PY3:
-                out = out.decode("utf-8")
-            if out:
-                if not stderr_to_stdout:
-                    program_log.info("stdout:")
-                for line in out.splitlines():
-                    program_log.info("%s", line)
-
-            if not stderr_to_stdout and err:
-                program_log.info("stderr:")
-                for line in err.splitlines():
-                    program_log.info("%s", line)
-
-        except OSError as e:
+    try:
+        proc = subprocess.Popen(argv,
+                                stdin=stdin,
+                                stdout=subprocess.PIPE,
+                                stderr=stderr_dir,
+                                close_fds=True,
+                                preexec_fn=chroot, cwd=root,
+                                env=_get_child_env(root, env_prune))
+    except OSError as e:
+        with program_log_lock:
             program_log.error("Error running %s: %s", argv[0], e.strerror)
-            raise
+        tracing.record(tracing.PROGRAM, argv[0], start,
+                       {"argv": list(argv), "rc": None})
+        raise
+
+    out = []
+    err_reader = None
+    if not stderr_to_stdout:
+        err_reader = threading.Thread(target=_log_output,
+                                      args=(proc.stderr, "stderr: ", []))
+        err_reader.daemon = True
+        err_reader.start()
+
+    _log_output(proc.stdout, "", out)
+    if err_reader:
+        err_reader.join()
+
+    proc.wait()
+    out = b"".join(out)
+    if not binary_output and six.PY3:
+        out = out.decode("utf-8")
 
+    with program_log_lock:
         program_log.debug("Return code: %d", proc.returncode)
+    tracing.record(tracing.PROGRAM, argv[0], start,
+                   {"argv": list(argv), "rc": proc.returncode})
 
     return (proc.returncode, out)
 
+def run_program_async(argv, loop=None, **kwargs):
+    """ Run a program without blocking an asyncio event loop.
+
+        :param argv: the program and its arguments
+        :keyword loop: the event loop to use (the current loop by default)
+        :returns: a future resolving to the exit code and output
+        :rtype: :class:`asyncio.Future`
+
+        The remaining keyword arguments are the same as for
+        :func:`run_program`. The program is run in the loop's default
+        executor, eg: ``(rc, out) = await run_program_async(["mkfs.xfs", path])``.
+    """
+    import asyncio # pylint: disable=import-error
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    return loop.run_in_executor(None, functools.partial(_run_program, argv,
+                                                        **kwargs))
+
 def run_program(*args, **kwargs):
     return _run_program(*args, **kwargs)[0]
 
@@ -416,6 +486,163 @@ class ObjectID(object):
         self.id = self._newid_gen() # pylint: disable=attribute-defined-outside-init
         return self
 
+# journals recording changes to devices, formats and actions
+_journals = []
+
+class ChangeJournal(object):
+    """ A record of the state objects had before they were first changed.
+
+        While a journal is open, :func:`record_change` saves the state of
+        each object that is about to be changed, once per journal, and
+        :meth:`rollback` puts the saved states back. Objects are shared
+        rather than copied, so opening and closing a journal is cheap and
+        the cost of recording and rolling back is proportional to the number
+        of objects that actually change.
+
+        The saved state of an object is a copy of its attributes in which
+        lists, dicts and sets are copied as well, or whatever the object's
+        _journalState method returns. An object's _journalRestore method, if
+        there is one, is used to put the state back.
+
+        :class:`ObjectID` instances created after the journal was opened are
+        not recorded since they did not exist at that point.
+    """
+    def __init__(self):
+        self._states = {}
+        self._order = []
+        self._firstNewID = None
+
+    def open(self):
+        """ Start recording changes. """
+        self._firstNewID = ObjectID._newid_gen()
+        _journals.append(self)
+
+    def close(self):
+        """ Stop recording changes. """
+        if self in _journals:
+            _journals.remove(self)
+
+    def record(self, obj):
+        """ Save the state of obj unless it was saved already. """
+        key = id(obj)
+        if key in self._states:
+            return
+
+        if isinstance(obj, ObjectID) and \
+           getattr(obj, "id", self._firstNewID) >= self._firstNewID:
+            return
+
+        save = getattr(obj, "_journalState", None)
+        state = save() if save else journal_state(obj)
+        self._states[key] = (obj, state)
+        self._order.append(key)
+
+    def rollback(self):
+        """ Close the journal and restore every recorded object.
+
+            :returns: the restored objects
+            :rtype: list
+        """
+        self.close()
+        restored = []
+        for key in reversed(self._order):
+            (obj, state) = self._states[key]
+            restore = getattr(obj, "_journalRestore", None)
+            if restore:
+                restore(state)
+            else:
+                journal_restore(obj, state)
+
+            restored.append(obj)
+
+        self._states = {}
+        self._order = []
+        return restored
+
+def journal_state(obj):
+    """ Return the state of obj to save in a :class:`ChangeJournal`.
+
+        :param obj: the object about to be changed
+        :returns: a copy of obj's attributes, with lists, dicts and sets copied
+        :rtype: dict
+    """
+    state = obj.__dict__.copy()
+    for (attr, value) in state.items():
+        if type(value) in (list, dict, set):
+            state[attr] = copy.copy(value)
+
+    return state
+
+def journal_restore(obj, state):
+    """ Put back state as returned by :func:`journal_state`. """
+    obj.__dict__.clear()
+    obj.__dict__.update(state)
+
+def record_change(obj):
+    """ Tell all open change journals that obj is about to be changed.
+
+        :param obj: the object that is about to change
+
+        This only needs to be called explicitly for changes that do not set
+        an attribute of a :class:`JournaledObject` instance, like appending
+        to a list held by one.
+    """
+    for journal in _journals:
+        journal.record(obj)
+
+def journals_open():
+    """ Return True if any change journal is recording changes. """
+    return bool(_journals)
+
+class JournaledObject(object):
+    """ A class whose instances tell the open change journals about changes
+        to their attributes. See :class:`ChangeJournal`.
+    """
+    def __setattr__(self, name, value):
+        if _journals:
+            record_change(self)
+
+        object.__setattr__(self, name, value)
+
+# objects interested in changes to indexed device/format attributes, by the
+# device or format they watch
+_attribute_watchers = weakref.WeakKeyDictionary()
+
+def add_attribute_watcher(obj, watcher):
+    """ Register an object to be told about changes to obj's indexed attributes.
+
+        :param obj: the object to watch (a device or format)
+        :param watcher: an object with an attributeChanged(obj, attr) method
+
+        Both are held by weak reference, so registering a watcher keeps
+        neither of them alive. Copies of obj are not watched.
+    """
+    watchers = _attribute_watchers.get(obj)
+    if watchers is None:
+        watchers = weakref.WeakSet()
+        _attribute_watchers[obj] = watchers
+
+    watchers.add(watcher)
+
+def remove_attribute_watcher(obj, watcher):
+    """ Unregister an attribute watcher of obj. """
+    watchers = _attribute_watchers.get(obj)
+    if watchers is not None:
+        watchers.discard(watcher)
+
+def notify_attribute_changed(obj, attr):
+    """ Tell the watchers of obj that one of its attributes has changed.
+
+        :param obj: the object whose attribute changed (a device or format)
+        :param str attr: the name of the attribute that changed
+    """
+    watchers = _attribute_watchers.get(obj)
+    if not watchers:
+        return
+
+    for watcher in list(watchers):
+        watcher.attributeChanged(obj, attr)
+
 def canonicalize_UUID(a_uuid):
     """ Converts uuids to canonical form.
 
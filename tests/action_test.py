@@ -1,8 +1,21 @@
 
+import functools
+import os
+import threading
+import time
 import unittest
 
+import mock
+import parted
+
+from tests.imagebackedtestcase import ImageBackedTestCase
 from tests.storagetestcase import StorageTestCase
 import blivet
+import blivet.tsort
+from blivet.actionlist import ActionList
+from blivet.errors import StorageError
+from blivet.flags import flags
+from blivet.partitioning import doPartitioning
 from blivet.formats import getFormat
 from blivet.size import Size
 
@@ -12,6 +25,7 @@ from blivet.devices import PartitionDevice
 from blivet.devices import MDRaidArrayDevice
 from blivet.devices import LVMVolumeGroupDevice
 from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import StorageDevice
 
 # action classes
 from blivet.deviceaction import ActionCreateDevice
@@ -1146,3 +1160,266 @@ class DeviceActionTestCase(StorageTestCase):
     def testActionSorting(self, *args, **kwargs):
         """ Verify correct functioning of action sorting. """
         pass
+
+class ActionListTestCase(unittest.TestCase):
+    """ Verify scaling of ActionList pruning and sorting. """
+
+    def _scheduleStacks(self, count):
+        """ Return a list of actions for count independent device stacks. """
+        actions = []
+        for i in range(count):
+            disk = StorageDevice("disk%d" % i, size=Size("1 GiB"), exists=True,
+                                 fmt=getFormat(None, exists=True))
+            old = StorageDevice("old%d" % i, parents=[disk], exists=True,
+                                size=Size("500 MiB"),
+                                fmt=getFormat(None, exists=True))
+            new = StorageDevice("new%d" % i, parents=[disk],
+                                size=Size("500 MiB"))
+            actions.extend([ActionCreateDevice(new),
+                            ActionDestroyDevice(old),
+                            ActionDestroyFormat(old),
+                            ActionDestroyFormat(disk)])
+
+        return actions
+
+    def testSortMatchesAllPairs(self):
+        actions = self._scheduleStacks(50)
+
+        # the ordering produced by checking every pair of actions
+        edges = []
+        for (i, parent) in enumerate(actions):
+            for (j, child) in enumerate(actions):
+                if i != j and child.requires(parent):
+                    edges.append((i, j))
+        graph = blivet.tsort.create_graph(list(range(len(actions))), edges)
+        expected = [actions[i] for i in blivet.tsort.tsort(graph)]
+
+        action_list = ActionList()
+        for action in actions:
+            action_list.append(action)
+        action_list.sort()
+        self.assertEqual(list(action_list), expected)
+
+    def _processStacks(self, count, threads, execute):
+        """ Process actions for count stacks, using execute to execute them. """
+        actions = self._scheduleStacks(count)
+        action_list = ActionList()
+        action_list.processThreads = threads
+        for action in actions:
+            action.apply()
+            action.execute = functools.partial(execute, action)
+            action_list.append(action)
+
+        action_list.process(devices=[])
+
+        self.assertEqual(list(action_list), [])
+        return actions
+
+    def testConcurrentProcess(self):
+        lock = threading.Lock()
+        executed = []
+        running = []
+        concurrency = []
+        def execute(action, callbacks=None):
+            # pylint: disable=unused-argument
+            with lock:
+                running.append(action)
+                concurrency.append(len(running))
+
+            time.sleep(0.01)
+            with lock:
+                running.remove(action)
+                executed.append(action)
+
+        actions = self._processStacks(8, 4, execute)
+        self.assertEqual(len(executed), len(actions))
+        self.assertGreater(max(concurrency), 1)
+        self.assertLessEqual(max(concurrency), 4)
+
+        # the actions on each disk are still executed in dependency order
+        order = dict((action.id, idx) for (idx, action) in enumerate(executed))
+        for idx in range(0, len(actions), 4):
+            (create, destroy, destroy_fmt, destroy_disk_fmt) = actions[idx:idx + 4]
+            self.assertLess(order[destroy_fmt.id], order[destroy.id])
+            self.assertLess(order[destroy.id], order[destroy_disk_fmt.id])
+            self.assertLess(order[destroy_disk_fmt.id], order[create.id])
+
+    def testConcurrentProcessFailure(self):
+        actions = self._scheduleStacks(4)
+        action_list = ActionList()
+        action_list.processThreads = 2
+
+        # the failure is seen once the failed job's (empty) list of completed
+        # actions has been handled
+        seen = threading.Event()
+        def completeActions(done, devices):
+            ActionList._completeActions(action_list, done, devices)
+            if not done:
+                seen.set()
+
+        lock = threading.Lock()
+        attempts = []
+        def execute(action, callbacks=None):
+            # pylint: disable=unused-argument
+            with lock:
+                attempts.append(action)
+                first = len(attempts) == 1
+
+            if first:
+                raise StorageError("failed")
+
+            # keep this job running until the failure has been seen
+            seen.wait(10)
+
+        for action in actions:
+            action.apply()
+            action.execute = functools.partial(execute, action)
+            action_list.append(action)
+
+        with mock.patch.object(action_list, "_completeActions",
+                               side_effect=completeActions):
+            with self.assertRaisesRegex(StorageError, "failed"):
+                action_list.process(devices=[])
+
+        # the failed action is not retried, the job that was running when it
+        # failed is finished and no other jobs are started
+        self.assertTrue(seen.is_set())
+        self.assertEqual(len(attempts), 2)
+        self.assertNotIn(attempts[1], action_list)
+        self.assertEqual(sorted(a.id for a in action_list),
+                         sorted(a.id for a in actions if a is not attempts[1]))
+
+    def testProcessThreadsFlag(self):
+        flags.action_threads = 4
+        self.addCleanup(setattr, flags, "action_threads", 1)
+
+        action_list = ActionList()
+        self.assertEqual(action_list._threads, 4)
+        action_list.processThreads = 2
+        self.assertEqual(action_list._threads, 2)
+
+        threads = set()
+        def execute(action, callbacks=None):
+            # pylint: disable=unused-argument
+            threads.add(threading.current_thread().name)
+
+        self._processStacks(4, None, execute)
+        self.assertNotIn(threading.current_thread().name, threads)
+
+    def testSortPerformance(self):
+        actions = self._scheduleStacks(2500)
+        action_list = ActionList()
+        for action in actions:
+            action_list.append(action)
+
+        start = time.time()
+        action_list.sort()
+        self.assertLess(time.time() - start, 1.0)
+
+        order = dict((action.id, idx) for (idx, action) in enumerate(action_list))
+        self.assertEqual(len(order), 10000)
+        for idx in range(0, len(actions), 4):
+            (create, destroy, destroy_fmt, destroy_disk_fmt) = actions[idx:idx + 4]
+            self.assertLess(order[destroy_fmt.id], order[destroy.id])
+            self.assertLess(order[destroy.id], order[destroy_disk_fmt.id])
+            self.assertLess(order[destroy_disk_fmt.id], order[create.id])
+
+    def testPrunePerformance(self):
+        devices = [StorageDevice("dev%d" % i, size=Size("1 GiB"), exists=True,
+                                 fmt=getFormat(None, exists=True))
+                   for i in range(200)]
+        action_list = ActionList()
+        for _i in range(20):
+            for device in devices:
+                action_list.append(ActionDestroyFormat(device))
+
+        first = list(action_list)[:len(devices)]
+        start = time.time()
+        action_list.prune()
+        self.assertLess(time.time() - start, 1.0)
+
+        # the first destroy of each existing format obsoletes the others
+        self.assertEqual(list(action_list), first)
+
+class PartitionCommitTestCase(ImageBackedTestCase):
+    """ Verify that partition actions on a disk share partition table commits. """
+
+    disks = {"disk1": Size("2 GiB")}
+    initialize_disks = False
+    partition_count = 32
+
+    def _set_up_storage(self):
+        for name in self.disks:
+            disk = self.blivet.devicetree.getDeviceByName(name)
+            fmt = getFormat("disklabel", labelType="gpt", device=disk.path)
+            self.blivet.formatDevice(disk, fmt)
+
+    def _countCommits(self):
+        """ Run doIt and return the number of partition table writes. """
+        commits = []
+        real_commit = parted.Disk.commit
+        def commit(disk):
+            commits.append(disk.device.path)
+            return real_commit(disk)
+
+        with mock.patch.object(parted.Disk, "commit", autospec=True,
+                               side_effect=commit):
+            self.blivet.doIt()
+
+        return len(commits)
+
+    def _createPartitions(self):
+        partitions = []
+        for _i in range(self.partition_count):
+            part = self.blivet.newPartition(size=Size("16 MiB"))
+            self.blivet.createDevice(part)
+            partitions.append(part)
+
+        doPartitioning(self.blivet)
+        return partitions
+
+    def _destroyPartitions(self, partitions):
+        for part in partitions:
+            self.blivet.destroyDevice(part)
+
+    def testBatchedCommits(self):
+        partitions = self._createPartitions()
+        self.assertEqual(self._countCommits(), 1)
+        self.assertTrue(all(p.exists for p in partitions))
+        self.assertTrue(all(os.path.exists(p.path) for p in partitions))
+
+        self.blivet.reset()
+        disk = self.blivet.disks[0]
+        self.assertEqual(len(disk.format.partitions), self.partition_count)
+
+        self._destroyPartitions(self.blivet.devicetree.getChildren(disk))
+        self.assertEqual(self._countCommits(), 1)
+        self.blivet.reset()
+        self.assertEqual(len(self.blivet.disks[0].format.partitions), 0)
+
+    def testUnbatchedCommits(self):
+        flags.batch_partition_commits = False
+        self.addCleanup(setattr, flags, "batch_partition_commits", True)
+
+        self._createPartitions()
+        self.assertEqual(self._countCommits(), self.partition_count)
+
+    def testFailedBatchCommit(self):
+        self._createPartitions()
+
+        # the third partition fails after it has been added to the disklabel
+        wiped = []
+        def wipe(part):
+            wiped.append(part)
+            if len(wiped) == 3:
+                raise StorageError("failed")
+
+        with mock.patch.object(PartitionDevice, "_wipe", autospec=True,
+                               side_effect=wipe):
+            with self.assertRaisesRegex(StorageError, "failed"):
+                self.blivet.doIt()
+
+        # only the partitions that were completed are written out
+        self.assertEqual([p.exists for p in wiped], [True, True, False])
+        self.blivet.reset()
+        self.assertEqual(len(self.blivet.disks[0].format.partitions), 2)
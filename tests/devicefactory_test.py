@@ -1,9 +1,12 @@
 
 import unittest
 
+import mock
+
 import blivet
 
 from blivet import devicefactory
+from blivet import util
 from blivet.devicelibs import raid
 from blivet.devices import DiskDevice
 from blivet.errors import RaidError
@@ -57,3 +60,13 @@ class MDFactoryTestCase(unittest.TestCase):
         self.assertEqual(self.factory2.container_list, [])
 
         self.assertIsNone(self.factory2.get_container())
+
+    def testSnapshotDropped(self):
+        # the devicetree snapshot is dropped however configuration ends
+        for exc in (RaidError, KeyboardInterrupt):
+            with mock.patch.object(self.factory1, "_configure",
+                                   side_effect=exc("failed")):
+                with self.assertRaises(exc):
+                    self.factory1.configure()
+
+            self.assertFalse(util.journals_open())
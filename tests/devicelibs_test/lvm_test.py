@@ -0,0 +1,81 @@
+import unittest
+import mock
+
+import blivet.devicelibs.lvm as lvm
+from blivet.errors import LVMError
+
+LVS_OUTPUT = """\
+  LVM2_VG_NAME=vg0 LVM2_LV_NAME=pool LVM2_LV_UUID=uuid-pool LVM2_LV_SIZE=1073741824 LVM2_LV_ATTR=twi-aotz-- LVM2_SEGTYPE=thin-pool LVM2_ORIGIN= LVM2_POOL_LV=
+  LVM2_VG_NAME=vg0 LVM2_LV_NAME=thin LVM2_LV_UUID=uuid-thin LVM2_LV_SIZE=536870912 LVM2_LV_ATTR=Vwi-a-tz-- LVM2_SEGTYPE=thin LVM2_ORIGIN= LVM2_POOL_LV=pool
+  LVM2_VG_NAME=vg0 LVM2_LV_NAME=snap LVM2_LV_UUID=uuid-snap LVM2_LV_SIZE=536870912 LVM2_LV_ATTR=Vwi---tz-k LVM2_SEGTYPE=thin LVM2_ORIGIN=thin LVM2_POOL_LV=pool
+  LVM2_VG_NAME=vg0 LVM2_LV_NAME=[pool_tdata] LVM2_LV_UUID=uuid-tdata LVM2_LV_SIZE=1073741824 LVM2_LV_ATTR=Twi-ao---- LVM2_SEGTYPE=linear LVM2_ORIGIN= LVM2_POOL_LV=
+"""
+
+class LVMReportTestCase(unittest.TestCase):
+
+    @mock.patch("blivet.devicelibs.lvm.util.run_program_and_capture_output")
+    def testLVs(self, run_program):
+        run_program.return_value = (0, LVS_OUTPUT)
+        lvs = lvm.lvs()
+
+        # a single lvm call reports everything
+        self.assertEqual(run_program.call_count, 1)
+        argv = run_program.call_args[0][0]
+        self.assertEqual(argv[:2], ["lvm", "lvs"])
+        self.assertIn("vg_name,lv_name,lv_uuid,lv_size,lv_attr,segtype,origin,pool_lv", argv)
+
+        self.assertEqual([lv.lv_name for lv in lvs], ["pool", "thin", "snap", "[pool_tdata]"])
+        self.assertEqual(lvs[0].size, 1073741824)
+        self.assertEqual(lvs[0].segtype, "thin-pool")
+        self.assertEqual(lvs[1].attr, "Vwi-a-tz--")
+        self.assertEqual(lvs[1].pool_lv, "pool")
+        self.assertEqual(lvs[1].origin, "")
+        self.assertEqual(lvs[2].origin, "thin")
+        self.assertEqual(lvs[2].uuid, "uuid-snap")
+
+    @mock.patch("blivet.devicelibs.lvm.util.run_program_and_capture_output")
+    def testLVsFailure(self, run_program):
+        run_program.return_value = (5, "")
+        with self.assertRaises(LVMError):
+            lvm.lvs()
+
+@unittest.skipUnless(lvm.availability.BLOCKDEV_LVM_PLUGIN.available,
+                     "libblockdev lvm plugin not available")
+class LVMFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        lvm.lvm_cc_resetFilter()
+        self.addCleanup(lvm.lvm_cc_resetFilter)
+
+    @mock.patch("blivet.devicelibs.lvm.blockdev")
+    def testFilter(self, blockdev):
+        lvm.lvm_cc_addFilterRejectRegexp("sdb")
+        lvm.lvm_cc_addFilterRejectRegexp("sda")
+        config = blockdev.lvm.set_global_config.call_args[0][0]
+        self.assertIn('filter=["r|/(sda|sdb)$|"]', config)
+
+        # unchanged configs are not passed on again
+        calls = blockdev.lvm.set_global_config.call_count
+        lvm.lvm_cc_addFilterRejectRegexp("sda")
+        lvm.lvm_cc_removeFilterRejectRegexp("sdc")
+        self.assertEqual(blockdev.lvm.set_global_config.call_count, calls)
+
+        lvm.lvm_cc_removeFilterRejectRegexp("sda")
+        lvm.lvm_cc_removeFilterRejectRegexp("sdb")
+        config = blockdev.lvm.set_global_config.call_args[0][0]
+        self.assertNotIn("filter", config)
+
+    @mock.patch("blivet.devicelibs.lvm.blockdev")
+    def testBatch(self, blockdev):
+        with lvm.lvm_cc_batch():
+            with lvm.lvm_cc_batch():
+                for i in range(100):
+                    lvm.lvm_cc_addFilterRejectRegexp("sd%d" % i)
+
+            lvm.lvm_cc_removeFilterRejectRegexp("sd0")
+            self.assertFalse(blockdev.lvm.set_global_config.called)
+
+        self.assertEqual(blockdev.lvm.set_global_config.call_count, 1)
+        config = blockdev.lvm.set_global_config.call_args[0][0]
+        self.assertIn("r|/(sd1|sd10|", config)
+        self.assertNotIn("sd0|", config)
@@ -3,11 +3,13 @@
 import os
 import unittest
 
+import parted
+
 from blivet.devices import DiskFile
 from blivet.devices import PartitionDevice
 from blivet.formats import getFormat
 from blivet.size import Size
-from blivet.util import sparsetmpfile
+from blivet.util import sparsetmpfile, ChangeJournal
 
 class PartitionDeviceTestCase(unittest.TestCase):
 
@@ -154,3 +156,35 @@ class PartitionDeviceTestCase(unittest.TestCase):
             self.assertEqual(
                 disk.format.endAlignment.isAligned(free, max_end_sector),
                 True)
+
+    def testJournal(self):
+        with sparsetmpfile("journaltest", Size("10 MiB")) as disk_file:
+            disk = DiskFile(disk_file)
+            disk.format = getFormat("disklabel", device=disk.path)
+            sector_size = Size(disk.format.partedDevice.sectorSize)
+            start = int(Size(disk.format.alignment.grainSize))
+            end = start + int(Size("6 MiB") / sector_size) - 1
+            disk.format.addPartition(start, end)
+            partition = disk.format.partedDisk.getPartitionBySector(start)
+
+            device = PartitionDevice(os.path.basename(partition.path),
+                                     size=Size("6 MiB"))
+            device.disk = disk
+            device.exists = True
+            device.partedPartition = partition
+
+            # reading the parted objects does not record the disklabel
+            journal = ChangeJournal()
+            journal.open()
+            disk.format.partedDisk.getFreeSpaceRegions()
+            device.partedPartition.getFlag(parted.PARTITION_BOOT)
+            self.assertEqual(journal.rollback(), [])
+
+            # changing them does
+            journal = ChangeJournal()
+            journal.open()
+            device.setFlag(parted.PARTITION_BOOT)
+            self.assertTrue(device.getFlag(parted.PARTITION_BOOT))
+            self.assertEqual(journal.rollback(), [disk.format])
+            partition = disk.format.partedDisk.getPartitionBySector(start)
+            self.assertFalse(partition.getFlag(parted.PARTITION_BOOT))
@@ -1,13 +1,27 @@
+import copy
+import functools
+import threading
+import time
 import unittest
 
+import mock
+
 from tests.imagebackedtestcase import ImageBackedTestCase
 
 from blivet.size import Size
 from blivet import devicelibs
+from blivet.devicelibs import btrfs
 from blivet import devicefactory
 from blivet import util
 from blivet.udev import trigger
 from blivet.devices import LVMSnapShotDevice, LVMThinSnapShotDevice
+from blivet.devices import LVMLogicalVolumeDevice, LVMVolumeGroupDevice
+from blivet.devices import DiskDevice, StorageDevice
+from blivet.devices import BTRFSVolumeDevice, BTRFSSubVolumeDevice
+from blivet.deviceaction import ActionCreateDevice
+from blivet.devicetree import DeviceTree
+from blivet.errors import DeviceError, DeviceTreeError
+from blivet.formats import getFormat
 
 """
     TODO:
@@ -278,3 +292,627 @@ class LVMOnMDTestCase(BlivetResetTestCase):
                                   None,
                                   disks=self.blivet.disks[:],
                                   container_raid_level="raid1")
+
+class DeviceTreeLookupTestCase(unittest.TestCase):
+    """ Verify that indexed device lookups track changes to the tree. """
+
+    def setUp(self):
+        self.tree = DeviceTree()
+
+    @unittest.skipUnless(not any(x.unavailableTypeDependencies()
+                                 for x in (LVMLogicalVolumeDevice, LVMVolumeGroupDevice)),
+                         "some unsupported device classes required for this test")
+    def testLookupsFollowChanges(self):
+        tree = self.tree
+        pv = StorageDevice("pv1", fmt=getFormat("lvmpv"), size=Size("1 GiB"),
+                           uuid="pv1-uuid", sysfsPath="/sys/block/pv1")
+        tree._addDevice(pv)
+        vg = LVMVolumeGroupDevice("testvg", parents=[pv])
+        tree._addDevice(vg)
+        lv = LVMLogicalVolumeDevice("test-lv", parents=[vg],
+                                    fmt=getFormat("xfs", label="data"))
+        tree._addDevice(lv)
+
+        self.assertEqual(tree.getDeviceByName("pv1"), pv)
+        self.assertEqual(tree.getDeviceByUuid("pv1-uuid"), pv)
+        self.assertEqual(tree.getDeviceBySysfsPath("/sys/block/pv1"), pv)
+        self.assertEqual(tree.getDeviceByID(lv.id), lv)
+        self.assertEqual(tree.getDeviceByLabel("data"), lv)
+        self.assertEqual(tree.getDeviceByName("testvg-test--lv"), lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/testvg-test--lv"), lv)
+
+        # renaming a vg changes the names of its lvs
+        vg.name = "newvg"
+        self.assertIsNone(tree.getDeviceByName("testvg"))
+        self.assertIsNone(tree.getDeviceByName("testvg-test-lv"))
+        self.assertEqual(tree.getDeviceByName("newvg"), vg)
+        self.assertEqual(tree.getDeviceByName("newvg-test-lv"), lv)
+
+        pv.uuid = "other-uuid"
+        pv.sysfsPath = "/sys/block/other"
+        self.assertIsNone(tree.getDeviceByUuid("pv1-uuid"))
+        self.assertEqual(tree.getDeviceByUuid("other-uuid"), pv)
+        self.assertIsNone(tree.getDeviceBySysfsPath("/sys/block/pv1"))
+        self.assertEqual(tree.getDeviceBySysfsPath("/sys/block/other"), pv)
+
+        lv.format.label = "newlabel"
+        lv.format.uuid = "fs-uuid"
+        self.assertIsNone(tree.getDeviceByLabel("data"))
+        self.assertEqual(tree.getDeviceByLabel("newlabel"), lv)
+        self.assertEqual(tree.getDeviceByUuid("fs-uuid"), lv)
+
+        lv.format = getFormat("ext4", label="other")
+        self.assertIsNone(tree.getDeviceByLabel("newlabel"))
+        self.assertIsNone(tree.getDeviceByUuid("fs-uuid"))
+        self.assertEqual(tree.getDeviceByLabel("other"), lv)
+
+        tree._removeDevice(lv)
+        self.assertIsNone(tree.getDeviceByName("newvg-test-lv"))
+        self.assertIsNone(tree.getDeviceByID(lv.id))
+
+    @unittest.skipUnless(not any(x.unavailableTypeDependencies()
+                                 for x in (BTRFSVolumeDevice, BTRFSSubVolumeDevice)),
+                         "some unsupported device classes required for this test")
+    def testDerivedPathsFollowParents(self):
+        tree = self.tree
+        members = [StorageDevice(name, fmt=getFormat("btrfs"),
+                                 size=btrfs.MIN_MEMBER_SIZE)
+                   for name in ("sdy1", "sdz1")]
+        for member in members:
+            tree._addDevice(member)
+
+        vol = BTRFSVolumeDevice("vol", parents=[members[0]])
+        tree._addDevice(vol)
+        subvol = BTRFSSubVolumeDevice("subvol", parents=[vol])
+        tree._addDevice(subvol)
+        self.assertEqual(tree.getDeviceByPath("/dev/sdy1"), subvol)
+
+        # the paths of btrfs devices are those of the volume's first member
+        vol.parents.replace(members[0], members[1])
+        self.assertEqual(tree.getDeviceByPath("/dev/sdy1"), members[0])
+        self.assertEqual(tree.getDeviceByPath("/dev/sdz1"), subvol)
+
+    def testHiddenAndPathPreference(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True)
+        tree._addDevice(disk)
+        member = StorageDevice("sdz1", parents=[disk], size=Size("1 GiB"),
+                               exists=True)
+        tree._addDevice(member)
+
+        # a second device with the same path should be preferred since it
+        # comes later in the device list
+        alias = StorageDevice("sdz1", size=Size("1 GiB"), exists=True)
+        tree._addDevice(alias)
+        self.assertEqual(tree.getDeviceByName("sdz1"), member)
+        self.assertEqual(tree.getDeviceByPath("/dev/sdz1"), alias)
+
+        tree.hide(disk)
+        self.assertIsNone(tree.getDeviceByName("sdz"))
+        self.assertEqual(tree.getDeviceByName("sdz", hidden=True), disk)
+        self.assertEqual(tree.getDeviceByName("sdz1"), alias)
+        self.assertEqual(tree.getDeviceByName("sdz1", hidden=True), alias)
+
+        tree.unhide(disk)
+        self.assertEqual(tree.getDeviceByName("sdz"), disk)
+        self.assertEqual(tree.getDeviceByPath("/dev/sdz1"), member)
+
+    def testAttributeChanges(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True,
+                             uuid="disk-uuid",
+                             fmt=getFormat("ext4", uuid="fs-uuid", label="data"))
+        tree._addDevice(disk)
+        self.assertEqual(tree.getDeviceByName("sdz"), disk)
+        self.assertEqual(tree.getDeviceByUuid("fs-uuid"), disk)
+
+        disk.name = "sdy"
+        self.assertIsNone(tree.getDeviceByName("sdz"))
+        self.assertIsNone(tree.getDeviceByPath("/dev/sdz"))
+        self.assertEqual(tree.getDeviceByName("sdy"), disk)
+        self.assertEqual(tree.getDeviceByPath("/dev/sdy"), disk)
+
+        disk.uuid = "new-disk-uuid"
+        disk.format.uuid = "new-fs-uuid"
+        self.assertIsNone(tree.getDeviceByUuid("disk-uuid"))
+        self.assertIsNone(tree.getDeviceByUuid("fs-uuid"))
+        self.assertEqual(tree.getDeviceByUuid("new-disk-uuid"), disk)
+        self.assertEqual(tree.getDeviceByUuid("new-fs-uuid"), disk)
+
+        old_format = disk.format
+        disk.format = getFormat("xfs", uuid="xfs-uuid", label="other")
+        self.assertIsNone(tree.getDeviceByUuid("new-fs-uuid"))
+        self.assertIsNone(tree.getDeviceByLabel("data"))
+        self.assertEqual(tree.getDeviceByUuid("xfs-uuid"), disk)
+        self.assertEqual(tree.getDeviceByLabel("other"), disk)
+
+        # the old format is not on the device any more
+        old_format.uuid = "stale-uuid"
+        self.assertIsNone(tree.getDeviceByUuid("stale-uuid"))
+
+    def testWatchersPerTree(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True)
+        tree._addDevice(disk)
+        self.assertEqual(tree.getDeviceByName("sdz"), disk)
+
+        other = DeviceTree()
+        other_disk = StorageDevice("sdy", size=Size("1 GiB"), exists=True)
+        other._addDevice(other_disk)
+        self.assertEqual(other.getDeviceByName("sdy"), other_disk)
+
+        # changes are only reported to the tree holding the device
+        with mock.patch.object(tree, "attributeChanged") as changed:
+            other_disk.name = "sdx"
+            self.assertFalse(changed.called)
+            disk.name = "sdw"
+            changed.assert_called_once_with(disk, "name")
+
+        # nor to trees the device has been removed from
+        tree._removeDevice(disk)
+        with mock.patch.object(tree, "attributeChanged") as changed:
+            disk.name = "sdv"
+            self.assertFalse(changed.called)
+
+    def testCopy(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True)
+        tree._addDevice(disk)
+        self.assertEqual(tree.getDeviceByName("sdz"), disk)
+
+        new = copy.deepcopy(tree)
+        new_disk = new.getDeviceByName("sdz")
+        self.assertIsNot(new_disk, disk)
+        self.assertEqual(new_disk.id, disk.id)
+
+        new_disk.name = "sdy"
+        self.assertEqual(tree.getDeviceByName("sdz"), disk)
+        self.assertIsNone(new.getDeviceByName("sdz"))
+        self.assertEqual(new.getDeviceByName("sdy"), new_disk)
+
+    def testViewsFollowChanges(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True)
+        tree._addDevice(disk)
+        part = StorageDevice("sdz1", parents=[disk], size=Size("1 GiB"),
+                             fmt=getFormat("ext4", label="data",
+                                           uuid="fs-uuid"),
+                             exists=True)
+        tree._addDevice(part)
+
+        # views are only built once per change and callers get their own copy
+        generation = tree.generation
+        with mock.patch.object(tree, "_leaves", wraps=tree._leaves) as leaves:
+            tree.leaves.append(disk)
+            self.assertEqual(tree.leaves, [part])
+            self.assertEqual(leaves.call_count, 1)
+        self.assertEqual(tree.generation, generation)
+
+        self.assertEqual(tree.devices, [disk, part])
+        self.assertEqual(tree.uuids, {"fs-uuid": part})
+        self.assertEqual(tree.labels, {"data": part})
+        self.assertEqual(tree.filesystems, [])
+
+        part.format.mountpoint = "/data"
+        self.assertEqual(tree.filesystems, [part.format])
+        part.format.label = "other"
+        self.assertEqual(tree.labels, {"other": part})
+        part.format.uuid = "new-uuid"
+        self.assertEqual(tree.uuids, {"new-uuid": part})
+        self.assertGreater(tree.generation, generation)
+
+        # an incomplete device is left out until it becomes complete
+        incomplete = StorageDevice("md0", parents=[disk], size=Size("1 GiB"),
+                                   exists=True)
+        incomplete.complete = False
+        tree._addDevice(incomplete)
+        self.assertEqual(tree.devices, [disk, part])
+        incomplete.complete = True
+        self.assertEqual(tree.devices, [disk, part, incomplete])
+
+        tree.hide(disk)
+        self.assertEqual(tree.devices, [])
+        self.assertEqual(tree.leaves, [])
+        self.assertEqual(tree.uuids, {})
+
+        tree.unhide(disk)
+        self.assertEqual(tree.devices, [disk, incomplete, part])
+
+    def testDuplicateUuids(self):
+        tree = self.tree
+        tree._addDevice(StorageDevice("sdz", size=Size("1 GiB"), exists=True,
+                                      uuid="uuid1"))
+        other = StorageDevice("sdy", size=Size("1 GiB"), exists=True)
+        tree._addDevice(other)
+        self.assertEqual(len(tree.devices), 2)
+
+        other.uuid = "uuid1"
+        with self.assertRaises(DeviceTreeError):
+            tree.devices # pylint: disable=pointless-statement
+
+    def testChildrenAndDependents(self):
+        tree = self.tree
+        disk = StorageDevice("sdz", size=Size("1 GiB"), exists=True)
+        tree._addDevice(disk)
+        other = StorageDevice("sdy", size=Size("1 GiB"), exists=True)
+        tree._addDevice(other)
+        part = StorageDevice("sdz1", parents=[disk], size=Size("1 GiB"),
+                             exists=True)
+        tree._addDevice(part)
+        top = StorageDevice("top", parents=[part], size=Size("1 GiB"),
+                            exists=True)
+        tree._addDevice(top)
+
+        self.assertEqual(tree.getChildren(disk), [part])
+        self.assertEqual(tree.getDependentDevices(disk), [part, top])
+        self.assertEqual(tree.getDependentDevices(other), [])
+
+        # changes to parent lists are reflected
+        top.parents.append(other)
+        self.assertEqual(tree.getChildren(other), [top])
+        self.assertEqual(tree.getDependentDevices(other), [top])
+
+        top.parents.remove(part)
+        self.assertEqual(tree.getChildren(part), [])
+        self.assertEqual(tree.getDependentDevices(disk), [part])
+
+        tree.hide(part)
+        self.assertEqual(tree.getChildren(disk), [])
+        self.assertEqual(tree.getDependentDevices(disk, hidden=True), [part])
+
+class DeviceTreeActivationTestCase(unittest.TestCase):
+    """ Verify that setupAll and teardownAll follow the dependencies. """
+
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.tree.activationThreads = 4
+        self.calls = []
+        self.kwargs = []
+        self.lock = threading.Lock()
+
+        def add(name, parents=None, exists=True):
+            device = StorageDevice(name, parents=parents or [],
+                                   size=Size("1 GiB"), exists=exists)
+            for method in ("setup", "teardown"):
+                setattr(device, method, functools.partial(self._call, method, device))
+            self.tree._addDevice(device)
+            return device
+
+        self.sda = add("sda")
+        self.sdb = add("sdb")
+        self.sda1 = add("sda1", [self.sda])
+        self.sdb1 = add("sdb1", [self.sdb])
+        self.md = add("md0", [self.sda1, self.sdb1])
+        self.lv1 = add("lv1", [self.md])
+        self.lv2 = add("lv2", [self.md])
+        self.sdc = add("sdc")
+        self.new = add("new", [self.sdc], exists=False)
+
+    def _call(self, method, device, *args, **kwargs):
+        # pylint: disable=unused-argument
+        time.sleep(0.01)
+        with self.lock:
+            self.calls.append((method, device))
+            self.kwargs.append(kwargs)
+
+        if device is self.lv2:
+            raise DeviceError("failed", device.name)
+
+    def _order(self, method):
+        return [d for (m, d) in self.calls if m == method]
+
+    def testTeardownAll(self):
+        self.tree.teardownAll()
+        order = self._order("teardown")
+        self.assertEqual(len(order), len(set(order)))
+        self.assertNotIn(self.new, order)
+        self.assertEqual(set(order), set(self.tree.devices) - set([self.new]))
+        for device in order:
+            for parent in device.parents:
+                self.assertLess(order.index(device), order.index(parent))
+
+    def testTeardownProtected(self):
+        # only the protected leaf itself is left alone
+        self.lv1.protected = True
+        self.tree.teardownAll()
+        self.assertEqual(set(self._order("teardown")),
+                         set(self.tree.devices) - set([self.lv1, self.new]))
+
+    def testSetupAll(self):
+        self.tree.setupAll()
+        order = self._order("setup")
+        self.assertEqual(len(order), len(set(order)))
+        self.assertEqual(set(order), set(self.tree.devices))
+        for device in order:
+            for parent in device.parents:
+                self.assertGreater(order.index(device), order.index(parent))
+
+        # parents are not set up again by their children
+        self.assertEqual(self.kwargs, [{"recursive": False}] * len(order))
+
+    def testSetupParentFormat(self):
+        # formatting of a device its children rely on, like LUKS, is set up
+        # along with the device, but not a leaf's formatting
+        for device in (self.md, self.lv1):
+            device.format = getFormat("luks", device=device.path, exists=True)
+            device.format.setup = mock.Mock()
+
+        self.tree.setupAll()
+        self.assertEqual(self.md.format.setup.call_count, 1)
+        self.assertFalse(self.lv1.format.setup.called)
+
+    def testSerial(self):
+        self.tree.activationThreads = 1
+        self.tree.setupAll()
+        self.assertEqual(self._order("setup")[:3],
+                         [self.sda, self.sdb, self.sdc])
+
+class DeviceTreeSnapshotTestCase(unittest.TestCase):
+    """ Verify that snapshots restore the devices and actions of a tree. """
+
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disk = StorageDevice("sdz", size=Size("10 GiB"), exists=True)
+        self.tree._addDevice(self.disk)
+        self.part = StorageDevice("sdz1", parents=[self.disk],
+                                  size=Size("1 GiB"), fmt=getFormat("ext4"))
+        self.tree._addDevice(self.part)
+
+    def _makeChanges(self):
+        tree = self.tree
+        new = StorageDevice("new", parents=[self.disk], size=Size("2 GiB"))
+        tree.registerAction(ActionCreateDevice(new))
+        top = StorageDevice("top", parents=[new], size=Size("1 GiB"))
+        tree.registerAction(ActionCreateDevice(top))
+        self.part.parents.replace(self.disk, new)
+        self.part.name = "renamed"
+        self.part.size = Size("512 MiB")
+        self.part.format.mountpoint = "/data"
+        tree.names.append("new")
+        return new
+
+    def testRestoreSnapshot(self):
+        tree = self.tree
+        old_format = self.part.format
+        snapshot = tree.takeSnapshot()
+        new = self._makeChanges()
+        self.assertEqual(tree.getDeviceByName("new"), new)
+        self.assertEqual(len(tree.actions.find()), 2)
+
+        tree.restoreSnapshot(snapshot)
+        self.assertEqual(tree.devices, [self.disk, self.part])
+        self.assertEqual(tree.actions.find(), [])
+        self.assertEqual(tree.names, ["sdz", "sdz1"])
+        self.assertEqual(list(self.part.parents), [self.disk])
+        self.assertEqual(self.part.name, "sdz1")
+        self.assertEqual(self.part.size, Size("1 GiB"))
+        self.assertIs(self.part.format, old_format)
+        self.assertIsNone(self.part.format.mountpoint)
+        self.assertEqual(self.disk.kids, 1)
+        self.assertIsNone(tree.getDeviceByName("new"))
+        self.assertIsNone(tree.getDeviceByName("renamed"))
+        self.assertEqual(tree.getDeviceByName("sdz1"), self.part)
+        self.assertEqual(tree.getChildren(self.disk), [self.part])
+        self.assertEqual(self.part.ancestors, [self.disk, self.part])
+
+        # changes after the snapshot was restored are not recorded
+        self.part.name = "sdz2"
+        self.assertEqual(self.part.name, "sdz2")
+
+    def testDropSnapshot(self):
+        tree = self.tree
+        snapshot = tree.takeSnapshot()
+        new = self._makeChanges()
+        tree.dropSnapshot(snapshot)
+
+        self.assertEqual(tree.devices[:3], [self.disk, self.part, new])
+        self.assertEqual(len(tree.actions.find()), 2)
+        self.assertEqual(self.part.name, "renamed")
+        self.assertEqual(list(self.part.parents), [new])
+        self.assertFalse(util.journals_open())
+
+class DeviceTreeRefreshTestCase(unittest.TestCase):
+    """ Verify that refresh only rescans the affected devices. """
+
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disks = {}
+        self.members = {}
+        for name in ("sda", "sdb"):
+            disk = DiskDevice(name, size=Size("1 GiB"), exists=True,
+                              sysfsPath="/sys/block/%s" % name)
+            self.tree._addDevice(disk)
+            member = StorageDevice(name + "1", parents=[disk], exists=True,
+                                   size=Size("1 GiB"),
+                                   sysfsPath="/sys/block/%s/%s1" % (name, name))
+            self.tree._addDevice(member)
+            self.disks[name] = disk
+            self.members[name] = member
+
+    def _refresh(self, changed, existing=None):
+        existing = existing or []
+        with mock.patch("blivet.devicetree.udev") as devicetree_udev, \
+             mock.patch("blivet.populator.udev") as populator_udev, \
+             mock.patch("blivet.populator.os.path.exists") as exists, \
+             mock.patch.object(self.tree._populator, "addUdevDevice") as add:
+            populator_udev.get_device.side_effect = lambda path: path
+            exists.side_effect = lambda path: path in existing
+            self.tree.refresh(changed=changed)
+            self.assertTrue(devicetree_udev.settle.called)
+            return [c[0][0] for c in add.call_args_list]
+
+    def testRefreshChangedDevice(self):
+        sda = self.disks["sda"]
+        sda1 = self.members["sda"]
+        existing = [sda.sysfsPath, sda1.sysfsPath]
+        rescanned = self._refresh([sda1.sysfsPath], existing=existing)
+
+        # the disk and its contents are rescanned, sdb is left alone
+        self.assertEqual(rescanned, existing)
+        self.assertIn(sda, self.tree.devices)
+        self.assertNotIn(sda1, self.tree.devices)
+        self.assertIn(self.disks["sdb"], self.tree.devices)
+        self.assertIn(self.members["sdb"], self.tree.devices)
+
+    def testRefreshRemovedAndAddedDevices(self):
+        sdb = self.disks["sdb"]
+        existing = [self.disks["sda"].sysfsPath, "/sys/block/sdc"]
+        rescanned = self._refresh([sdb.sysfsPath, "/sys/block/sdc"],
+                                  existing=existing)
+
+        self.assertEqual(rescanned, ["/sys/block/sdc"])
+        self.assertNotIn(sdb, self.tree.devices)
+        self.assertNotIn(self.members["sdb"], self.tree.devices)
+        self.assertIn(self.members["sda"], self.tree.devices)
+
+    def testRefreshFromMonitor(self):
+        sda1 = self.members["sda"]
+        events = [mock.Mock(sys_path=sda1.sysfsPath, action="change"),
+                  mock.Mock(sys_path=sda1.sysfsPath, action="change"),
+                  None]
+        monitor = mock.Mock()
+        monitor.poll.side_effect = events
+        with mock.patch.object(self.tree, "refresh") as refresh:
+            changed = self.tree.refreshFromMonitor(monitor)
+
+        self.assertEqual(changed, [sda1.sysfsPath])
+        refresh.assert_called_once_with(changed=[sda1.sysfsPath])
+
+    def testRefreshWithPendingActions(self):
+        sda1 = self.members["sda"]
+        self.tree._actions.append(mock.Mock(device=sda1))
+        with self.assertRaises(DeviceTreeError):
+            self._refresh([sda1.sysfsPath])
+
+class PopulatorProbeTestCase(unittest.TestCase):
+    """ Verify that devices are probed concurrently and results are used. """
+
+    def setUp(self):
+        self.populator = DeviceTree()._populator
+        self.populator.probeThreads = 4
+
+    def testProbeDevices(self):
+        threads = set()
+        def probe(info):
+            threads.add(threading.current_thread().name)
+            time.sleep(0.1)
+            return {"ro": "1"}
+
+        devices = ["sda", "sdb", "sdc", "sdd"]
+        start = time.time()
+        with mock.patch("blivet.populator.udev") as udev, \
+             mock.patch("blivet.populator.util") as util, \
+             mock.patch.object(self.populator, "_probeDevice", side_effect=probe):
+            udev.device_get_sysfs_path.side_effect = lambda info: "/sys/block/" + info
+            self.populator._probeDevices(devices)
+
+            self.assertLess(time.time() - start, 0.3)
+            self.assertGreater(len(threads), 1)
+            self.assertEqual(self.populator._getReadOnly("sda"), "1")
+            self.assertFalse(util.get_sysfs_attr.called)
+
+            self.populator._dropProbes()
+            self.populator._getReadOnly("sda")
+            self.assertTrue(util.get_sysfs_attr.called)
+
+    def testProbeDevice(self):
+        # libparted and multipath are left to the handlers
+        with mock.patch("blivet.populator.udev") as udev, \
+             mock.patch("blivet.populator.util") as util, \
+             mock.patch("blivet.populator.blockdev") as blockdev, \
+             mock.patch("blivet.populator.formats") as formats, \
+             mock.patch.object(self.populator, "udevDeviceIsDisk", return_value=True):
+            util.get_sysfs_attr.return_value = "0"
+            self.assertEqual(self.populator._probeDevice("sda"), {"ro": "0"})
+            self.assertTrue(udev.device_get_format.called)
+            self.assertFalse(blockdev.mpath.is_mpath_member.called)
+            self.assertFalse(formats.getFormat.called)
+
+class PopulatorFilterTestCase(unittest.TestCase):
+    """ Verify that the disk filters are applied before devices are scanned. """
+
+    # name -> (is a disk, is a partition, names of slaves)
+    _devices = {"sda": (True, False, []),
+                "sda1": (False, True, []),
+                "sdb": (True, False, []),
+                "sdc": (True, False, []),
+                "mpatha": (True, False, ["sdb", "sdc"]),
+                "mpatha1": (False, False, ["mpatha"]),
+                "sdd": (True, False, []),
+                "sde": (True, False, []),
+                "sde1": (False, True, []),
+                "vg-lv": (False, False, ["sda1", "sdd"])}
+
+    def setUp(self):
+        self.populator = DeviceTree()._populator
+        self.populator.exclusiveDisks = ["sda", "mpatha"]
+        self.populator.ignoredDisks = ["sdd"]
+
+        # name -> format type and uuid reported by udev
+        self._formats = {}
+        self._uuids = {}
+
+    def _path(self, name):
+        if name in ("sda1", "sde1"):
+            return "/sys/block/%s/%s" % (name[:3], name)
+
+        return "/sys/block/%s" % name
+
+    def _excluded(self, early_disk_filter=True):
+        devices = sorted(self._devices.keys())
+        with mock.patch("blivet.populator.udev") as udev, \
+             mock.patch("blivet.populator.flags") as flags, \
+             mock.patch.object(self.populator, "udevDeviceIsDisk",
+                               side_effect=lambda n: self._devices[n][0]), \
+             mock.patch.object(self.populator, "_udevSlaves",
+                               side_effect=lambda n: [self._path(s) for s in self._devices[n][2]]):
+            flags.early_disk_filter = early_disk_filter
+            udev.device_get_name.side_effect = lambda n: n
+            udev.device_get_sysfs_path.side_effect = self._path
+            udev.device_is_partition.side_effect = lambda n: self._devices[n][1]
+            udev.device_is_loop.return_value = False
+            udev.device_is_biosraid_member.return_value = False
+            udev.device_get_format.side_effect = self._formats.get
+            udev.device_get_uuid.side_effect = self._uuids.get
+
+            self.populator._excludeFilteredDevices(devices)
+            return sorted(n for n in devices if self.populator._isExcluded(n))
+
+    def testExcludeFilteredDevices(self):
+        self.assertEqual(self._excluded(), ["sdd", "sde", "sde1", "vg-lv"])
+
+    def testSpanningContainers(self):
+        # vg-lv's vg has pvs on sda1, which is scanned, and sdd, which is not;
+        # sde1 is a member of an md array
+        vg = mock.Mock(vg_name="vg", vg_uuid="vg-uuid")
+        self.populator.devicetree._pvs_cache = {"/dev/sda1": vg, "/dev/sdd": vg}
+        self._formats.update(sda1="LVM2_member", sdd="LVM2_member",
+                             sde1="linux_raid_member")
+        self._uuids["sde1"] = "md-uuid"
+
+        self.assertEqual(self._excluded(), ["sdd", "sde", "sde1", "vg-lv"])
+        self.assertEqual(self.populator._excludedContainers,
+                         set(["vg-uuid", "md-uuid"]))
+
+        # the vg is not set up from the pv that is scanned
+        device = mock.Mock(path="/dev/sda1")
+        with mock.patch.object(self.populator, "getDeviceByUuid") as get:
+            self.populator.handleUdevLVMPVFormat({}, device)
+            self.assertFalse(get.called)
+
+    def testNoEarlyFilter(self):
+        self.assertEqual(self._excluded(early_disk_filter=False), [])
+
+    def testExcludedDeviceIsNotScanned(self):
+        self.populator._excluded.add("/sys/block/sde")
+        with mock.patch("blivet.populator.udev") as udev, \
+             mock.patch("blivet.populator.lvm") as lvm:
+            udev.device_get_name.return_value = "sde"
+            udev.device_get_uuid.return_value = None
+            udev.device_get_sysfs_path.return_value = "/sys/block/sde"
+            self.populator.addUdevDevice("sde")
+
+            self.assertIn("sde", self.populator.names)
+            lvm.lvm_cc_addFilterRejectRegexp.assert_called_with("sde")
+            self.assertFalse(udev.device_is_md.called)
+            self.assertIsNone(self.populator.getDeviceByName("sde"))
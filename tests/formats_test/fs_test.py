@@ -1,8 +1,13 @@
+import functools
 import os
 import tempfile
+import threading
 import unittest
 
+import mock
+
 import blivet.formats.fs as fs
+from blivet.flags import flags
 from blivet.size import Size, ROUND_DOWN
 
 from tests import loopbackedtestcase
@@ -138,3 +143,136 @@ class ResizeTmpFSTestCase(loopbackedtestcase.LoopBackedTestCase):
         except Exception: # pylint: disable=broad-except
             pass
         os.rmdir(self.mountpoint)
+
+class LazySizeInfoTestCase(unittest.TestCase):
+    """ Verify that size probes of existing filesystems are put off. """
+
+    def setUp(self):
+        flags.installer_mode = True
+        self.addCleanup(setattr, flags, "installer_mode", False)
+
+        patcher = mock.patch.object(fs.Ext4FS._resizeClass, "available", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.probed = []
+        def updateSizeInfo(fmt):
+            # pylint: disable=protected-access
+            fmt._sizeInfoPending = False
+            fmt._size = Size("1 GiB")
+            fmt._minInstanceSize = Size("100 MiB")
+            fmt._resizable = True
+            self.probed.append((fmt, threading.current_thread().name))
+
+        patcher = mock.patch.object(fs.FS, "updateSizeInfo", autospec=True,
+                                    side_effect=updateSizeInfo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # the fake devices' nodes exist unless they are listed as inactive
+        self.inactive = set()
+        exists = os.path.exists
+        def nodeExists(path):
+            if path.startswith("/dev/fake"):
+                return path not in self.inactive
+            return exists(path)
+
+        patcher = mock.patch("os.path.exists", side_effect=nodeExists)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testFirstAccess(self):
+        for attr in ("minSize", "free", "resizable", "currentSize", "size",
+                     "targetSize"):
+            an_fs = fs.Ext4FS(device="/dev/fake", exists=True)
+            self.assertEqual(self.probed, [])
+            getattr(an_fs, attr)
+            self.assertEqual([p[0] for p in self.probed], [an_fs], msg=attr)
+            self.assertEqual(an_fs.currentSize, Size("1 GiB"))
+            self.assertEqual(an_fs.targetSize, Size("1 GiB"))
+            self.assertEqual(an_fs.minSize, Size("100 MiB"))
+            self.assertEqual(len(self.probed), 1)
+            self.probed = []
+
+        # new filesystems are not probed
+        an_fs = fs.Ext4FS(device="/dev/fake")
+        self.assertEqual(an_fs.currentSize, Size(0))
+        self.assertEqual(self.probed, [])
+
+    def testEnsureSizeInfo(self):
+        filesystems = [fs.Ext4FS(device="/dev/fake%d" % i, exists=True)
+                       for i in range(8)]
+        filesystems[0].minSize # pylint: disable=pointless-statement
+        self.probed = []
+
+        fs.ensureSizeInfo(filesystems + filesystems[1:2], threads=4)
+        self.assertEqual(sorted(id(p[0]) for p in self.probed),
+                         sorted(id(f) for f in filesystems[1:]))
+        self.assertNotIn(threading.current_thread().name,
+                         [p[1] for p in self.probed])
+
+        # nothing left to probe
+        self.probed = []
+        fs.ensureSizeInfo(filesystems, threads=4)
+        self.assertEqual(self.probed, [])
+
+    def testInactiveDevice(self):
+        an_fs = fs.Ext4FS(device="/dev/fake", exists=True)
+        self.inactive.add(an_fs.device)
+
+        # the probes are left for when the device is set up
+        self.assertTrue(an_fs.sizeInfoPending)
+        self.assertFalse(an_fs.resizable)
+        self.assertEqual(an_fs.currentSize, Size(0))
+        fs.ensureSizeInfo([an_fs])
+        self.assertEqual(self.probed, [])
+
+        # a target size set in the meantime is kept
+        an_fs._targetSize = Size("512 MiB") # pylint: disable=protected-access
+
+        calls = []
+        parent = mock.Mock(status=True)
+        parent.name = "parent"
+        parent.ancestors = [parent]
+        device = mock.Mock(format=an_fs, status=False)
+        device.name = "device"
+        device.ancestors = [parent, device]
+        def setup():
+            calls.append(("setup", device.name))
+            self.inactive.discard(an_fs.device)
+        def teardown(dev):
+            calls.append(("teardown", dev.name))
+        device.setup.side_effect = setup
+        device.teardown.side_effect = lambda: teardown(device)
+        parent.teardown.side_effect = lambda: teardown(parent)
+
+        fs.ensureDeviceSizeInfo([device])
+        self.assertEqual([p[0] for p in self.probed], [an_fs])
+        self.assertFalse(an_fs.sizeInfoPending)
+        self.assertTrue(an_fs.resizable)
+        self.assertEqual(an_fs.currentSize, Size("1 GiB"))
+        self.assertEqual(an_fs.targetSize, Size("512 MiB"))
+
+        # only what was set up for the probes is torn down again
+        self.assertEqual(calls, [("setup", "device"), ("teardown", "device")])
+
+        # devices whose filesystems have been probed are not set up again
+        calls = []
+        fs.ensureDeviceSizeInfo([device])
+        self.assertEqual(calls, [])
+
+    def testTeardownOrder(self):
+        an_fs = fs.Ext4FS(device="/dev/fake", exists=True)
+        torn_down = []
+        devices = []
+        for i in range(3):
+            device = mock.Mock(status=False)
+            device.name = "dev%d" % i
+            device.ancestors = devices + [device]
+            device.teardown.side_effect = functools.partial(torn_down.append,
+                                                            device.name)
+            devices.append(device)
+
+        devices[-1].format = an_fs
+        fs.ensureDeviceSizeInfo(devices[-1:])
+        self.assertEqual(torn_down, ["dev2", "dev1", "dev0"])
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# run in a separate interpreter so that nothing is imported yet
+_IMPORT = """
+import json
+import sys
+import time
+
+start = time.time()
+%s
+elapsed = time.time() - start
+
+import blivet
+# blivet.flags is the Flags instance, not the module
+flags = sys.modules["blivet.flags"].flags
+print(json.dumps({"elapsed": elapsed,
+                  "plugins": sorted(blivet._tried_plugins),
+                  "selinux": flags._selinux is not None,
+                  "cmdline": flags._boot_cmdline is not None,
+                  "modules": [m for m in ("hawkey", "blivet.blivet")
+                              if m in sys.modules]}))
+"""
+
+class ImportTestCase(unittest.TestCase):
+    """ Track the cost of importing blivet. """
+
+    def _import(self, statement):
+        """ Import something in a new interpreter.
+
+            :param str statement: the import statement
+            :returns: the state of blivet after the import, with the time it
+                      took in seconds as "elapsed" and, where -X importtime is
+                      supported, the cumulative time in microseconds taken by
+                      each module imported as "importtime"
+            :rtype: dict
+        """
+        argv = [sys.executable]
+        if sys.version_info >= (3, 7):
+            argv.extend(["-X", "importtime"])
+        argv.extend(["-c", _IMPORT % statement])
+
+        top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen(argv, cwd=top_dir, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        (out, err) = proc.communicate()
+        self.assertEqual(proc.returncode, 0, msg=err)
+
+        result = json.loads(out.splitlines()[-1])
+        result["importtime"] = {}
+        for line in err.splitlines():
+            fields = line.split("|")
+            if line.startswith("import time:") and len(fields) == 3 and \
+               fields[1].strip().isdigit():
+                result["importtime"][fields[2].strip()] = int(fields[1])
+
+        return result
+
+    def _checkLazy(self, result):
+        msg = "import took %.3fs" % result["elapsed"]
+        self.assertEqual(result["plugins"], [], msg=msg)
+        self.assertFalse(result["selinux"], msg=msg)
+        self.assertFalse(result["cmdline"], msg=msg)
+        self.assertEqual(result["modules"], [], msg=msg)
+
+    def testImportBlivet(self):
+        result = self._import("import blivet")
+        self._checkLazy(result)
+        if result["importtime"]:
+            self.assertIn("blivet", result["importtime"])
+
+    def testImportSize(self):
+        result = self._import("from blivet.size import Size")
+        self._checkLazy(result)
+        if result["importtime"]:
+            self.assertIn("blivet.size", result["importtime"])
+
+    def testImportBlivetClass(self):
+        # the Blivet class is imported lazily, so this stays cheap
+        self._checkLazy(self._import("from blivet import Blivet"))
+
+        result = self._import("from blivet.blivet import Blivet")
+        self.assertIn("blivet.blivet", result["modules"])
+        self.assertNotIn("hawkey", result["modules"])
+        if result["importtime"]:
+            self.assertIn("blivet.blivet", result["importtime"])
@@ -2,6 +2,7 @@
 import unittest
 from blivet.devices import ParentList
 from blivet.devices import Device
+from blivet import util
 
 class ParentListTestCase(unittest.TestCase):
     def testParentList(self):
@@ -76,3 +77,70 @@ class ParentListTestCase(unittest.TestCase):
 
         dev3.parents = []
         self.assertEqual(len(dev3.parents), 0)
+
+    def testDeviceAncestors(self):
+        """ Verify that cached ancestors follow changes to parent lists. """
+        dev1 = Device("dev1")
+        dev2 = Device("dev2")
+        dev3 = Device("dev3", [dev1])
+        dev4 = Device("dev4", [dev3])
+
+        self.assertTrue(dev4.dependsOn(dev1))
+        self.assertFalse(dev4.dependsOn(dev2))
+        self.assertFalse(dev4.dependsOn(dev4))
+        self.assertEqual(set(dev4.ancestors), set([dev1, dev3, dev4]))
+
+        # changes to any ancestor's parents are reflected in descendants
+        dev3.parents.append(dev2)
+        self.assertTrue(dev4.dependsOn(dev2))
+        self.assertEqual(set(dev4.ancestors), set([dev1, dev2, dev3, dev4]))
+
+        dev3.parents.remove(dev1)
+        self.assertFalse(dev4.dependsOn(dev1))
+
+        dev3.parents.replace(dev2, dev1)
+        self.assertTrue(dev4.dependsOn(dev1))
+        self.assertFalse(dev4.dependsOn(dev2))
+
+        dev4.parents = []
+        self.assertFalse(dev4.dependsOn(dev1))
+        self.assertEqual(dev4.ancestors, [dev4])
+
+    def testAncestorCacheInvalidation(self):
+        """ Verify that only the changed device's descendants drop their cache. """
+        dev1 = Device("dev1")
+        dev2 = Device("dev2", [dev1])
+        dev3 = Device("dev3")
+        dev4 = Device("dev4", [dev3])
+        dev5 = Device("dev5", [dev2])
+        for dev in (dev2, dev4, dev5):
+            dev.ancestors # pylint: disable=pointless-statement
+
+        # pylint: disable=protected-access
+        cache = dev5._ancestorCache
+        dev4.parents.append(dev1)
+        self.assertIs(dev5._ancestorCache, cache)
+        self.assertIsNotNone(dev2._ancestorCache)
+
+        dev1.parents.append(dev3)
+        self.assertIsNone(dev2._ancestorCache)
+        self.assertIsNone(dev4._ancestorCache)
+        self.assertIsNone(dev5._ancestorCache)
+        self.assertTrue(dev5.dependsOn(dev3))
+
+    def testAncestorCacheRollback(self):
+        """ Verify that cached ancestors follow changes undone by a journal. """
+        dev1 = Device("dev1")
+        dev2 = Device("dev2")
+        dev3 = Device("dev3", [dev1])
+        dev4 = Device("dev4", [dev3])
+        self.assertTrue(dev4.dependsOn(dev1))
+
+        journal = util.ChangeJournal()
+        journal.open()
+        dev3.parents.replace(dev1, dev2)
+        self.assertTrue(dev4.dependsOn(dev2))
+        journal.rollback()
+
+        self.assertTrue(dev4.dependsOn(dev1))
+        self.assertFalse(dev4.dependsOn(dev2))
@@ -1,5 +1,7 @@
 
+import os
 import unittest
+import mock
 from mock import Mock
 
 import parted
@@ -15,6 +17,8 @@ from blivet.partitioning import LVRequest
 from blivet.partitioning import VGChunk
 from blivet.partitioning import DiskChunk
 from blivet.partitioning import PartitionRequest
+from blivet.partitioning import getDiskChunks
+from blivet.partitioning import _fillPool
 
 from blivet.devices import StorageDevice
 from blivet.devices import LVMVolumeGroupDevice
@@ -24,6 +28,7 @@ from blivet.devices import PartitionDevice
 
 from tests.imagebackedtestcase import ImageBackedTestCase
 from blivet.util import sparsetmpfile
+from blivet.util import create_sparse_tempfile
 from blivet.formats import getFormat
 from blivet.size import Size
 from blivet.flags import flags
@@ -504,6 +509,93 @@ class PartitioningTestCase(unittest.TestCase):
         self.assertEqual(req2.growth, 3956)
         self.assertEqual(req3.growth, 512)
 
+    def testFillPool(self):
+        # no limits: shares proportional to weight, leftovers to the first
+        self.assertEqual(_fillPool(100, [1, 1, 1], [None, None, None]),
+                         [34, 33, 33])
+        self.assertEqual(_fillPool(60, [1, 2], [None, None]), [20, 40])
+
+        # limits are reached in order of fill level, with the units they do
+        # not need going to the other requests
+        self.assertEqual(_fillPool(60, [10, 20], [None, 35]), [25, 35])
+        self.assertEqual(_fillPool(100, [10, 20, 30], [5, 10, None]),
+                         [5, 10, 85])
+
+        # a limit that is not reached has no effect
+        self.assertEqual(_fillPool(60, [10, 20], [None, 50]), [20, 40])
+
+        # everything limited: the pool is not exhausted
+        self.assertEqual(_fillPool(100, [1, 1], [10, 20]), [10, 20])
+
+        # leftovers skip requests that have reached their limits
+        self.assertEqual(_fillPool(5, [1, 1, 1], [1, None, None]), [1, 2, 2])
+
+        # requests without weight only get leftovers
+        self.assertEqual(_fillPool(7, [0, 2, 2], [None, None, None]),
+                         [1, 3, 3])
+        self.assertEqual(_fillPool(7, [0, 0], [0, None]), [0, 7])
+
+class GrowthEvaluationTestCase(unittest.TestCase):
+    """ Verify that allocation only re-evaluates the disks it has to. """
+
+    disk_count = 8
+    disk_size = Size("2 TiB")
+
+    def _allocate(self):
+        """ Allocate a set of growable requests on fresh sparse disks.
+
+            Returns the resulting layout and the number of times a disk
+            layout was evaluated.
+        """
+        disks = []
+        for i in range(self.disk_count):
+            path = create_sparse_tempfile("growtest%d" % i, self.disk_size)
+            self.addCleanup(os.unlink, path)
+            disk = DiskFile(path)
+            disk.format = getFormat("disklabel", device=disk.path,
+                                    labelType="gpt", exists=False)
+            disks.append(disk)
+
+        partitions = []
+        for i in range(2 * self.disk_count):
+            max_size = Size("%d GiB" % (200 * (i + 1))) if i % 3 == 0 else None
+            partitions.append(PartitionDevice("p%d" % i,
+                                              size=Size("%d GiB" % (i + 1)),
+                                              grow=True, maxsize=max_size))
+
+        storage = Mock(bootDisk=None, compareDisksKey=lambda d: d.name)
+        free = getFreeRegions(disks)
+        with mock.patch("blivet.partitioning.getDiskChunks",
+                        wraps=getDiskChunks) as get_chunks:
+            allocatePartitions(storage, disks[:], partitions, free)
+
+        layout = [(disks.index(p.disk),
+                   p.partedPartition.geometry.start,
+                   p.partedPartition.geometry.length) for p in partitions]
+        return (layout, get_chunks.call_count)
+
+    def testGrowthEvaluation(self):
+        request_count = 2 * self.disk_count
+
+        (layout, evaluations) = self._allocate()
+
+        # force a full re-evaluation of every disk for every candidate region
+        with mock.patch("blivet.partitioning._diskGrowthKey",
+                        side_effect=lambda *args: object()):
+            (full_layout, full_evaluations) = self._allocate()
+
+        self.assertEqual(layout, full_layout)
+
+        # each candidate disk is evaluated once with the request on it, while
+        # the other disks are only evaluated again after a partition has been
+        # allocated on them
+        self.assertLessEqual(evaluations,
+                             request_count * self.disk_count +
+                             request_count + self.disk_count)
+        self.assertGreaterEqual(full_evaluations,
+                                request_count * self.disk_count * (self.disk_count - 1))
+        self.assertLess(evaluations * (self.disk_count // 2), full_evaluations)
+
 class ExtendedPartitionTestCase(ImageBackedTestCase):
 
     disks = {"disk1": Size("2 GiB")}
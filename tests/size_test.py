@@ -26,8 +26,11 @@ from __future__ import division
 
 import locale
 import os
+import time
 import unittest
 
+import mock
+
 from six.moves import cPickle # pylint: disable=import-error
 
 from decimal import Decimal
@@ -448,3 +451,92 @@ class UtilityMethodsTestCase(unittest.TestCase):
         self.assertIsInstance(2/s, Decimal)
         self.assertIsInstance(2**Size(2), Decimal)
         self.assertIsInstance(1024 % Size(127), Decimal)
+
+    def testIntegerArithmetic(self):
+        s = Size("3 GiB")
+        self.assertFalse(hasattr(s, "__dict__"))
+
+        # results are exact and rounded toward zero like Decimal does
+        big = Size(10 ** 30)
+        self.assertEqual(big + 1 - big, Size(1))
+        self.assertEqual(Size(7) / 2, Size(3))
+        self.assertEqual(Size(-7) / 2, Size(-3))
+        self.assertEqual(Size(-7) // Size(2), Size(-3))
+        self.assertEqual(Size(-7) % 2, Size(-1))
+        self.assertEqual(Size(7) % Size(-2), Size(1))
+        self.assertEqual(s * Decimal("0.5"), Size("1.5 GiB"))
+        self.assertEqual(sum([s, s, Size(1)]), Size(6 * 1024 ** 3 + 1))
+        self.assertEqual(Size(-3).roundToNearest(2), Size(-4))
+        self.assertEqual(Size(-3).roundToNearest(2, rounding=size.ROUND_DOWN), Size(-2))
+
+        with self.assertRaises(ZeroDivisionError):
+            s / 0
+
+        with self.assertRaises(ValueError):
+            Size(float("nan"))
+
+    def testArithmeticPerformance(self):
+        """ Benchmark arithmetic on sizes against Decimal based sizes. """
+        class DecimalSize(Decimal):
+            """ Sizes the way they were before they kept an int. """
+            def __new__(cls, value=0):
+                value = Decimal(value).to_integral_value(rounding=size.ROUND_DOWN)
+                return Decimal.__new__(cls, value)
+
+            def __add__(self, other):
+                return DecimalSize(Decimal.__add__(self, other))
+
+            def __sub__(self, other):
+                return DecimalSize(Decimal.__sub__(self, other))
+
+            def __mul__(self, other):
+                return DecimalSize(Decimal.__mul__(self, other))
+
+            def __floordiv__(self, other):
+                return DecimalSize(Decimal.__floordiv__(self, other))
+
+            def __mod__(self, other):
+                return DecimalSize(Decimal.__mod__(self, other))
+
+        def run(cls):
+            values = [cls(i * 4096) for i in range(50000)]
+            limit = cls(1024 ** 3)
+            start = time.time()
+            total = cls(0)
+            for value in values:
+                total = (total + value * 2 - value) // 3 % limit
+
+            return (total, time.time() - start)
+
+        (total, size_time) = run(Size)
+        (decimal_total, decimal_time) = run(DecimalSize)
+        self.assertEqual(total, decimal_total)
+        self.assertLess(size_time, decimal_time)
+
+    def testCaches(self):
+        size._spec_cache.clear()
+        size._str_cache.clear()
+
+        with mock.patch("blivet.size._parseSpec", wraps=size._parseSpec) as parse:
+            self.assertEqual(Size("1 GiB"), Size("1 GiB"))
+            self.assertEqual(Size("1 GiB"), Size(1024 ** 3))
+            self.assertEqual(parse.call_count, 1)
+
+            with self.assertRaises(ValueError):
+                Size("1 GiX")
+
+        with mock.patch.object(Size, "humanReadable", autospec=True,
+                               return_value="3 MiB") as human_readable:
+            s = Size("3 MiB")
+            self.assertEqual(str(s), "3 MiB")
+            self.assertEqual(str(Size(3 * 1024 ** 2)), "3 MiB")
+            self.assertEqual(human_readable.call_count, 1)
+
+        cache = size._LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
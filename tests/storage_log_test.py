@@ -0,0 +1,79 @@
+import inspect
+import logging
+import time
+import unittest
+
+from blivet import storage_log
+from blivet.storage_log import log_method_call, log_method_return, DeferredFormat
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class StorageLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log = logging.getLogger("blivet")
+        self.level = self.log.level
+        self.handler = RecordingHandler()
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        self.log.setLevel(self.level)
+
+    def testFunctionNameAndDepth(self):
+        (name, depth) = storage_log.function_name_and_depth()
+        self.assertEqual(name, "testFunctionNameAndDepth")
+        self.assertEqual(depth, len(inspect.stack()))
+
+    def testLogMethodCall(self):
+        self.log.setLevel(logging.DEBUG)
+        log_method_call(self, "arg", name="sda", passphrase="secret")
+        log_method_return(self, 42)
+        self.assertEqual(len(self.handler.messages), 2)
+        self.assertIn("StorageLogTestCase.testLogMethodCall: arg ;",
+                      self.handler.messages[0])
+        self.assertIn("name: sda ;", self.handler.messages[0])
+        self.assertNotIn("secret", self.handler.messages[0])
+        self.assertIn("StorageLogTestCase.testLogMethodCall returned 42",
+                      self.handler.messages[1])
+
+    def testDeferredFormat(self):
+        calls = []
+        def expensive():
+            calls.append(True)
+            return "formatted"
+
+        self.log.setLevel(logging.INFO)
+        log_method_call(self, info=DeferredFormat(expensive))
+        self.assertEqual(calls, [])
+        self.assertEqual(self.handler.messages, [])
+
+        # the message is formatted once for all of the handlers
+        handler = RecordingHandler()
+        self.log.addHandler(handler)
+        self.addCleanup(self.log.removeHandler, handler)
+
+        self.log.setLevel(logging.DEBUG)
+        log_method_call(self, info=DeferredFormat(expensive))
+        self.assertEqual(calls, [True])
+        self.assertIn("info: formatted ;", self.handler.messages[0])
+        self.assertEqual(handler.messages, self.handler.messages)
+
+    def testDisabledPerformance(self):
+        self.log.setLevel(logging.INFO)
+        start = time.time()
+        for i in range(100000):
+            log_method_call(self, name="sda", idx=i)
+        self.assertLess(time.time() - start, 1.0)
+
+    def testEnabledPerformance(self):
+        self.log.setLevel(logging.DEBUG)
+        start = time.time()
+        for i in range(10000):
+            log_method_call(self, name="sda", idx=i)
+        self.assertLess(time.time() - start, 1.0)
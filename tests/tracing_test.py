@@ -0,0 +1,110 @@
+import functools
+import json
+import threading
+import unittest
+
+from blivet import tracing
+from blivet import util
+from blivet.actionlist import ActionList
+from blivet.callbacks import create_new_callbacks_register
+from blivet.deviceaction import ActionCreateDevice
+from blivet.devices import StorageDevice
+from blivet.size import Size
+
+class TracingTestCase(unittest.TestCase):
+    def _newAction(self, name):
+        disk = StorageDevice("%s-disk" % name, size=Size("1 GiB"), exists=True)
+        device = StorageDevice(name, parents=[disk], size=Size("500 MiB"))
+        return ActionCreateDevice(device)
+
+    def testInactive(self):
+        self.assertFalse(tracing.active())
+        with tracing.span(tracing.SETTLE, "settle"):
+            pass
+        tracing.record(tracing.PROGRAM, "true", 0.0)
+        with tracing.action_span(self._newAction("dev")) as action_trace:
+            self.assertIsNone(action_trace)
+
+    def testActionEvents(self):
+        action = self._newAction("dev")
+        trace = tracing.ExecutionTrace()
+        with tracing.tracing(trace):
+            self.assertTrue(tracing.active())
+            with tracing.action_span(action):
+                with tracing.span(tracing.SETUP, "dev"):
+                    util.run_program(["true"])
+                with tracing.span(tracing.SETTLE, "udevadm settle"):
+                    pass
+
+            util.run_program(["false"])
+
+        self.assertFalse(tracing.active())
+        self.assertIsNotNone(trace.duration)
+
+        self.assertEqual(len(trace.actions), 1)
+        action_trace = trace.actions[0]
+        self.assertEqual(action_trace.actionId, action.id)
+        self.assertEqual([e.category for e in action_trace.events],
+                         [tracing.PROGRAM, tracing.SETUP, tracing.SETTLE])
+        program = action_trace.events[0]
+        self.assertEqual(program.args, {"argv": ["true"], "rc": 0})
+        durations = action_trace.durations()
+        self.assertEqual(set(durations.keys()), set(tracing.CATEGORIES))
+        self.assertEqual(durations[tracing.COMMIT], 0)
+        self.assertGreaterEqual(durations[tracing.SETUP],
+                                durations[tracing.PROGRAM])
+
+        # events outside of any action are kept separately
+        self.assertEqual([e.args["rc"] for e in trace.events], [1])
+
+    def testExport(self):
+        trace = tracing.ExecutionTrace()
+        with tracing.tracing(trace):
+            for name in ("dev1", "dev2"):
+                with tracing.action_span(self._newAction(name)):
+                    with tracing.span(tracing.COMMIT, "/dev/%s" % name):
+                        pass
+
+        data = json.loads(trace.toJSON())
+        self.assertEqual([a["id"] for a in data["actions"]],
+                         [a.actionId for a in trace.actions])
+        self.assertEqual(data["actions"][0]["events"][0]["category"],
+                         tracing.COMMIT)
+
+        chrome = json.loads(trace.toChromeTrace())
+        events = [e for e in chrome["traceEvents"] if e["ph"] == "X"]
+        self.assertEqual([e["cat"] for e in events],
+                         [tracing.ACTION, tracing.COMMIT] * 2)
+        for event in events:
+            self.assertGreaterEqual(event["ts"], 0)
+            self.assertGreaterEqual(event["dur"], 0)
+
+        names = [e for e in chrome["traceEvents"] if e["ph"] == "M"]
+        self.assertEqual(len(names), 1)
+        self.assertEqual(names[0]["args"]["name"],
+                         threading.current_thread().name)
+
+    def testProcessCallback(self):
+        def execute(action, callbacks=None):
+            # pylint: disable=unused-argument
+            util.run_program(["true"])
+
+        action_list = ActionList()
+        actions = [self._newAction("dev%d" % i) for i in range(4)]
+        for action in actions:
+            action.apply()
+            action.execute = functools.partial(execute, action)
+            action_list.append(action)
+
+        traces = []
+        callbacks = create_new_callbacks_register(execution_trace=traces.append)
+        action_list.process(devices=[], callbacks=callbacks)
+
+        self.assertFalse(tracing.active())
+        self.assertEqual(len(traces), 1)
+        trace = traces[0].trace
+        self.assertEqual(sorted(a.actionId for a in trace.actions),
+                         sorted(a.id for a in actions))
+        for action_trace in trace.actions:
+            self.assertEqual(len(action_trace.events), 1)
+            self.assertEqual(action_trace.events[0].args["argv"], ["true"])
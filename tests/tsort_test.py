@@ -28,6 +28,24 @@ class TopologicalSortTestCase(unittest.TestCase):
         graph = blivet.tsort.create_graph(items, edges)
         self._tsortTest(graph)
 
+        # ranks order items like edges from each item to all lower ranks
+        items = [1, 2, 3, 4, 5, 6]
+        ranks = {1: 10, 2: 20, 3: 10, 4: None, 6: 20}
+        edges = [(1, 4), (5, 2)]
+        graph = blivet.tsort.create_graph(items, edges, ranks)
+        order = blivet.tsort.tsort(graph)
+        self.assertEqual(sorted(order), items)
+        for high in (2, 6):
+            for low in (1, 3):
+                self.assertLess(order.index(high), order.index(low))
+        self.assertLess(order.index(1), order.index(4))
+        self.assertLess(order.index(5), order.index(2))
+
+        edges = [(1, 4), (4, 6)]
+        graph = blivet.tsort.create_graph(items, edges, ranks)
+        with self.assertRaises(blivet.tsort.CyclicGraphError):
+            blivet.tsort.tsort(graph)
+
     def _tsortTest(self, graph):
         def check_order(order, graph):
             # since multiple solutions can potentially exist, just verify
@@ -34,3 +34,69 @@ class UdevTest(unittest.TestCase):
         import blivet.udev
         blivet.udev.trigger()
         self.assertTrue(blivet.udev.util.run_program.called)
+
+class FakeUdevDevice(dict):
+    def __init__(self, name, **kwargs):
+        dict.__init__(self, **kwargs)
+        self.sys_name = name
+
+class UdevSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        import blivet.udev
+        blivet.udev.drop_snapshot()
+
+        self.monitor = mock.Mock()
+        self.monitor.poll.return_value = None
+        self.devices = [FakeUdevDevice("sda", ID_FS_UUID="1234",
+                                       DEVLINKS="/dev/disk/by-id/foo"),
+                        FakeUdevDevice("sdb", ID_FS_LABEL="data",
+                                       DEVLINKS="/dev/disk/by-id/bar")]
+
+        patches = [mock.patch("blivet.udev._queue_busy", return_value=False),
+                   mock.patch("blivet.udev.log"),
+                   mock.patch("blivet.udev.util"),
+                   mock.patch("blivet.udev._monitor", None),
+                   mock.patch("blivet.udev.get_monitor",
+                              return_value=self.monitor),
+                   mock.patch.object(blivet.udev.global_udev, "list_devices",
+                                     return_value=self.devices)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        import blivet.udev
+        blivet.udev.drop_snapshot()
+
+    def test_udev_snapshot(self):
+        import blivet.udev
+        self.assertEqual(blivet.udev.get_devices(), self.devices)
+        self.assertEqual(blivet.udev.util.run_program.call_count, 1)
+
+        # nothing changed, so there is no need to settle or enumerate again
+        self.assertEqual(blivet.udev.resolve_devspec("UUID=1234"), "sda")
+        self.assertEqual(blivet.udev.resolve_devspec("LABEL=data"), "sdb")
+        self.assertEqual(blivet.udev.resolve_devspec("/dev/sdb"), "sdb")
+        self.assertEqual(blivet.udev.resolve_devspec("disk/by-id/foo"), "sda")
+        self.assertIsNone(blivet.udev.resolve_devspec("sdc"))
+        self.assertEqual(blivet.udev.resolve_glob("sd*"), ["sda", "sdb"])
+        self.assertEqual(blivet.udev.util.run_program.call_count, 1)
+
+        # a udev event means something changed
+        self.monitor.poll.side_effect = [mock.Mock(), None]
+        self.devices.append(FakeUdevDevice("sdc", DEVNAME="/dev/sdc"))
+        self.assertEqual(blivet.udev.resolve_devspec("sdc"), "sdc")
+        self.assertEqual(blivet.udev.util.run_program.call_count, 2)
+
+    def test_udev_snapshot_settle_first(self):
+        import blivet.udev
+        self.assertEqual(blivet.udev.get_devices(settle_first=True), self.devices)
+        self.assertEqual(blivet.udev.util.run_program.call_count, 1)
+        self.assertEqual(blivet.udev.global_udev.list_devices.call_count, 1)
+
+        # udev is settled again, but nothing changed so the devices are not
+        # enumerated again
+        self.assertEqual(blivet.udev.get_devices(settle_first=True), self.devices)
+        self.assertEqual(blivet.udev.util.run_program.call_count, 2)
+        self.assertEqual(blivet.udev.global_udev.list_devices.call_count, 1)
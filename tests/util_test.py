@@ -1,7 +1,13 @@
 
+import os
+import threading
+import time
 import unittest
 from decimal import Decimal
 
+import mock
+import six
+
 from blivet import util
 
 class MiscTest(unittest.TestCase):
@@ -21,3 +27,73 @@ class MiscTest(unittest.TestCase):
             self.assertTrue(util.power_of_two(2 ** i), msg=i)
             self.assertFalse(util.power_of_two(2 ** i + 1), msg=i)
             self.assertFalse(util.power_of_two(2 ** i - 1), msg=i)
+
+class RunProgramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = []
+        self.locked = []
+        def info(fmt, *args):
+            self.messages.append(fmt % args)
+            self.locked.append(util.program_log_lock.locked())
+
+        patcher = mock.patch.object(util.program_log, "info", side_effect=info)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_output(self):
+        (rc, out) = util.run_program_and_capture_output(
+            ["sh", "-c", "echo out1; echo err >&2; echo out2; exit 3"])
+        self.assertEqual(rc, 3)
+        self.assertEqual(out, "out1\nout2\n")
+        self.assertIn("out1", self.messages)
+        self.assertIn("out2", self.messages)
+        self.assertIn("stderr: err", self.messages)
+        self.assertLess(self.messages.index("out1"), self.messages.index("out2"))
+
+        # the log lock is only held while logging
+        self.assertTrue(all(self.locked))
+        self.assertFalse(util.program_log_lock.locked())
+
+        out = util.capture_output(["sh", "-c", "echo out; echo err >&2"],
+                                  stderr_to_stdout=True)
+        self.assertEqual(sorted(out.splitlines()), ["err", "out"])
+
+    def test_lock_not_held(self):
+        # another thread can log while a program is running
+        started = threading.Event()
+        def run():
+            started.set()
+            util.run_program(["sleep", "0.5"])
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        started.wait()
+        time.sleep(0.1)
+        self.assertTrue(util.program_log_lock.acquire(False))
+        util.program_log_lock.release()
+        thread.join()
+
+    def test_environment(self):
+        os.environ["BLIVET_TEST_VAR"] = "1"
+        self.addCleanup(os.environ.pop, "BLIVET_TEST_VAR", None)
+        lc_all = os.environ.get("LC_ALL")
+
+        out = util.capture_output(["sh", "-c", "echo $LC_ALL:$BLIVET_TEST_VAR"])
+        self.assertEqual(out, "C:1\n")
+        out = util.capture_output(["sh", "-c", "echo $LC_ALL:$BLIVET_TEST_VAR"],
+                                  env_prune=["BLIVET_TEST_VAR"])
+        self.assertEqual(out, "C:\n")
+
+        # the environment of this process is left alone
+        self.assertEqual(os.environ.get("LC_ALL"), lc_all)
+        self.assertEqual(os.environ["BLIVET_TEST_VAR"], "1")
+
+    @unittest.skipUnless(six.PY3, "asyncio requires python3")
+    def test_async(self):
+        import asyncio # pylint: disable=import-error
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        future = util.run_program_async(["echo", "async"], loop=loop)
+        self.assertEqual(loop.run_until_complete(future), (0, "async\n"))